@@ -6,6 +6,33 @@
 Input: JSON array of { text, chapterNumber, verseNumber }
 Output: JSONL lines like {"chapter":2, "start":47, "end":49, "text":"..."}
 
+Units are generated lazily, chapter by chapter, and streamed through a
+buffered writer, so memory holds one corpus's verses plus a single window no
+matter how many span lengths are requested. Several inputs (translations,
+commentaries) can be given with repeated -i; they are processed one after
+another in the order given, and each unit then carries a "source" field (the
+input's file stem). 01_generate_candidates.py keys candidates by (chapter,
+start, end), so it takes one source per run (--source) into its own output.
+
+--format arena writes the compact binary units file instead (units_store.py):
+each verse's text is stored once and units are int32 (chapter, start, end)
+verse indices, so the file no longer grows with the sum of the span lengths.
+01_generate_candidates.py reads either format.
+
+--token-budget MIN:MAX picks windows by E5 token count instead of verse count
+(token_budget.py): from each start verse the longest window that fits MAX
+tokens, skipping windows contained in the previous one or under MIN (unless
+that would leave a verse in no unit). Units then carry "tokens" (and
+"over_budget" for a single verse longer than MAX, "under_budget" for a window
+under MIN kept for coverage);
+--count-tokens adds "tokens" to fixed-length spans as well.
+
+--incremental diffs the verse file against per-verse fingerprints saved by the
+previous build (<output>.fingerprints.json) and writes a manifest of only the
+added, changed and removed unit keys (<output>.manifest.json, see
+unit_manifest.py) for 01_generate_candidates.py --manifest. When nothing
+changed the output is left untouched.
+
 Defaults are set for this repository layout, but all parameters are configurable via CLI.
 """
 
@@ -13,7 +40,23 @@ import argparse
 import json
 from collections import defaultdict
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from unit_manifest import (
+    default_fingerprint_path,
+    default_manifest_path,
+    diff_windows,
+    load_fingerprints,
+    verse_fingerprints,
+    window_fingerprints,
+    write_fingerprints,
+    write_manifest,
+)
+from token_budget import DEFAULT_TOKENIZER, TokenCounter, budget_windows, parse_budget
+from units_store import write_units_store
+
+
+WRITE_BUFFER_BYTES = 1 << 20
 
 
 def resolve_repo_root() -> Path:
@@ -42,32 +85,95 @@ def load_verses(path: Path) -> Dict[int, List[Tuple[int, str]]]:
     return chapters
 
 
-def build_units(
-    chapters: Dict[int, List[Tuple[int, str]]], span_lengths: List[int]
-) -> List[Dict[str, object]]:
-    units: List[Dict[str, object]] = []
+def iter_units(
+    chapters: Dict[int, List[Tuple[int, str]]],
+    span_lengths: List[int],
+    source: Optional[str] = None,
+    counter: Optional[TokenCounter] = None,
+) -> Iterator[Dict[str, object]]:
+    """Yield units chapter by chapter; a window's text is joined only when it is yielded.
+
+    With a token counter each unit also records its E5 token count ("tokens").
+    """
+    lengths = sorted({l for l in span_lengths if l > 0})
+    overhead = counter.passage_overhead() if counter is not None else 0
     # Deterministic iteration: chapters ascending
     for chapter, verses in sorted(chapters.items(), key=lambda kv: kv[0]):
         num_verses = len(verses)
+        counts = counter.count([t for _v, t in verses]) if counter is not None else []
         # For each requested span length
-        for span_len in sorted({l for l in span_lengths if l > 0}):
+        for span_len in lengths:
             # Sliding window over verses
             for start_idx in range(0, max(0, num_verses - span_len + 1)):
-                start_verse = verses[start_idx][0]
-                end_verse = verses[start_idx + span_len - 1][0]
-                text = "\n".join(v_text for (_v_num, v_text) in verses[start_idx:start_idx + span_len])
-                units.append({
+                unit: Dict[str, object] = {
                     "chapter": chapter,
-                    "start": start_verse,
-                    "end": end_verse,
-                    "text": text,
-                })
-    return units
+                    "start": verses[start_idx][0],
+                    "end": verses[start_idx + span_len - 1][0],
+                    "text": "\n".join(v_text for (_v_num, v_text) in verses[start_idx:start_idx + span_len]),
+                }
+                if counter is not None:
+                    unit["tokens"] = overhead + sum(counts[start_idx:start_idx + span_len])
+                if source is not None:
+                    unit["source"] = source
+                yield unit
+
+
+def iter_token_units(
+    chapters: Dict[int, List[Tuple[int, str]]],
+    counter: TokenCounter,
+    min_tokens: int,
+    max_tokens: int,
+    source: Optional[str] = None,
+) -> Iterator[Dict[str, object]]:
+    """Windows grown verse by verse up to max_tokens E5 tokens (see token_budget.budget_windows)."""
+    overhead = counter.passage_overhead()
+    for chapter, verses in sorted(chapters.items(), key=lambda kv: kv[0]):
+        counts = counter.count([t for _v, t in verses])
+        for start_idx, end_idx, tokens in budget_windows(counts, overhead, min_tokens, max_tokens):
+            unit: Dict[str, object] = {
+                "chapter": chapter,
+                "start": verses[start_idx][0],
+                "end": verses[end_idx][0],
+                "text": "\n".join(v_text for (_v_num, v_text) in verses[start_idx:end_idx + 1]),
+                "tokens": tokens,
+            }
+            if tokens > max_tokens:
+                unit["over_budget"] = True
+            elif tokens < min_tokens:
+                unit["under_budget"] = True
+            if source is not None:
+                unit["source"] = source
+            yield unit
+
+
+def build_units(
+    chapters: Dict[int, List[Tuple[int, str]]], span_lengths: List[int]
+) -> List[Dict[str, object]]:
+    """All units as a list (small inputs / callers that need random access)."""
+    return list(iter_units(chapters, span_lengths))
 
 
-def write_jsonl(units: List[Dict[str, object]], output_path: Path) -> int:
+def iter_corpus_units(
+    input_paths: List[Path],
+    span_lengths: List[int],
+    counter: Optional[TokenCounter] = None,
+    budget: Optional[Tuple[int, int]] = None,
+) -> Iterator[Dict[str, object]]:
+    """Units of each input in turn; only one corpus's verses are loaded at a time."""
+    tagged = len(input_paths) > 1
+    for path in input_paths:
+        chapters = load_verses(path)
+        source = path.stem if tagged else None
+        if budget is not None and counter is not None:
+            yield from iter_token_units(chapters, counter, budget[0], budget[1], source)
+        else:
+            yield from iter_units(chapters, span_lengths, source, counter)
+        del chapters
+
+
+def write_jsonl(units: Iterable[Dict[str, object]], output_path: Path) -> int:
     count = 0
-    with output_path.open("w", encoding="utf-8") as f:
+    with output_path.open("w", encoding="utf-8", buffering=WRITE_BUFFER_BYTES) as f:
         for unit in units:
             f.write(json.dumps(unit, ensure_ascii=False) + "\n")
             count += 1
@@ -86,8 +192,9 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "-i",
         "--input",
-        default=str(default_input),
-        help="Path to verses JSON array (default: repository verses-formatted.json)",
+        action="append",
+        default=None,
+        help="Path to verses JSON array; repeat for several corpora (default: repository verses-formatted.json)",
     )
     parser.add_argument(
         "-o",
@@ -108,14 +215,39 @@ def parse_args() -> argparse.Namespace:
         default="1,4,8",
         help="Comma-separated span lengths to generate (default: 1,4,8)",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--format",
+        choices=["jsonl", "arena"],
+        default="jsonl",
+        help="jsonl (one unit per line, text inlined) or arena (compact binary, see units_store.py)",
+    )
+    parser.add_argument(
+        "--token-budget",
+        default=None,
+        help="MIN:MAX E5 tokens per window (e.g. 32:128 for the 128-token Core ML model); replaces --span-lengths",
+    )
+    parser.add_argument(
+        "--count-tokens",
+        action="store_true",
+        help="Record each unit's E5 token count (implied by --token-budget)",
+    )
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER, help="Tokenizer for token counts")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Diff against the previous build's verse fingerprints and write a change manifest",
+    )
+    parser.add_argument("--manifest", default=None, help="Manifest path (default: <output>.manifest.json)")
+    args = parser.parse_args()
+    args.input = args.input or [str(default_input)]
+    return args
 
 
 def main() -> None:
     args = parse_args()
     repo_root = resolve_repo_root()
 
-    input_path = resolve_path(repo_root, args.input)
+    input_paths = [resolve_path(repo_root, p) for p in args.input]
     output_path = resolve_path(repo_root, args.output)
 
     # Determine span lengths
@@ -129,14 +261,55 @@ def main() -> None:
             raise SystemExit("--max-range-len must be a positive integer")
         span_lengths = list(range(1, args.max_range_len + 1))
 
-    chapters = load_verses(input_path)
-    units = build_units(chapters, span_lengths)
-
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    total = write_jsonl(units, output_path)
+    budget = parse_budget(args.token_budget) if args.token_budget else None
+    if budget is not None or args.count_tokens:
+        if args.format == "arena" or args.incremental:
+            raise SystemExit("--token-budget/--count-tokens write units.jsonl; drop --format arena/--incremental")
+        counter = TokenCounter(args.tokenizer)
+        total = write_jsonl(iter_corpus_units(input_paths, span_lengths, counter, budget), output_path)
+        counter.save()
+        print(f"✅ Wrote {total} units to {output_path} ({counter.tokenized} new texts tokenized)")
+        return
+    if args.incremental:
+        if len(input_paths) > 1:
+            raise SystemExit("--incremental takes a single -i input; build one output per corpus")
+        build_incremental(args, input_paths[0], output_path, span_lengths)
+        return
+    if args.format == "arena":
+        if len(input_paths) > 1:
+            raise SystemExit("--format arena takes a single -i input; write one file per corpus")
+        total = write_units_store(output_path, load_verses(input_paths[0]), span_lengths)
+    else:
+        total = write_jsonl(iter_corpus_units(input_paths, span_lengths), output_path)
     print(f"✅ Wrote {total} units to {output_path}")
 
 
+def build_incremental(args: argparse.Namespace, input_path: Path, output_path: Path, span_lengths: List[int]) -> None:
+    chapters = load_verses(input_path)
+    fingerprint_path = default_fingerprint_path(output_path)
+    manifest_path = resolve_path(resolve_repo_root(), args.manifest) if args.manifest else default_manifest_path(output_path)
+    new_verses = verse_fingerprints(chapters)
+    previous = load_fingerprints(fingerprint_path)
+    old_windows = window_fingerprints(previous[1], previous[0]) if previous else {}
+    added, changed, removed = diff_windows(old_windows, window_fingerprints(new_verses, span_lengths))
+    if previous is None:
+        print(f"No fingerprints at {fingerprint_path}; every unit is new")
+
+    if output_path.exists() and not (added or changed or removed):
+        print(f"✅ No unit changes; {output_path} left as is")
+    elif args.format == "arena":
+        total = write_units_store(output_path, chapters, span_lengths)
+        print(f"✅ Wrote {total} units to {output_path}")
+    else:
+        total = write_jsonl(iter_units(chapters, span_lengths), output_path)
+        print(f"✅ Wrote {total} units to {output_path}")
+    write_manifest(manifest_path, output_path, added, changed, removed)
+    # Fingerprints last: a crash before this point re-diffs against the old build
+    write_fingerprints(fingerprint_path, span_lengths, new_verses)
+    print(f"✅ Wrote manifest to {manifest_path} | added={len(added)}, changed={len(changed)}, removed={len(removed)}")
+
+
 if __name__ == "__main__":
     main()
 
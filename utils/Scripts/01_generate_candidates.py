@@ -3,7 +3,8 @@
 """
 01_generate_candidates.py
 -------------------------
-Read units.jsonl (verse ranges), call GPT-4o-mini to generate candidate lessons,
+Read units.jsonl or a units arena file from 00_build_units.py --format arena
+(verse ranges), call GPT-4o-mini to generate candidate lessons,
 and write to candidates.jsonl. Uses caching so we never re-call for the same unit.
 
 Each candidate has:
@@ -14,6 +15,73 @@ Each candidate has:
 If NONE → skipped.
 
 Supports a --mock mode to generate deterministic fake lessons for testing without API calls.
+
+With --concurrency N (N > 1) requests run on asyncio with at most N in flight,
+optionally throttled by token buckets (--rpm requests/min, --tpm tokens/min).
+Results are still appended to candidates.jsonl in unit order. --base-url points
+the OpenAI client at any compatible endpoint, e.g. mock_openai_server.py for
+offline load tests of the retry, rate-limit and batch paths.
+
+Raw responses are cached in SQLite (response_cache.py) keyed by the hash of
+model, temperature, max_tokens and the full prompt, so repeated passages and
+re-runs never pay twice. Each row records that key as "prompt_key"; rows whose
+key no longer matches the current prompt/model/temperature are regenerated and
+the superseded rows dropped from the output.
+
+Rows live in an indexed SQLite candidate store (candidate_store.py, default
+<out>.store.sqlite) so startup does not re-parse the output; writes are
+group-committed (--commit-rows/--commit-ms) and each committed group is
+appended to candidates.jsonl, which stays byte-identical to the old format.
+
+--batch sends every uncached prompt through the OpenAI Batch API instead
+(cheaper, no rate limits): it writes a batch JSONL, uploads and submits it,
+polls until it finishes, stores the answers in the response cache and then
+ingests them through the same filters and candidate store. The uploaded input
+file id is saved to a state file before the batch is created, and the batch id
+right after, so a re-run after a crash resumes polling (or finds the batch
+created from that input file) instead of resubmitting.
+
+--pack K sends K units per request: the few-shot preamble is paid once and the
+model answers with a JSON array of {unit_key, lesson|NONE}. Items missing or
+malformed in the reply fall back to single-unit requests. Per-unit token cost
+(the pack's usage split evenly, plus any fallback call) goes to
+<out>.pack_costs.jsonl.
+
+--span-schedule skip|defer runs spans tier by tier (1-verse, then 4, then 8)
+and prunes a long span when all its single verses answered NONE, or when the
+lessons of the shorter spans inside it already fall in one cluster (see
+span_schedule.py). Pruned spans are logged to <out>.schedule.jsonl.
+
+--backend local runs an in-process transformers model on CPU (local_llm.py)
+instead of the API: --local-batch-size prompts per forward pass, greedy,
+capped at max_tokens and cut at the first sentence. Rows are keyed to
+"local:<model>" so they never pass for API output. Every run ends with a
+throughput line (units/s, tokens/s) for comparing backends.
+
+--stream reads single-unit answers as they arrive and closes the stream once
+the first sentence ends (or the answer is exactly NONE), saving latency and
+completion tokens; per-unit latency to the first sentence goes to
+<out>.latency.jsonl. Answers cut short this way are not put in the response
+cache, so a later non-streamed run never reuses a truncated reply.
+
+Every request, retry and response-cache hit is appended to the shared token
+ledger (llm_ledger.py, --ledger/--no-ledger) with its tokens, latency and
+static-prefix size; `llm_ledger.py summary` reports per-stage cost, latency
+percentiles, retry and cache-hit rates, and the prefix-caching saving.
+
+--shard-dir DIR lets several workers (processes or machines sharing DIR) split
+the selected units into contiguous --shard-size shards claimed through lease
+files (shard_lease.py); each writes DIR/shards/shard-NNNNN.jsonl, and a dead
+worker's shard is reclaimed once its lease expires. --merge-shards DIR then
+folds all shards into --out-file, deduplicated by unit key.
+
+--manifest takes the change manifest of 00_build_units.py --incremental: only
+its added and changed units are processed (changed ones are regenerated even
+if a row exists) and rows of removed units are deleted from the store.
+
+Candidates are keyed by (chapter, start, end), so one output holds one corpus.
+A units file built from several -i inputs (units carry "source") is rejected
+unless --source picks one of them; write each source to its own --out-file.
 """
 
 # ============================================================
@@ -26,7 +94,8 @@ CONFIG = {
     "model_name": "gpt-4o-mini",          # OpenAI model
     "temperature": 0.2,                    # Lower = more deterministic
     "min_words": 3,                        # Sentence length limits
-    "max_words": 14
+    "max_words": 14,
+    "max_tokens": 40,                      # Completion budget per unit
 }
 
 # ============================================================
@@ -34,6 +103,7 @@ CONFIG = {
 # ============================================================
 
 import argparse
+import asyncio
 import json
 import os
 import re
@@ -41,10 +111,29 @@ import sys
 import uuid
 import hashlib
 import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Iterable, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Optional
+
+from candidate_store import DEFAULT_COMMIT_MS, DEFAULT_COMMIT_ROWS, CandidateStore, default_store_path
+from llm_ledger import DEFAULT_LEDGER_PATH, Ledger, static_prefix
+from local_llm import DEFAULT_LOCAL_MODEL, LocalChatModel
+from response_cache import DEFAULT_CACHE_PATH, ResponseCache, response_key
+from shard_lease import Lease, LeasedStore, ShardPlan, default_worker_id, iter_claims, merge_shards
+from span_schedule import (
+    PRUNE_RULES,
+    SCHEDULE_MODES,
+    Outcome,
+    SpanScheduler,
+    load_cluster_map,
+    parse_rules,
+    span_tiers,
+)
+from unit_manifest import load_manifest
+from units_store import UnitsStore, is_units_store
 
 CLIENT = None  # OpenAI client singleton (initialized on first non-mock call)
+ASYNC_CLIENT = None  # AsyncOpenAI client singleton (--concurrency > 1)
 
 
 def resolve_repo_root() -> Path:
@@ -77,38 +166,226 @@ def is_one_sentence_short(s: str, min_words: int, max_words: int) -> bool:
     return min_words <= wc <= max_words
 
 
+LESSON_EXAMPLES = (
+    "Examples of valid lessons:\n"
+    "• Act for duty, not reward.\n"
+    "• Keep a steady flame of awareness.\n"
+    "• See the same Self in all beings.\n"
+    "• Restrain the senses; let reason guide.\n"
+    "• Embrace impermanence; remain steady in joy and sorrow.\n"
+    "• Cultivate compassion to free yourself from attachment.\n"
+    "• Practice moderation for inner peace.\n"
+    "• Attachment fades through self-knowledge.\n"
+)
+
+# Content rules shared by the single-unit and packed prompts
+LESSON_CONTENT_RULES = [
+    "• Write in plain, universal language. Do not use names, dialogue, or scripture references.",
+    "• Do NOT output purely descriptive or metaphysical claims (e.g., 'The soul is eternal').",
+    "• The lesson must be practical, timeless, and universally applicable.",
+    "• Avoid situational statements tied to characters.",
+    "• Express the lesson in positive, guiding language (e.g., “Act with clarity” not “Killing leads to sin”).",
+    "• Do not describe events or doctrines; only output a universal practice or principle.",
+    "• Express only ONE idea — do not join ideas with 'and', 'or', 'but', or ';'. ",
+]
+
+
 def make_prompt(unit_text: str, min_words: int, max_words: int) -> str:
+    rules = (
+        [
+            f"• Output exactly one sentence ({min_words}-{max_words} words).",
+            "• If no clear lesson is present, output exactly: NONE",
+        ]
+        + LESSON_CONTENT_RULES
+        + [
+            "• Output only the lesson sentence or NONE — nothing else.",
+            "• Favor simplicity and clarity over completeness — capture the core lesson, not every dimension.",
+            "• Do not include quotes, references, or extra text.",
+        ]
+    )
     return (
         "The passage is from the Bhagavad Gita.\n"
-        "Examples of valid lessons:\n"
-        "• Act for duty, not reward.\n"
-        "• Keep a steady flame of awareness.\n"
-        "• See the same Self in all beings.\n"
-        "• Restrain the senses; let reason guide.\n"
-        "• Embrace impermanence; remain steady in joy and sorrow.\n"
-        "• Cultivate compassion to free yourself from attachment.\n"
-        "• Practice moderation for inner peace.\n"
-        "• Attachment fades through self-knowledge.\n\n"
+        + LESSON_EXAMPLES
+        + "\n"
         "Extract exactly ONE short lesson from the passage below.\n"
         "Rules:\n"
-        f"• Output exactly one sentence ({min_words}-{max_words} words).\n"
-        "• If no clear lesson is present, output exactly: NONE\n"
-        "• Write in plain, universal language. Do not use names, dialogue, or scripture references.\n"
-        "• Do NOT output purely descriptive or metaphysical claims (e.g., 'The soul is eternal').\n"
-        "• The lesson must be practical, timeless, and universally applicable.\n"
-        "• Avoid situational statements tied to characters.\n"
-        "• Express the lesson in positive, guiding language (e.g., “Act with clarity” not “Killing leads to sin”).\n"
-        "• Do not describe events or doctrines; only output a universal practice or principle.\n"
-        "• Express only ONE idea — do not join ideas with 'and', 'or', 'but', or ';'. \n"
-        "• Output only the lesson sentence or NONE — nothing else.\n"
-        "• Favor simplicity and clarity over completeness — capture the core lesson, not every dimension.\n"
-        "• Do not include quotes, references, or extra text.\n\n"
+        + "".join(r + "\n" for r in rules)
+        + "\n"
         f"Passage:\n{unit_text}\n\n"
         "Answer with ONE sentence or NONE."
     )
 
 
-def call_openai(prompt: str, cfg: dict) -> str:
+def unit_label(key: Tuple[int, int, int]) -> str:
+    return f"{key[0]}:{key[1]}-{key[2]}"
+
+
+def make_pack_prompt(items: List[Tuple[Tuple[int, int, int], str]], min_words: int, max_words: int) -> str:
+    """One prompt for several units; same examples and content rules as make_prompt."""
+    rules = (
+        [
+            f"• Each lesson is exactly one sentence ({min_words}-{max_words} words).",
+            "• If a passage has no clear lesson, its lesson is exactly: NONE",
+        ]
+        + LESSON_CONTENT_RULES
+        + [
+            "• Judge each passage on its own; do not merge passages.",
+            "• Favor simplicity and clarity over completeness — capture the core lesson, not every dimension.",
+            "• Do not include quotes or references inside a lesson.",
+        ]
+    )
+    passages = "".join(f"[{unit_label(key)}]\n{text}\n\n" for key, text in items)
+    return (
+        "The passages are from the Bhagavad Gita.\n"
+        + LESSON_EXAMPLES
+        + "\n"
+        "Extract exactly ONE short lesson from EACH passage below.\n"
+        "Rules:\n"
+        + "".join(r + "\n" for r in rules)
+        + "\n"
+        + passages
+        + "Answer with only a JSON array, one object per passage in the same order:\n"
+        '[{"unit_key": "<key in brackets>", "lesson": "<one sentence or NONE>"}]'
+    )
+
+
+def chat_messages(prompt: str, packed: bool = False) -> List[dict]:
+    system = (
+        "Extract a single short lesson or NONE for each passage; reply with JSON only."
+        if packed
+        else "Extract a single short lesson or NONE."
+    )
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def pack_max_tokens(k: int) -> int:
+    # Per-unit budget plus room for the JSON wrapper and unit_key
+    return (CONFIG["max_tokens"] + 20) * k
+
+
+def parse_pack_response(raw: str, labels: List[str]) -> Dict[str, str]:
+    """Validate a packed reply; return {unit_label: answer} for well-formed items only."""
+    text = raw.strip()
+    fence = re.match(r"^```(?:json)?\s*(.*?)\s*```$", text, re.S)
+    if fence:
+        text = fence.group(1)
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return {}
+    if not isinstance(data, list):
+        return {}
+    wanted = set(labels)
+    out: Dict[str, str] = {}
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        label = str(item.get("unit_key", "")).strip().strip("[]")
+        lesson = item.get("lesson")
+        if label not in wanted or label in out or not isinstance(lesson, str) or not lesson.strip():
+            continue
+        out[label] = lesson
+    return out
+
+
+@dataclass
+class Completion:
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0  # prompt tokens the provider billed at the cached-input rate
+    cached: bool = False
+    latency_s: Optional[float] = None
+    first_sentence_s: Optional[float] = None  # streaming: time until the stop condition
+    stopped_early: bool = False
+
+
+# A terminator right after a word (not inside a number like 1.5)
+SENTENCE_CLOSE = re.compile("(?<=[A-Za-z)\"'’”])[.!?]")
+
+
+def stream_should_stop(text: str) -> bool:
+    """True once the streamed answer is exactly NONE or its first sentence is closed."""
+    t = text.strip()
+    return t == "NONE" or SENTENCE_CLOSE.search(t) is not None
+
+
+def stream_request_args(cfg: dict, messages: List[dict]) -> dict:
+    return {
+        "model": cfg["model_name"],
+        "temperature": cfg["temperature"],
+        "max_tokens": cfg.get("max_tokens", CONFIG["max_tokens"]),
+        "messages": messages,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+
+
+def stream_result(parts: List[str], deltas: int, usage, messages: List[dict], t0: float,
+                  first_sentence_s: Optional[float]) -> Completion:
+    # An aborted stream never sends usage: count deltas (~1 token each) and estimate the prompt
+    if usage is not None:
+        prompt_tokens, completion_tokens, cached_tokens = _usage(usage)
+    else:
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        completion_tokens, cached_tokens = deltas, 0
+    return Completion(
+        "".join(parts).strip(),
+        prompt_tokens,
+        completion_tokens,
+        cached_tokens,
+        latency_s=time.perf_counter() - t0,
+        first_sentence_s=first_sentence_s,
+        stopped_early=first_sentence_s is not None,
+    )
+
+
+def _usage(resp) -> Tuple[int, int, int]:
+    """(prompt, completion, cached prompt) tokens from an API response or usage chunk."""
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (
+        int(getattr(usage, "prompt_tokens", 0) or 0),
+        int(getattr(usage, "completion_tokens", 0) or 0),
+        int(getattr(details, "cached_tokens", 0) or 0),
+    )
+
+
+# Where the passage(s) start: everything before is the static, cacheable prefix
+PROMPT_PREFIX_END = re.compile(r"^(?:Passage:|\[\d+:\d+-\d+\])$", re.M)
+
+
+def ledger_call(
+    ledger: Ledger,
+    messages: List[dict],
+    label: str,
+    status: str,
+    result: Optional[Completion] = None,
+    attempt: int = 1,
+    latency_s: Optional[float] = None,
+) -> None:
+    """Record one attempt in the token ledger; the mode is the label kind (unit/pack)."""
+    if result is not None:
+        latency_s = result.latency_s
+    ledger.call(
+        label.split("=", 1)[0],
+        status,
+        prompt_tokens=result.prompt_tokens if result else 0,
+        completion_tokens=result.completion_tokens if result else 0,
+        cached_tokens=result.cached_tokens if result else 0,
+        latency_s=latency_s,
+        attempt=attempt,
+        prefix=static_prefix(messages, PROMPT_PREFIX_END),
+        label=label,
+    )
+
+
+def request_completion(messages: List[dict], cfg: dict, stream: bool = False) -> Completion:
     # Import here to avoid requiring the dependency in mock mode
     global CLIENT
     try:
@@ -119,17 +396,128 @@ def call_openai(prompt: str, cfg: dict) -> str:
         ) from e
 
     if CLIENT is None:
-        CLIENT = OpenAI()
+        # Retries are ours (--max-retries, backoff) so each attempt reaches the ledger
+        CLIENT = OpenAI(base_url=cfg.get("base_url"), max_retries=0)
+    t0 = time.perf_counter()
+    if stream:
+        parts: List[str] = []
+        deltas = 0
+        usage = first_sentence_s = None
+        response = CLIENT.chat.completions.create(**stream_request_args(cfg, messages))
+        try:
+            for chunk in response:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                parts.append(chunk.choices[0].delta.content)
+                deltas += 1
+                if stream_should_stop("".join(parts)):
+                    first_sentence_s = time.perf_counter() - t0
+                    break
+        finally:
+            response.close()
+        return stream_result(parts, deltas, usage, messages, t0, first_sentence_s)
     resp = CLIENT.chat.completions.create(
         model=cfg["model_name"],
         temperature=cfg["temperature"],
-        max_tokens=40,
-        messages=[
-            {"role": "system", "content": "Extract a single short lesson or NONE."},
-            {"role": "user", "content": prompt},
-        ],
+        max_tokens=cfg.get("max_tokens", CONFIG["max_tokens"]),
+        messages=messages,
+    )
+    return Completion(
+        resp.choices[0].message.content.strip(), *_usage(resp), latency_s=time.perf_counter() - t0
+    )
+
+
+def call_openai(prompt: str, cfg: dict) -> str:
+    return request_completion(chat_messages(prompt), cfg).text
+
+
+async def arequest_completion(messages: List[dict], cfg: dict, stream: bool = False) -> Completion:
+    """Async variant of request_completion (--concurrency > 1)."""
+    global ASYNC_CLIENT
+    try:
+        from openai import AsyncOpenAI  # type: ignore
+    except Exception as e:  # pragma: no cover - import guard
+        raise RuntimeError(
+            "openai package not available. Install openai or use --mock mode."
+        ) from e
+
+    if ASYNC_CLIENT is None:
+        ASYNC_CLIENT = AsyncOpenAI(base_url=cfg.get("base_url"), max_retries=0)
+    t0 = time.perf_counter()
+    if stream:
+        parts: List[str] = []
+        deltas = 0
+        usage = first_sentence_s = None
+        response = await ASYNC_CLIENT.chat.completions.create(**stream_request_args(cfg, messages))
+        try:
+            async for chunk in response:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                parts.append(chunk.choices[0].delta.content)
+                deltas += 1
+                if stream_should_stop("".join(parts)):
+                    first_sentence_s = time.perf_counter() - t0
+                    break
+        finally:
+            await response.close()
+        return stream_result(parts, deltas, usage, messages, t0, first_sentence_s)
+    resp = await ASYNC_CLIENT.chat.completions.create(
+        model=cfg["model_name"],
+        temperature=cfg["temperature"],
+        max_tokens=cfg.get("max_tokens", CONFIG["max_tokens"]),
+        messages=messages,
     )
-    return resp.choices[0].message.content.strip()
+    return Completion(
+        resp.choices[0].message.content.strip(), *_usage(resp), latency_s=time.perf_counter() - t0
+    )
+
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    # ~4 chars/token for English prompt text, plus the full completion budget
+    return len(prompt) // 4 + max_tokens
+
+
+class TokenBucket:
+    """Async token bucket: `per_minute` units refill continuously, burst = one minute.
+
+    A non-positive rate disables limiting. `adjust` lets callers reconcile an
+    estimate with the actual usage reported by the API (balance may go negative).
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.rate = max(0.0, per_minute) / 60.0
+        self.capacity = max(0.0, per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, delta: float) -> None:
+        if self.rate > 0:
+            self._refill()
+            self.tokens -= delta
 
 
 def mock_generate(unit_text: str) -> str:
@@ -164,6 +552,11 @@ def mock_generate(unit_text: str) -> str:
 
 
 def load_units(path: Path, limit: Optional[int]) -> Iterable[dict]:
+    """Units from units.jsonl or a units arena file (text decoded on first use)."""
+    if is_units_store(path):
+        # The store stays mapped for the rest of the run; units read their text from it lazily
+        yield from UnitsStore(path).iter_units(limit)
+        return
     with path.open("r", encoding="utf-8") as f:
         for idx, line in enumerate(f):
             if limit is not None and idx >= limit:
@@ -171,24 +564,691 @@ def load_units(path: Path, limit: Optional[int]) -> Iterable[dict]:
             yield json.loads(line)
 
 
-def load_existing(path: Path) -> Dict[Tuple[int, int, int], dict]:
-    if not path.exists():
-        return {}
-    seen: Dict[Tuple[int, int, int], dict] = {}
+def unit_sources(path: Path) -> Set[Optional[str]]:
+    """Distinct "source" values of a units file (arena files hold a single corpus)."""
+    if is_units_store(path):
+        return {None}
     with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
+        return {json.loads(line).get("source") for line in f if line.strip()}
+
+
+def unit_key(u: dict) -> Tuple[int, int, int]:
+    return (int(u["chapter"]), int(u["start"]), int(u["end"]))
+
+
+def extract_first_sentence(text: str) -> str:
+    # Capture first sentence ending with . ! or ?
+    m = re.search(r"(.+?[\.\!\?])(?:\s|$)", text.strip())
+    if m:
+        return m.group(1).strip()
+    return text.strip()
+
+
+def clean_answer(raw: str) -> str:
+    return raw.splitlines()[0].strip().strip('"')
+
+
+def filter_answer(ans: str, min_words: int, max_words: int) -> Tuple[Optional[str], str]:
+    """Apply the NONE and one-short-sentence filters.
+
+    Returns (accepted lesson or None, reason) where reason is one of
+    "ok", "fallback-first-sentence", "none", "length".
+    """
+    if ans.upper() == "NONE":
+        return None, "none"
+    reason = "ok"
+    # If multi-sentence, fallback to first sentence
+    if not is_one_sentence_short(ans, min_words, max_words):
+        first = extract_first_sentence(ans)
+        if first != ans:
+            reason = "fallback-first-sentence"
+        ans = first
+        if not is_one_sentence_short(ans, min_words, max_words):
+            return None, "length"
+    return ans, reason
+
+
+def make_row(key: Tuple[int, int, int], ans: str, prompt_key: Optional[str] = None) -> dict:
+    row = {
+        "lesson_id": str(uuid.uuid4()),
+        "unit": {"chapter": key[0], "start": key[1], "end": key[2]},
+        "raw": ans,
+    }
+    if prompt_key is not None:
+        row["prompt_key"] = prompt_key
+    return row
+
+
+def prompt_cache_key(args: argparse.Namespace, prompt: str) -> str:
+    return response_key(args.model_name, args.temperature, CONFIG["max_tokens"], chat_messages(prompt))
+
+
+@dataclass
+class RunStats:
+    processed: int = 0
+    cached_skipped: int = 0
+    filtered: int = 0
+    written: int = 0
+    stale: int = 0
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    pack_fallbacks: int = 0
+    none_keys: Set[Tuple[int, int, int]] = field(default_factory=set)
+    first_sentence_s: List[float] = field(default_factory=list)
+
+
+PendingItem = Tuple[Tuple[int, int, int], dict, str]
+
+
+def llm_cfg(args: argparse.Namespace, max_tokens: int) -> dict:
+    return {
+        "model_name": args.model_name,
+        "temperature": args.temperature,
+        "max_tokens": max_tokens,
+        "base_url": args.base_url,
+    }
+
+
+def complete_with_retries(
+    messages: List[dict],
+    max_tokens: int,
+    args: argparse.Namespace,
+    cache: ResponseCache,
+    ledger: Ledger,
+    stats: RunStats,
+    debug,
+    label: str,
+    stream: bool = False,
+) -> Optional[Completion]:
+    """Cached, retried synchronous completion; None after exhausting retries."""
+    ckey = response_key(args.model_name, args.temperature, max_tokens, messages)
+    cached = cache.get(ckey)
+    if cached is not None:
+        debug(f"response-cache hit {label}")
+        ledger_call(ledger, messages, label, "cache_hit")
+        return Completion(cached, cached=True)
+    backoff = max(0.0, args.backoff_initial)
+    for attempt in range(args.max_retries + 1):
+        t0 = time.perf_counter()
+        try:
+            result = request_completion(messages, llm_cfg(args, max_tokens), stream)
+            ledger_call(ledger, messages, label, "ok", result, attempt + 1)
+            stats.requests += 1
+            stats.prompt_tokens += result.prompt_tokens
+            stats.completion_tokens += result.completion_tokens
+            if not result.stopped_early:
+                # A cut-short stream is not what a full request would return
+                cache.put(ckey, args.model_name, result.text)
+            return result
+        except Exception as e:
+            ledger_call(ledger, messages, label, "error", attempt=attempt + 1, latency_s=time.perf_counter() - t0)
+            if attempt < args.max_retries:
+                debug(f"retry {attempt+1} after error: {e}")
+                time.sleep(backoff)
+                backoff = max(0.0, backoff * max(1.0, args.backoff_multiplier))
+                continue
+            print(f"Error generating after retries for {label}: {e}", file=sys.stderr)
+            return None
+
+
+def iter_groups(pending: Iterable[PendingItem], size: int) -> Iterator[List[PendingItem]]:
+    group: List[PendingItem] = []
+    for item in pending:
+        group.append(item)
+        if len(group) >= max(1, size):
+            yield group
+            group = []
+    if group:
+        yield group
+
+
+def mock_pack_reply(group: List[PendingItem]) -> Completion:
+    return Completion(json.dumps(
+        [{"unit_key": unit_label(key), "lesson": mock_generate(u["text"])} for key, u, _p in group]
+    ))
+
+
+class PackCostLog:
+    """Per-unit token cost for --pack runs, appended as JSONL."""
+
+    def __init__(self, path: Optional[Path]) -> None:
+        self.fp = path.open("a", encoding="utf-8") if path is not None else None
+
+    def record(self, key: Tuple[int, int, int], mode: str, pack_size: int,
+               pack: Optional[Completion], single: Optional[Completion] = None) -> None:
+        if self.fp is None:
+            return
+        k = max(1, pack_size)
+        prompt_tokens = (pack.prompt_tokens / k if pack else 0.0) + (single.prompt_tokens if single else 0)
+        completion_tokens = (pack.completion_tokens / k if pack else 0.0) + (single.completion_tokens if single else 0)
+        self.fp.write(json.dumps({
+            "unit": unit_label(key),
+            "mode": mode,
+            "pack_size": pack_size,
+            "prompt_tokens": round(prompt_tokens, 1),
+            "completion_tokens": round(completion_tokens, 1),
+            "cached": bool((pack and pack.cached) or (single and single.cached)),
+        }) + "\n")
+        self.fp.flush()
+
+    def close(self) -> None:
+        if self.fp is not None:
+            self.fp.close()
+
+
+class LatencyLog:
+    """Per-unit request latency (and time to first sentence with --stream), appended as JSONL."""
+
+    def __init__(self, path: Optional[Path]) -> None:
+        self.fp = path.open("a", encoding="utf-8") if path is not None else None
+
+    def record(self, key: Tuple[int, int, int], result: Optional[Completion], stats: "RunStats") -> None:
+        if result is None or result.cached or result.latency_s is None:
+            return
+        if result.first_sentence_s is not None:
+            stats.first_sentence_s.append(result.first_sentence_s)
+        if self.fp is None:
+            return
+        self.fp.write(json.dumps({
+            "unit": unit_label(key),
+            "first_sentence_ms": None if result.first_sentence_s is None else round(result.first_sentence_s * 1000, 1),
+            "total_ms": round(result.latency_s * 1000, 1),
+            "completion_tokens": result.completion_tokens,
+            "stopped_early": result.stopped_early,
+        }) + "\n")
+        self.fp.flush()
+
+    def close(self) -> None:
+        if self.fp is not None:
+            self.fp.close()
+
+
+def split_pack(
+    group: List[PendingItem], reply: Optional[Completion], stats: RunStats, debug
+) -> Tuple[Dict[Tuple[int, int, int], str], List[PendingItem]]:
+    """Map a packed reply back to units; return (answers, items needing a fallback call)."""
+    labels = [unit_label(key) for key, _u, _p in group]
+    parsed = parse_pack_response(reply.text, labels) if reply is not None else {}
+    answers: Dict[Tuple[int, int, int], str] = {}
+    fallback: List[PendingItem] = []
+    for item in group:
+        key = item[0]
+        ans = safe_clean_answer(parsed.get(unit_label(key)))
+        if ans is None:
+            stats.pack_fallbacks += 1
+            debug(f"pack-fallback unit={key}")
+            fallback.append(item)
+        else:
+            answers[key] = ans
+    return answers, fallback
+
+
+def iter_selected_units(units_path: Path, args: argparse.Namespace) -> Iterator[dict]:
+    """Units passing the --source/--chapter/--start/--end filters, capped at --limit."""
+    processed_matches = 0
+    for u in load_units(units_path, None):
+        # Apply optional unit filters
+        if args.source is not None and u.get("source") != args.source:
+            continue
+        if args.chapter is not None and int(u.get("chapter")) != args.chapter:
+            continue
+        if args.start is not None and int(u.get("start")) != args.start:
+            continue
+        if args.end is not None and int(u.get("end")) != args.end:
+            continue
+        if args.manifest_units is not None and unit_key(u) not in args.manifest_units:
+            continue
+
+        # Enforce post-filter limit
+        if args.limit is not None and processed_matches >= args.limit:
+            break
+
+        processed_matches += 1
+        yield u
+
+
+def iter_pending_units(
+    units: Iterable[dict],
+    args: argparse.Namespace,
+    store: CandidateStore,
+    stats: RunStats,
+    debug,
+    superseded: Optional[Dict[Tuple[int, int, int], str]] = None,
+    canonical: Optional[CandidateStore] = None,
+    lease: Optional[Lease] = None,
+) -> Iterator[PendingItem]:
+    """Yield (key, unit, prompt) for selected units that are not cached.
+
+    A cached row whose prompt_key differs from the current prompt's key (or
+    whose unit a --manifest lists as changed) is stale: the unit is yielded
+    again and recorded in `superseded`. Shard
+    workers also pass the (read-only) canonical store as a fallback lookup,
+    and their lease: once it is lost no further units are yielded.
+    """
+    for u in units:
+        if lease is not None and lease.lost:
+            debug(f"lease lost for {lease.path.name}; no further units")
+            return
+        stats.processed += 1
+        key = unit_key(u)
+        prompt = make_prompt(u["text"], args.min_words, args.max_words)
+        row = store.get(key)
+        if row is None and canonical is not None:
+            row = canonical.get(key)
+        if row is not None:
+            old_key = row.get("prompt_key")
+            if key in args.regenerate:
+                # Listed as changed by the 00 manifest, even for legacy rows without prompt_key
+                old_key = ""
+            if old_key is None or old_key == prompt_cache_key(args, prompt):
+                stats.cached_skipped += 1
+                debug(f"cache-skip unit={key}")
                 continue
-            row = json.loads(line)
-            unit = row.get("unit", {})
-            key = (int(unit["chapter"]), int(unit["start"]), int(unit["end"]))
-            seen[key] = row
-    return seen
+            stats.stale += 1
+            debug(f"stale unit={key} (prompt/model/temperature changed)")
+            if superseded is not None:
+                superseded[key] = prompt_cache_key(args, prompt)
+        yield key, u, prompt
+
+
+def accept_and_write(
+    ans: Optional[str],
+    key: Tuple[int, int, int],
+    prompt: str,
+    args: argparse.Namespace,
+    store: CandidateStore,
+    stats: RunStats,
+    debug,
+) -> None:
+    if ans is None:
+        stats.filtered += 1
+        return
+    lesson, reason = filter_answer(ans, args.min_words, args.max_words)
+    if lesson is None:
+        stats.filtered += 1
+        if reason == "none":
+            stats.none_keys.add(key)
+            debug(f"filtered-none unit={key}")
+        else:
+            debug(f"filtered-length unit={key} wc={word_count(extract_first_sentence(ans))}")
+        return
+    if reason == "fallback-first-sentence":
+        debug(f"fallback-first-sentence unit={key}")
+    row = make_row(key, lesson, prompt_cache_key(args, prompt))
+    store.add(row)
+    stats.written += 1
+    debug(f"written unit={key} wc={word_count(lesson)}")
+
+
+def safe_clean_answer(raw: Optional[str]) -> Optional[str]:
+    if raw is None:
+        return None
+    try:
+        return clean_answer(raw)
+    except IndexError:  # empty completion
+        return None
+
+
+def batch_request_line(custom_id: str, prompt: str, args: argparse.Namespace) -> dict:
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": args.model_name,
+            "temperature": args.temperature,
+            "max_tokens": CONFIG["max_tokens"],
+            "messages": chat_messages(prompt),
+        },
+    }
+
+
+def write_batch_state(path: Path, state: dict) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state, indent=2) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def find_batch_for_input(client, input_file_id: str):
+    """The batch created from input_file_id, if any (newest first)."""
+    for batch in client.batches.list(limit=100):
+        if getattr(batch, "input_file_id", None) == input_file_id:
+            return batch
+    return None
+
+
+def run_batch(
+    pending: Iterable[Tuple[Tuple[int, int, int], dict, str]],
+    args: argparse.Namespace,
+    out_path: Path,
+    store: CandidateStore,
+    stats: RunStats,
+    debug,
+    cache: ResponseCache,
+    ledger: Ledger,
+) -> None:
+    """Generate all uncached prompts through one Batch API job, then ingest.
+
+    custom_id is the response-cache key, so duplicate passages are sent once.
+    """
+    try:
+        from openai import OpenAI  # type: ignore
+    except Exception as e:  # pragma: no cover - import guard
+        raise RuntimeError("openai package not available. Install openai to use --batch.") from e
+
+    items = list(pending)
+    to_send: Dict[str, str] = {}
+    for key, _u, prompt in items:
+        ckey = prompt_cache_key(args, prompt)
+        if ckey in to_send:
+            continue
+        if cache.get(ckey) is None:
+            to_send[ckey] = prompt
+        else:
+            ledger_call(ledger, chat_messages(prompt), f"batch={unit_label(key)}", "cache_hit")
+
+    state_path = out_path.with_name(out_path.name + ".batch_state.json")
+    state: dict = json.loads(state_path.read_text(encoding="utf-8")) if state_path.exists() else {}
+    prompts_by_ckey = {prompt_cache_key(args, prompt): prompt for _key, _u, prompt in items}
+    client = OpenAI(base_url=args.base_url)
+    input_path = out_path.with_name(out_path.name + ".batch_input.jsonl")
+
+    if state.get("batch_id"):
+        print(f"Resuming batch {state['batch_id']} from {state_path}")
+    elif state.get("input_file_id") or to_send:
+        if state.get("input_file_id"):
+            # Crashed between upload and recording the batch: it may have been created anyway
+            existing = find_batch_for_input(client, state["input_file_id"])
+            print(f"Resuming submission of {state['input_file_id']} from {state_path}")
+        else:
+            existing = None
+            with input_path.open("w", encoding="utf-8") as f:
+                for ckey, prompt in to_send.items():
+                    f.write(json.dumps(batch_request_line(ckey, prompt, args), ensure_ascii=False) + "\n")
+            with input_path.open("rb") as f:
+                uploaded = client.files.create(file=f, purpose="batch")
+            state = {
+                "status": "submitting",
+                "input_file_id": uploaded.id,
+                "requests": len(to_send),
+                "model_name": args.model_name,
+            }
+            # Persist the upload before creating the batch, so a crash in between
+            # finds the batch by its input file instead of paying for it twice
+            write_batch_state(state_path, state)
+        batch = existing or client.batches.create(
+            input_file_id=state["input_file_id"],
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        state.update(status="submitted", batch_id=batch.id, submitted_at=time.time())
+        write_batch_state(state_path, state)
+        if existing is not None:
+            print(f"Found batch {batch.id} already created for {state['input_file_id']}")
+        else:
+            print(f"Submitted batch {batch.id} with {state['requests']} requests")
+
+    if state.get("batch_id"):
+        terminal = {"completed", "failed", "expired", "cancelled"}
+        while True:
+            batch = client.batches.retrieve(state["batch_id"])
+            counts = getattr(batch, "request_counts", None)
+            debug(f"batch {batch.id} status={batch.status} counts={counts}")
+            if batch.status in terminal:
+                break
+            time.sleep(max(0.0, args.batch_poll))
+        if batch.status != "completed":
+            print(f"Batch {batch.id} ended with status={batch.status}", file=sys.stderr)
+        ingested = 0
+        if getattr(batch, "output_file_id", None):
+            content = client.files.content(batch.output_file_id).text
+            for line in content.splitlines():
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                resp = rec.get("response") or {}
+                messages = chat_messages(prompts_by_ckey.get(rec.get("custom_id"), ""))
+                label = f"batch={rec.get('custom_id', '')[:12]}"
+                if int(resp.get("status_code", 0)) != 200:
+                    ledger_call(ledger, messages, label, "error")
+                    continue
+                body = resp.get("body") or {}
+                choices = body.get("choices") or []
+                if not choices:
+                    continue
+                usage = body.get("usage") or {}
+                result = Completion(
+                    "",
+                    int(usage.get("prompt_tokens") or 0),
+                    int(usage.get("completion_tokens") or 0),
+                    int((usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0),
+                )
+                # Same accounting as the sequential/async paths
+                stats.requests += 1
+                stats.prompt_tokens += result.prompt_tokens
+                stats.completion_tokens += result.completion_tokens
+                ledger_call(ledger, messages, label, "ok", result)
+                raw = str((choices[0].get("message") or {}).get("content") or "").strip()
+                cache.put(rec["custom_id"], args.model_name, raw)
+                ingested += 1
+        if getattr(batch, "error_file_id", None):
+            print(f"Batch {batch.id} has failed requests (error file {batch.error_file_id})", file=sys.stderr)
+        print(f"Ingested {ingested} batch responses")
+        state_path.unlink()
+        # The uploaded copy lives with the provider; the local one is only needed until the batch ends
+        if input_path.exists():
+            input_path.unlink()
+
+    missing = 0
+    for key, _u, prompt in items:
+        ckey = prompt_cache_key(args, prompt)
+        raw = cache.get(ckey, count=False)
+        if raw is None:
+            # Failed/unsent in this batch: leave the unit uncached for the next run
+            missing += 1
+            stats.filtered += 1
+            debug(f"batch-missing unit={key}")
+            continue
+        accept_and_write(safe_clean_answer(raw), key, prompt, args, store, stats, debug)
+    if missing:
+        print(f"{missing} units had no batch response; re-run to submit them", file=sys.stderr)
+
+
+def run_local(
+    pending: Iterable[PendingItem],
+    args: argparse.Namespace,
+    store: CandidateStore,
+    stats: RunStats,
+    debug,
+    cache: ResponseCache,
+    ledger: Ledger,
+    model: "LocalChatModel",
+) -> None:
+    """Generate with an in-process model, --local-batch-size prompts per forward pass."""
+    for group in iter_groups(pending, args.local_batch_size):
+        raw_by_key: Dict[str, str] = {}
+        todo: Dict[str, List[dict]] = {}
+        for key, _u, prompt in group:
+            ckey = prompt_cache_key(args, prompt)
+            if ckey in raw_by_key or ckey in todo:
+                continue
+            cached = cache.get(ckey)
+            if cached is not None:
+                debug(f"response-cache hit unit={key}")
+                ledger_call(ledger, chat_messages(prompt), f"local={unit_label(key)}", "cache_hit")
+                raw_by_key[ckey] = cached
+            else:
+                todo[ckey] = chat_messages(prompt)
+        if todo:
+            t0 = time.perf_counter()
+            outputs = model.generate(list(todo.values()), CONFIG["max_tokens"])
+            elapsed = time.perf_counter() - t0
+            for ckey, (text, prompt_tokens, completion_tokens) in zip(todo, outputs):
+                # Every row of a batch waits for the whole forward pass
+                ledger_call(ledger, todo[ckey], "local=batch", "ok", Completion(
+                    text, prompt_tokens, completion_tokens, latency_s=elapsed
+                ))
+                cache.put(ckey, args.model_name, text)
+                raw_by_key[ckey] = text
+                stats.requests += 1
+                stats.prompt_tokens += prompt_tokens
+                stats.completion_tokens += completion_tokens
+        for key, _u, prompt in group:
+            raw = raw_by_key.get(prompt_cache_key(args, prompt))
+            accept_and_write(safe_clean_answer(raw), key, prompt, args, store, stats, debug)
+
+
+async def run_async(
+    pending: Iterable[PendingItem],
+    args: argparse.Namespace,
+    store: CandidateStore,
+    stats: RunStats,
+    debug,
+    cache: ResponseCache,
+    costs: "PackCostLog",
+    latency: "LatencyLog",
+    ledger: Ledger,
+) -> None:
+    """Generate with up to args.concurrency requests in flight.
+
+    A fixed pool of workers pulls units (or --pack groups) from a queue; each
+    acquires the request and token buckets before calling the API. Finished
+    answers are buffered by sequence number and flushed to the output strictly
+    in unit order. Identical prompts already in flight share a single request.
+    """
+    req_bucket = TokenBucket(args.rpm)
+    tok_bucket = TokenBucket(args.tpm)
+    queue: "asyncio.Queue[Optional[List[Tuple[int, PendingItem]]]]" = asyncio.Queue(
+        maxsize=max(1, args.concurrency) * 2
+    )
+    done: Dict[int, Tuple[Tuple[int, int, int], str, Optional[str]]] = {}
+    inflight: Dict[str, "asyncio.Future[Optional[Completion]]"] = {}
+    next_seq = 0
+
+    def flush_ready() -> None:
+        nonlocal next_seq
+        while next_seq in done:
+            key, prompt, ans = done.pop(next_seq)
+            accept_and_write(ans, key, prompt, args, store, stats, debug)
+            next_seq += 1
+
+    async def complete(
+        messages: List[dict], max_tokens: int, label: str, stream: bool = False
+    ) -> Optional[Completion]:
+        ckey = response_key(args.model_name, args.temperature, max_tokens, messages)
+        cached = cache.get(ckey)
+        if cached is not None:
+            debug(f"response-cache hit {label}")
+            ledger_call(ledger, messages, label, "cache_hit")
+            return Completion(cached, cached=True)
+        if ckey in inflight:
+            debug(f"response-cache join in-flight {label}")
+            return await asyncio.shield(inflight[ckey])
+        fut: "asyncio.Future[Optional[Completion]]" = asyncio.get_running_loop().create_future()
+        inflight[ckey] = fut
+        try:
+            result = await call_with_retries(messages, max_tokens, label, ckey, stream)
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved when nobody joined
+            raise
+        finally:
+            inflight.pop(ckey, None)
+        fut.set_result(result)
+        return result
+
+    async def call_with_retries(
+        messages: List[dict], max_tokens: int, label: str, ckey: str, stream: bool
+    ) -> Optional[Completion]:
+        backoff = max(0.0, args.backoff_initial)
+        estimate = estimate_tokens(messages[-1]["content"], max_tokens)
+        for attempt in range(args.max_retries + 1):
+            t0 = time.perf_counter()
+            try:
+                await req_bucket.acquire(1)
+                await tok_bucket.acquire(estimate)
+                t0 = time.perf_counter()
+                result = await arequest_completion(messages, llm_cfg(args, max_tokens), stream)
+                ledger_call(ledger, messages, label, "ok", result, attempt + 1)
+                used = result.prompt_tokens + result.completion_tokens
+                if used:
+                    tok_bucket.adjust(used - estimate)
+                stats.requests += 1
+                stats.prompt_tokens += result.prompt_tokens
+                stats.completion_tokens += result.completion_tokens
+                if not result.stopped_early:
+                    cache.put(ckey, args.model_name, result.text)
+                return result
+            except Exception as e:
+                ledger_call(ledger, messages, label, "error", attempt=attempt + 1, latency_s=time.perf_counter() - t0)
+                if attempt < args.max_retries:
+                    debug(f"retry {attempt+1} after error: {e}")
+                    await asyncio.sleep(backoff)
+                    backoff = max(0.0, backoff * max(1.0, args.backoff_multiplier))
+                    continue
+                print(f"Error generating after retries for {label}: {e}", file=sys.stderr)
+                return None
 
+    async def generate_single(item: PendingItem) -> Tuple[Optional[str], Optional[Completion]]:
+        key, u, prompt = item
+        if args.mock:
+            return mock_generate(u["text"]).strip().strip('"'), None
+        result = await complete(chat_messages(prompt), CONFIG["max_tokens"], f"unit={key}", args.stream)
+        latency.record(key, result, stats)
+        return (safe_clean_answer(result.text) if result else None), result
 
-def write_row(fp, row: dict) -> None:
-    fp.write(json.dumps(row, ensure_ascii=False) + "\n")
-    fp.flush()
+    async def generate_group(group: List[PendingItem]) -> Dict[Tuple[int, int, int], Optional[str]]:
+        if len(group) == 1:
+            ans, _ = await generate_single(group[0])
+            return {group[0][0]: ans}
+        if args.mock:
+            reply: Optional[Completion] = mock_pack_reply(group)
+        else:
+            pack_prompt = make_pack_prompt([(k, u["text"]) for k, u, _p in group], args.min_words, args.max_words)
+            reply = await complete(
+                chat_messages(pack_prompt, packed=True), pack_max_tokens(len(group)),
+                f"pack={unit_label(group[0][0])}..{unit_label(group[-1][0])}",
+            )
+        answers, fallback = split_pack(group, reply, stats, debug)
+        out: Dict[Tuple[int, int, int], Optional[str]] = dict(answers)
+        for key in answers:
+            costs.record(key, "pack", len(group), reply)
+        for item in fallback:
+            ans, single = await generate_single(item)
+            out[item[0]] = ans
+            costs.record(item[0], "fallback", len(group), reply, single)
+        return out
+
+    async def worker() -> None:
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                return
+            group = [item for _seq, item in batch]
+            try:
+                answers = await generate_group(group)
+            except Exception as e:
+                print(f"Error generating for units {[item[0] for item in group]}: {e}", file=sys.stderr)
+                answers = {}
+            for seq, (key, _u, prompt) in batch:
+                done[seq] = (key, prompt, answers.get(key))
+            flush_ready()
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, args.concurrency))]
+    seq = 0
+    for group in iter_groups(pending, args.pack):
+        await queue.put([(seq + i, item) for i, item in enumerate(group)])
+        seq += len(group)
+    for _ in workers:
+        await queue.put(None)
+    await asyncio.gather(*workers)
+    flush_ready()
+    global ASYNC_CLIENT
+    if ASYNC_CLIENT is not None:
+        # The client is bound to this event loop; a later asyncio.run needs a fresh one
+        await ASYNC_CLIENT.close()
+        ASYNC_CLIENT = None
 
 
 def main() -> None:
@@ -206,131 +1266,352 @@ def main() -> None:
     parser.add_argument("--limit", type=int, default=None, help="Process only first N units")
     parser.add_argument("--mock", action="store_true", help="Use deterministic mock generation (no API)")
     parser.add_argument("--debug", action="store_true", help="Log filtering reasons and actions")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible API base URL (default: OpenAI)")
+    parser.add_argument(
+        "--response-cache",
+        type=Path,
+        default=DEFAULT_CACHE_PATH,
+        help="SQLite response cache (default: utils/Scripts/.llm_cache/responses.sqlite)",
+    )
+    parser.add_argument("--no-response-cache", action="store_true", help="Disable the response cache")
+    parser.add_argument(
+        "--ledger",
+        type=Path,
+        default=DEFAULT_LEDGER_PATH,
+        help="Token/latency/cost ledger, one line per LLM call (default: utils/Scripts/.llm_cache/ledger.jsonl)",
+    )
+    parser.add_argument("--no-ledger", action="store_true", help="Do not write the ledger")
+    parser.add_argument("--store", default=None, help="Candidate store (default: <out-file>.store.sqlite)")
+    parser.add_argument(
+        "--commit-rows", type=int, default=DEFAULT_COMMIT_ROWS, help="Group-commit the store every N rows"
+    )
+    parser.add_argument(
+        "--commit-ms", type=float, default=DEFAULT_COMMIT_MS, help="...or when T ms have passed since the last commit"
+    )
     # Rate limiting and retries
     parser.add_argument("--sleep", type=float, default=0.0, help="Seconds to sleep between API calls")
     parser.add_argument("--max-retries", type=int, default=4, help="Max retries on transient errors")
     parser.add_argument("--backoff-initial", type=float, default=1.0, help="Initial backoff seconds")
     parser.add_argument("--backoff-multiplier", type=float, default=2.0, help="Exponential backoff factor")
+    # Async execution
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Max requests in flight; >1 switches to the asyncio path (--sleep is then ignored)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream single-unit answers and stop at the first sentence or NONE (logs <out>.latency.jsonl)",
+    )
+    parser.add_argument("--rpm", type=float, default=0.0, help="Requests/min limit for --concurrency (0 = off)")
+    parser.add_argument("--tpm", type=float, default=0.0, help="Tokens/min limit for --concurrency (0 = off)")
+    # Generation backend
+    parser.add_argument(
+        "--backend",
+        choices=["openai", "local"],
+        default="openai",
+        help="openai: OpenAI-compatible API (default); local: in-process transformers model on CPU",
+    )
+    parser.add_argument("--local-model", default=DEFAULT_LOCAL_MODEL, help="Hugging Face model for --backend local")
+    parser.add_argument("--local-batch-size", type=int, default=16, help="Prompts per forward pass (--backend local)")
+    parser.add_argument("--local-threads", type=int, default=None, help="torch CPU threads (--backend local)")
+    # Batch API
+    parser.add_argument("--batch", action="store_true", help="Submit uncached prompts via the Batch API")
+    parser.add_argument("--batch-poll", type=float, default=30.0, help="Seconds between batch status polls")
+    # Packed prompts
+    parser.add_argument(
+        "--pack",
+        type=int,
+        default=1,
+        help="Units per request; >1 asks for a JSON array and falls back to single requests for bad items",
+    )
+    # Span-hierarchy scheduling
+    parser.add_argument(
+        "--span-schedule",
+        choices=SCHEDULE_MODES,
+        default="off",
+        help="Run spans shortest-first and skip or defer long spans made redundant by shorter ones",
+    )
+    parser.add_argument(
+        "--prune-rules",
+        default=",".join(PRUNE_RULES),
+        help=f"Comma-separated pruning rules for --span-schedule ({', '.join(PRUNE_RULES)})",
+    )
+    parser.add_argument(
+        "--prune-clusters",
+        default=None,
+        help="Clusters JSONL (02/03 output) for the one-cluster rule; default compares normalized text",
+    )
+    # Multi-worker sharding
+    parser.add_argument(
+        "--shard-dir",
+        default=None,
+        help="Shared directory for lease-based multi-worker runs; outputs go to per-shard files",
+    )
+    parser.add_argument("--shard-size", type=int, default=64, help="Units per shard (contiguous)")
+    parser.add_argument("--worker-id", default=None, help="Worker name in lease files (default: host:pid)")
+    parser.add_argument("--lease-seconds", type=float, default=300.0, help="Lease expiry without a heartbeat")
+    parser.add_argument("--lease-poll", type=float, default=10.0, help="Seconds between claim attempts while waiting")
+    parser.add_argument(
+        "--no-wait", action="store_true", help="Exit when no shard is free instead of waiting to reclaim expired ones"
+    )
+    parser.add_argument("--merge-shards", default=None, help="Merge a --shard-dir into --out-file and exit")
     # Optional unit filters to target specific spans and reduce API usage
+    parser.add_argument(
+        "--source",
+        default=None,
+        help="Only process units from this source (input file stem) of a multi-input 00 build",
+    )
     parser.add_argument("--chapter", type=int, default=None, help="Only process units from this chapter")
     parser.add_argument("--start", type=int, default=None, help="Only process units with this start verse")
     parser.add_argument("--end", type=int, default=None, help="Only process units with this end verse")
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="00_build_units.py --incremental manifest: regenerate only its added/changed units, drop removed ones",
+    )
     args = parser.parse_args()
 
     units_path = resolve_path(repo_root, args.units_file)
     out_path = resolve_path(repo_root, args.out_file)
 
-    # Load existing cache
-    seen = load_existing(out_path)
+    if not args.merge_shards:
+        sources = unit_sources(units_path)
+        if args.source is not None and args.source not in sources:
+            raise SystemExit(f"--source {args.source!r} not in {units_path} (has {sorted(map(str, sources))})")
+        if args.source is None and len(sources) > 1:
+            # The same (chapter, start, end) in two corpora would share one store row
+            raise SystemExit(
+                f"{units_path} mixes sources {sorted(map(str, sources))}; "
+                "pass --source NAME and use a separate --out-file per source"
+            )
+
+    if args.shard_dir and (args.batch or args.span_schedule != "off"):
+        raise SystemExit("--shard-dir cannot be combined with --batch or --span-schedule")
+    changes = load_manifest(resolve_path(repo_root, args.manifest)) if args.manifest else None
+    if changes is not None and (args.shard_dir or args.merge_shards):
+        raise SystemExit("--manifest updates the canonical store directly; run it without --shard-dir/--merge-shards")
+    args.manifest_units = (changes["added"] | changes["changed"]) if changes is not None else None
+    args.regenerate = changes["changed"] if changes is not None else set()
+    local_model: Optional[LocalChatModel] = None
+    if args.backend == "local":
+        if args.mock or args.batch or args.pack > 1 or args.concurrency > 1:
+            raise SystemExit("--backend local batches in-process; drop --mock/--batch/--pack/--concurrency")
+        # Rows and cache entries are keyed by the model that produced them (greedy = temperature 0)
+        args.model_name = f"local:{args.local_model}"
+        args.temperature = 0.0
+        local_model = LocalChatModel(args.local_model, args.local_threads)
 
-    # Prepare output file (append mode)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_fp = out_path.open("a", encoding="utf-8")
+    # Indexed store of existing rows; candidates.jsonl is kept as its export
+    store_path = resolve_path(repo_root, args.store) if args.store else default_store_path(out_path)
+    if args.merge_shards:
+        store = CandidateStore(store_path, out_path, args.commit_rows, args.commit_ms)
+        added, duplicates, dropped = merge_shards(resolve_path(repo_root, args.merge_shards), store)
+        store.close()
+        print(
+            f"✅ Merged shards into {out_path} | added={added}, duplicates={duplicates}, superseded={dropped}"
+        )
+        return
+    # Shard workers only read the canonical store (the merge step writes it)
+    store = CandidateStore(store_path, None if args.shard_dir else out_path, args.commit_rows, args.commit_ms)
 
-    total_processed = 0
-    total_skipped_cached = 0
-    total_written = 0
-    total_filtered = 0
+    stats = RunStats()
+    started = time.perf_counter()
+    removed_rows = store.delete(changes["removed"]) if changes is not None else 0
+    superseded: Dict[Tuple[int, int, int], str] = {}
+    cache = ResponseCache(None if (args.no_response_cache or args.mock) else args.response_cache)
+    ledger = Ledger(None if (args.no_ledger or args.mock) else args.ledger, "01_generate_candidates", args.model_name)
 
     def debug(msg: str) -> None:
         if args.debug:
             print(f"[debug] {msg}", file=sys.stderr)
 
-    def extract_first_sentence(text: str) -> str:
-        # Capture first sentence ending with . ! or ?
-        m = re.search(r"(.+?[\.\!\?])(?:\s|$)", text.strip())
-        if m:
-            return m.group(1).strip()
-        return text.strip()
-
-    def generate_with_retries(unit_text: str, prompt: str, key: Tuple[int, int, int]) -> Optional[str]:
+    def generate_single(item: PendingItem) -> Tuple[Optional[str], Optional[Completion]]:
+        key, u, prompt = item
         if args.mock:
-            return mock_generate(unit_text).strip().strip('"')
-        backoff = max(0.0, args.backoff_initial)
-        for attempt in range(args.max_retries + 1):
-            try:
-                cfg = {"model_name": args.model_name, "temperature": args.temperature}
-                return call_openai(prompt, cfg).splitlines()[0].strip().strip('"')
-            except Exception as e:
-                if attempt < args.max_retries:
-                    debug(f"retry {attempt+1} after error: {e}")
-                    time.sleep(backoff)
-                    backoff = max(0.0, backoff * max(1.0, args.backoff_multiplier))
-                    continue
-                print(f"Error generating after retries for unit {key}: {e}", file=sys.stderr)
-                return None
+            return mock_generate(u["text"]).strip().strip('"'), None
+        result = complete_with_retries(
+            chat_messages(prompt), CONFIG["max_tokens"], args, cache, ledger, stats, debug, f"unit={key}", args.stream
+        )
+        latency.record(key, result, stats)
+        return (safe_clean_answer(result.text) if result else None), result
 
-    processed_matches = 0
-    for u in load_units(units_path, None):
-        # Apply optional unit filters
-        if args.chapter is not None and int(u.get("chapter")) != args.chapter:
-            continue
-        if args.start is not None and int(u.get("start")) != args.start:
-            continue
-        if args.end is not None and int(u.get("end")) != args.end:
-            continue
+    def generate_group(group: List[PendingItem]) -> Dict[Tuple[int, int, int], Optional[str]]:
+        if len(group) == 1:
+            ans, _ = generate_single(group[0])
+            return {group[0][0]: ans}
+        if args.mock:
+            reply: Optional[Completion] = mock_pack_reply(group)
+        else:
+            pack_prompt = make_pack_prompt([(k, u["text"]) for k, u, _p in group], args.min_words, args.max_words)
+            reply = complete_with_retries(
+                chat_messages(pack_prompt, packed=True), pack_max_tokens(len(group)), args, cache, ledger, stats, debug,
+                f"pack={unit_label(group[0][0])}..{unit_label(group[-1][0])}",
+            )
+        answers, fallback = split_pack(group, reply, stats, debug)
+        out: Dict[Tuple[int, int, int], Optional[str]] = dict(answers)
+        for key in answers:
+            costs.record(key, "pack", len(group), reply)
+        for item in fallback:
+            ans, single = generate_single(item)
+            out[item[0]] = ans
+            costs.record(item[0], "fallback", len(group), reply, single)
+        return out
 
-        # Enforce post-filter limit
-        if args.limit is not None and processed_matches >= args.limit:
-            break
+    if args.batch and (args.mock or args.no_response_cache):
+        raise SystemExit("--batch needs the response cache and cannot be combined with --mock")
+    if args.batch and args.pack > 1:
+        raise SystemExit("--pack applies to live requests; the Batch API path already sends one unit per line")
+    if args.stream and (args.batch or args.backend == "local"):
+        raise SystemExit("--stream applies to live API requests (the local backend already stops at the first sentence)")
+    costs = PackCostLog(out_path.with_suffix(".pack_costs.jsonl") if args.pack > 1 else None)
+    latency = LatencyLog(out_path.with_suffix(".latency.jsonl") if args.stream else None)
 
-        processed_matches += 1
-        total_processed += 1
-        key = (int(u["chapter"]), int(u["start"]), int(u["end"]))
-        if key in seen:
-            total_skipped_cached += 1
-            debug(f"cache-skip unit={key}")
-            continue
+    selected_by_key: Dict[Tuple[int, int, int], dict] = {}
 
-        # Build prompt and generate
-        prompt = make_prompt(u["text"], args.min_words, args.max_words)
-        try:
-            ans = generate_with_retries(u["text"], prompt, key)
-        except Exception as e:
-            print(f"Error generating for unit {key}: {e}", file=sys.stderr)
-            total_filtered += 1
-            continue
-        if ans is None:
-            total_filtered += 1
-            continue
+    def outcome(key: Tuple[int, int, int]) -> Outcome:
+        row = store.get(key)
+        if row is not None:
+            return "lesson", row
+        if key in stats.none_keys:
+            return "none", None
+        unit = selected_by_key.get(key)
+        if unit is None or args.mock:
+            return None
+        # Answered NONE in an earlier run: the raw reply is in the response cache
+        cached = safe_clean_answer(
+            cache.get(prompt_cache_key(args, make_prompt(unit["text"], args.min_words, args.max_words)), count=False)
+        )
+        return ("none", None) if cached is not None and cached.upper() == "NONE" else None
 
-        if ans.upper() == "NONE":
-            total_filtered += 1
-            debug(f"filtered-none unit={key}")
-            continue
+    def run_pending(pending: Iterable[PendingItem], target: CandidateStore) -> None:
+        if local_model is not None:
+            run_local(pending, args, target, stats, debug, cache, ledger, local_model)
+        elif args.batch:
+            run_batch(pending, args, out_path, target, stats, debug, cache, ledger)
+        elif args.concurrency > 1:
+            asyncio.run(run_async(pending, args, target, stats, debug, cache, costs, latency, ledger))
+        else:
+            run_sync(pending, target)
 
-        # If multi-sentence, fallback to first sentence
-        if not is_one_sentence_short(ans, args.min_words, args.max_words):
-            first = extract_first_sentence(ans)
-            if first != ans:
-                debug(f"fallback-first-sentence unit={key}")
-            ans = first
-            if not is_one_sentence_short(ans, args.min_words, args.max_words):
-                total_filtered += 1
-                debug(f"filtered-length unit={key} wc={word_count(ans)}")
+    def run_sync(pending: Iterable[PendingItem], target: CandidateStore) -> None:
+        for group in iter_groups(pending, args.pack):
+            try:
+                answers = generate_group(group)
+            except Exception as e:
+                print(f"Error generating for units {[item[0] for item in group]}: {e}", file=sys.stderr)
+                stats.filtered += len(group)
                 continue
+            written_before = stats.written
+            for key, _u, prompt in group:
+                accept_and_write(answers.get(key), key, prompt, args, target, stats, debug)
+            if stats.written > written_before and args.sleep > 0 and not args.mock:
+                time.sleep(args.sleep)
 
-        row = {
-            "lesson_id": str(uuid.uuid4()),
-            "unit": {"chapter": key[0], "start": key[1], "end": key[2]},
-            "raw": ans,
-        }
-        write_row(out_fp, row)
-        seen[key] = row
-        total_written += 1
-        debug(f"written unit={key} wc={word_count(ans)}")
-        if args.sleep > 0 and not args.mock:
-            time.sleep(args.sleep)
+    scheduler: Optional[SpanScheduler] = None
+    if args.shard_dir:
+        plan = ShardPlan(resolve_path(repo_root, args.shard_dir), list(iter_selected_units(units_path, args)), args.shard_size)
+        worker = args.worker_id or default_worker_id()
+        shards_done = 0
+        for lease in iter_claims(plan, worker, args.lease_seconds, args.lease_poll, not args.no_wait, debug):
+            debug(f"worker {worker} claimed {lease.path.name}")
+            shard_path = plan.output_path(lease.index)
+            # Rows answered after the lease is lost are dropped, not written
+            shard_store = LeasedStore(lease, default_store_path(shard_path), shard_path, args.commit_rows, args.commit_ms)
+            try:
+                run_pending(
+                    iter_pending_units(plan.shard_units(lease.index), args, shard_store, stats, debug, None, store, lease),
+                    shard_store,
+                )
+            finally:
+                shard_store.close()
+            lease.release(done=True)
+            if lease.lost:
+                print(
+                    f"Lost the lease on {lease.path.name} (another worker reclaimed it); "
+                    f"dropped {shard_store.dropped} rows, not marked done. Stopping.",
+                    file=sys.stderr,
+                )
+                break
+            shards_done += 1
+        print(f"Worker {worker} finished {shards_done} of {plan.count} shards in {plan.dir}")
+        if plan.all_done():
+            print("All shards done; merge with --merge-shards")
+    elif args.span_schedule == "off":
+        run_pending(
+            iter_pending_units(iter_selected_units(units_path, args), args, store, stats, debug, superseded), store
+        )
+    else:
+        selected = list(iter_selected_units(units_path, args))
+        selected_by_key.update((unit_key(u), u) for u in selected)
+        cluster_map = load_cluster_map(resolve_path(repo_root, args.prune_clusters)) if args.prune_clusters else None
+        log_fp = out_path.with_suffix(".schedule.jsonl").open("w", encoding="utf-8")
+        scheduler = SpanScheduler(
+            selected, parse_rules(args.prune_rules), args.span_schedule, outcome, cluster_map, log_fp
+        )
+        # Shorter spans first, each tier finished before the next is pruned against it
+        for tier in span_tiers(selected):
+            run_pending(
+                scheduler.filter(iter_pending_units(tier, args, store, stats, debug, superseded), superseded, debug),
+                store,
+            )
+        deferred = scheduler.take_deferred()
+        if deferred:
+            debug(f"running {len(deferred)} deferred spans")
+            run_pending(deferred, store)
+        log_fp.close()
 
-    out_fp.close()
+    if superseded:
+        dropped = store.drop_superseded(superseded)
+        debug(f"dropped {dropped} superseded rows")
+    store.close()
+    cache.close()
+    costs.close()
+    latency.close()
+    ledger.finish(units=stats.processed, accepted=stats.written)
+    ledger.close()
 
+    dest = plan.dir / "shards" if args.shard_dir else out_path
     print(
-        f"✅ Candidates written to {out_path} | processed={total_processed}, "
-        f"cached_skipped={total_skipped_cached}, filtered={total_filtered}, written={total_written}"
+        f"✅ Candidates written to {dest} | processed={stats.processed}, "
+        f"cached_skipped={stats.cached_skipped}, stale={stats.stale}, "
+        f"filtered={stats.filtered}, written={stats.written}"
     )
+    print(f"   {cache.stats()}")
+    if stats.requests:
+        units = max(1, stats.processed - stats.cached_skipped)
+        print(
+            f"   requests={stats.requests} prompt_tokens={stats.prompt_tokens} "
+            f"completion_tokens={stats.completion_tokens} "
+            f"per_unit={(stats.prompt_tokens + stats.completion_tokens) / units:.1f} tokens"
+        )
+    if changes is not None:
+        print(
+            f"   manifest: added={len(changes['added'])} changed={len(changes['changed'])} "
+            f"removed={len(changes['removed'])} (deleted {removed_rows} rows)"
+        )
+    if args.pack > 1:
+        print(f"   pack={args.pack} fallbacks={stats.pack_fallbacks}")
+    if stats.first_sentence_s:
+        fs = sorted(stats.first_sentence_s)
+        print(
+            f"   stream: first sentence p50={fs[len(fs) // 2] * 1000:.0f}ms "
+            f"p95={fs[min(len(fs) - 1, int(0.95 * len(fs)))] * 1000:.0f}ms over {len(fs)} early stops"
+        )
+    generated = stats.processed - stats.cached_skipped
+    elapsed = time.perf_counter() - started
+    if generated > 0 and elapsed > 0:
+        backend = "mock" if args.mock else ("batch" if args.batch else args.backend)
+        print(
+            f"   throughput ({backend}): {generated / elapsed:.2f} units/s, "
+            f"{stats.completion_tokens / elapsed:.1f} completion tok/s, "
+            f"{(stats.prompt_tokens + stats.completion_tokens) / elapsed:.1f} total tok/s over {elapsed:.1f}s"
+        )
+    if scheduler is not None:
+        print(f"   {scheduler.summary()}")
 
 
 if __name__ == "__main__":
     main()
-
-
@@ -8,6 +8,31 @@ Output: clusters.jsonl with clusters of near-duplicate paraphrases.
 
 By default uses a mock embedding backend (deterministic hash-based vectors).
 Optionally supports sentence-transformers if installed.
+
+Exact duplicate texts are collapsed first (text_prefilter.py); only one
+survivor per group is embedded and clustered, and every cluster is expanded
+back to all its members. The prefilter line reports the group sizes (the
+heaviest text's copy count).
+
+This is not identical to clustering every copy. Greedy labelling puts an
+item in the lowest-numbered cluster holding any neighbour. A later copy's
+neighbours also include items placed between the two copies, which may sit in
+a lower-numbered cluster than the first copy. With the prefilter, every copy
+always joins the first copy's cluster; --no-prefilter clusters every copy
+on its own and reproduces the pre-prefilter output exactly.
+--near-dup-distance also folds SimHash near duplicates, each kept only if its
+embedding is within --threshold of its survivor's.
+
+--exact (default) compares every pair in blocks; --ann compares each item only
+against the k-means lists it probes (an IVF index, ann_index.py) and prints its
+edge recall against brute force on a sample of rows. Both feed the same greedy
+labelling. At 100k items --ann took 6.8s against 67s for --exact with 99.8%
+edge recall; on a few thousand items the exact pass takes seconds and misses
+nothing, so it stays the default.
+
+--incremental adds only candidates whose lesson_id is not in the existing
+clusters file (-o) yet, keeping every cluster_id stable, and writes
+<clusters>.delta.jsonl for review (see cluster_index.py).
 """
 
 import argparse
@@ -15,10 +40,43 @@ import json
 import math
 import os
 import sys
+import time
 import hashlib
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Tuple, Dict, Iterable, Optional
+from typing import List, Tuple, Dict, Iterable, Optional, Set
+
+import numpy as np
+
+from ann_index import DEFAULT_PROBE, ann_edges, edge_recall
+from cluster_engine import (
+    DEFAULT_BLOCK_SIZE,
+    assign_to_clusters,
+    greedy_cluster,
+    greedy_labels_from_edges,
+    labels_to_clusters,
+)
+from cluster_index import (
+    ClusterIndex,
+    default_delta_path,
+    default_index_path,
+    load_cluster_rows,
+    load_index,
+    save_index,
+    sync_labels,
+    write_cluster_rows,
+    write_delta,
+)
+from embedding_cache import EmbeddingCache, add_cache_args
+from text_prefilter import (
+    DEFAULT_NEAR_DUP_DISTANCE,
+    DEFAULT_NEAR_DUP_JACCARD,
+    expand_clusters,
+    normalize,
+    prefilter,
+    split_near,
+    summary,
+)
 
 
 def resolve_repo_root() -> Path:
@@ -35,10 +93,6 @@ def l2_normalize(vec: List[float]) -> List[float]:
     return [v / s for v in vec] if s > 0 else vec
 
 
-def cos_sim(a: List[float], b: List[float]) -> float:
-    return sum(x * y for x, y in zip(a, b))
-
-
 def hash_to_vec(text: str, dim: int = 384) -> List[float]:
     """Deterministic pseudo-embedding from text via repeated MD5 hashing.
 
@@ -77,41 +131,59 @@ def load_candidates(path: Path, limit: Optional[int]) -> List[Candidate]:
     return items
 
 
-def embed_texts(texts: List[str], model_name: str, mock: bool) -> List[List[float]]:
+def embed_texts(
+    texts: List[str], model_name: str, mock: bool, cache_dir: Optional[Path] = None
+) -> np.ndarray:
     if mock:
-        return [hash_to_vec(t) for t in texts]
+        return np.asarray([hash_to_vec(t) for t in texts], dtype=np.float32)
 
     try:
         # Lazy import to avoid mandatory dependency
-        from sentence_transformers import SentenceTransformer  # type: ignore
+        import sentence_transformers  # type: ignore  # noqa: F401
     except Exception as e:
         raise RuntimeError(
             "sentence-transformers not available. Install it or pass --mock"
         ) from e
 
-    model = SentenceTransformer(model_name)
-    emb = model.encode(texts, normalize_embeddings=True, show_progress_bar=False)
-    return [list(map(float, v)) for v in emb]
+    cache = EmbeddingCache(cache_dir, model_name)
+    emb = cache.encode(texts)
+    print(cache.stats())
+    return emb
 
 
-def cluster_candidates(candidates: List[Candidate], embeddings: List[List[float]], threshold: float) -> List[List[int]]:
+def cluster_candidates(
+    candidates: List[Candidate],
+    embeddings: np.ndarray,
+    threshold: float,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> List[List[int]]:
     """Greedy single-linkage: assign item to first cluster with any member ≥ threshold.
     Returns list of clusters as lists of indices into `candidates`.
-    Deterministic given input order.
+    Deterministic given input order. See cluster_engine.greedy_cluster.
     """
-    clusters: List[List[int]] = []
-    for i, emb in enumerate(embeddings):
-        placed = False
-        for cluster in clusters:
-            # compute max sim vs cluster members
-            sim = max(cos_sim(emb, embeddings[j]) for j in cluster)
-            if sim >= threshold:
-                cluster.append(i)
-                placed = True
-                break
-        if not placed:
-            clusters.append([i])
-    return clusters
+    return greedy_cluster(embeddings, threshold, block_size=block_size)
+
+
+def cluster_candidates_ann(
+    candidates: List[Candidate],
+    embeddings: np.ndarray,
+    threshold: float,
+    n_lists: Optional[int] = None,
+    n_probe: int = DEFAULT_PROBE,
+    recall_sample: int = 0,
+) -> List[List[int]]:
+    """Same greedy labelling as cluster_candidates(), over IVF edges instead of all pairs."""
+    t0 = time.time()
+    rows, cols, _sims = ann_edges(embeddings, threshold, n_lists=n_lists, n_probe=n_probe)
+    print(f"ann: {len(rows)} edges ≥ {threshold} among {len(candidates)} items in {time.time() - t0:.1f}s")
+    if recall_sample > 0:
+        rep = edge_recall(embeddings, rows, cols, threshold, sample=recall_sample)
+        print(
+            f"ann recall vs exact over {int(rep['rows'])} sampled rows: "
+            f"edges {int(rep['found_edges'])}/{int(rep['exact_edges'])} ({rep['edge_recall']:.2%}), "
+            f"rows with every edge found {rep['row_recall']:.2%}"
+        )
+    return labels_to_clusters(greedy_labels_from_edges(len(candidates), rows, cols))
 
 
 def write_clusters(path: Path, candidates: List[Candidate], clusters: List[List[int]]) -> int:
@@ -130,6 +202,140 @@ def write_clusters(path: Path, candidates: List[Candidate], clusters: List[List[
     return count
 
 
+def embed_survivors(
+    candidates: List[Candidate], args: argparse.Namespace
+) -> Tuple[Optional[list], List[Candidate], np.ndarray]:
+    """Prefilter (unless disabled) and embed one text per group → (groups, survivors, embeddings).
+
+    Near-duplicate folds are confirmed by embedding: a folded text whose
+    cosine to its survivor is below --threshold becomes its own group.
+    """
+    texts = [c.text for c in candidates]
+    cache_dir = None if args.no_embed_cache else args.embed_cache
+    if args.no_prefilter:
+        return None, candidates, embed_texts(texts, args.model_name, args.mock, cache_dir)
+    groups = prefilter(texts, args.near_dup_distance, args.near_dup_jaccard)
+    embeddings = embed_texts([texts[g.survivor] for g in groups], args.model_name, args.mock, cache_dir)
+    heads = [(pos, h) for pos, g in enumerate(groups) for h in g.near_heads()]
+    if heads:
+        head_emb = embed_texts([texts[h] for _pos, h in heads], args.model_name, args.mock, cache_dir)
+        sims = np.einsum("ij,ij->i", head_emb, embeddings[[pos for pos, _h in heads]])
+        rejected = {h for (_pos, h), sim in zip(heads, sims.tolist()) if sim < args.threshold}
+        if rejected:
+            row_of = {g.survivor: embeddings[pos] for pos, g in enumerate(groups)}
+            row_of.update((h, head_emb[k]) for k, (_pos, h) in enumerate(heads))
+            groups = split_near(groups, rejected)
+            embeddings = np.stack([row_of[g.survivor] for g in groups]).astype(np.float32)
+            print(f"prefilter: {len(rejected)} near duplicates below --threshold {args.threshold} split back out")
+    print(summary(len(texts), groups))
+    return groups, [candidates[g.survivor] for g in groups], embeddings
+
+
+def index_model(args: argparse.Namespace) -> str:
+    return "mock" if args.mock else args.model_name
+
+
+def cluster_incremental(
+    candidates: List[Candidate], out_path: Path, index_path: Path, args: argparse.Namespace
+) -> None:
+    """Assign candidates not yet in out_path to its clusters (or new ones), keeping cluster_ids."""
+    if not out_path.exists():
+        raise SystemExit(f"--incremental needs an existing clusters file: {out_path}")
+    rows = load_cluster_rows(out_path)
+    known = {m["lesson_id"] for r in rows for m in r["candidates"]}
+    fresh = [c for c in candidates if c.lesson_id not in known]
+    if not fresh:
+        print(f"No new candidates; {out_path} unchanged.")
+        return
+
+    index = load_index(index_path)
+    if index is not None and index.threshold is not None and not math.isclose(index.threshold, args.threshold):
+        raise SystemExit(
+            f"{out_path} was clustered at --threshold {index.threshold}, not {args.threshold}; "
+            "pass the same threshold or run without --incremental"
+        )
+    uncovered: Set[int] = set()
+    if index is not None and index.model == index_model(args):
+        # 04_merge_clusters.py edits the clusters file only; follow its cluster_ids
+        index, relabelled, dropped, uncovered = sync_labels(index, rows)
+        if relabelled or dropped:
+            print(f"Member index {index_path}: {relabelled} rows relabelled, {dropped} dropped to match {out_path}")
+    if index is None or index.model != index_model(args) or uncovered:
+        # Rebuild from the clusters file itself (the embedding cache makes this cheap)
+        if index is None:
+            why = "missing"
+        elif index.model != index_model(args):
+            why = f"built with {index.model}"
+        else:
+            why = f"has no members of {len(uncovered)} clusters"
+        print(f"Member index {index_path} {why}; re-embedding {len(known)} clustered texts")
+        members = [(int(r["cluster_id"]), m) for r in rows for m in r["candidates"]]
+        index = ClusterIndex(
+            embeddings=embed_texts(
+                [m["text"] for _cid, m in members],
+                args.model_name,
+                args.mock,
+                None if args.no_embed_cache else args.embed_cache,
+            ),
+            labels=np.asarray([cid for cid, _m in members], dtype=np.int64),
+            lesson_ids=[m["lesson_id"] for _cid, m in members],
+            model=index_model(args),
+        )
+    index.threshold = args.threshold
+
+    assigned: List[Tuple[int, int]] = []  # (index into fresh, cluster_id)
+    rest = list(range(len(fresh)))
+    if not args.no_prefilter:
+        # Exact copies of clustered texts join that cluster, as in a full run's prefilter
+        by_text: Dict[str, int] = {}
+        for r in rows:
+            for m in r["candidates"]:
+                by_text.setdefault(normalize(m["text"]), int(r["cluster_id"]))
+        rest = []
+        for i, c in enumerate(fresh):
+            cid = by_text.get(normalize(c.text))
+            if cid is None:
+                rest.append(i)
+            else:
+                assigned.append((i, cid))
+
+    embeddings = np.zeros((0, index.embeddings.shape[1]), dtype=np.float32)
+    labels: List[int] = []
+    survivors: List[Candidate] = []
+    if rest:
+        groups, survivors, embeddings = embed_survivors([fresh[i] for i in rest], args)
+        next_id = max((int(r["cluster_id"]) for r in rows), default=-1) + 1
+        labels = assign_to_clusters(
+            index.embeddings, index.labels, embeddings, args.threshold, next_id, block_size=args.block_size
+        ).tolist()
+        if groups is None:
+            assigned.extend(zip(rest, labels))
+        else:
+            assigned.extend((rest[i], labels[g]) for g, grp in enumerate(groups) for i in grp.members)
+
+    by_id = {int(r["cluster_id"]): r for r in rows}
+    added: Dict[int, List[dict]] = {}
+    new_ids: List[int] = []
+    for i, cid in sorted(assigned):
+        member = {"lesson_id": fresh[i].lesson_id, "text": fresh[i].text}
+        if cid not in by_id:
+            by_id[cid] = {"cluster_id": cid, "candidates": []}
+            rows.append(by_id[cid])
+            new_ids.append(cid)
+        by_id[cid]["candidates"].append(member)
+        added.setdefault(cid, []).append(member)
+
+    write_cluster_rows(out_path, rows)
+    save_index(index_path, index.extend(embeddings, labels, [c.lesson_id for c in survivors]))
+    delta_path = default_delta_path(out_path)
+    touched = write_delta(delta_path, rows, added, new_ids)
+    print(
+        f"✅ Added {len(fresh)} candidates to {out_path}: "
+        f"{len(new_ids)} new clusters, {touched - len(new_ids)} grown ({len(rows)} total)"
+    )
+    print(f"✅ Wrote {touched} changed clusters to {delta_path}")
+
+
 def main() -> None:
     repo_root = resolve_repo_root()
 
@@ -139,7 +345,69 @@ def main() -> None:
     parser.add_argument("--model-name", default="all-mpnet-base-v2")
     parser.add_argument("--threshold", type=float, default=0.88)
     parser.add_argument("--limit", type=int, default=None, help="Process only first N candidates")
+    parser.add_argument(
+        "--block-size",
+        type=int,
+        default=DEFAULT_BLOCK_SIZE,
+        help="Rows per similarity block (bounds peak memory to ~block_size² floats)",
+    )
+    backend = parser.add_mutually_exclusive_group()
+    backend.add_argument("--exact", dest="ann", action="store_false", help="Compare every pair (default)")
+    backend.add_argument(
+        "--ann",
+        dest="ann",
+        action="store_true",
+        help="Find neighbours with an IVF index (approximate; ~10x faster than --exact at 100k items)",
+    )
+    parser.set_defaults(ann=False)
+    parser.add_argument("--ann-lists", type=int, default=None, help="IVF k-means lists (default: sqrt of item count)")
+    parser.add_argument(
+        "--ann-probe",
+        type=int,
+        default=DEFAULT_PROBE,
+        help="IVF lists each item searches (higher = more recall, proportionally slower)",
+    )
+    parser.add_argument(
+        "--recall-sample",
+        type=int,
+        default=1000,
+        help="With --ann, rows brute-forced to report edge recall (0 = skip)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Add only candidates not yet in the existing -o clusters file; cluster_ids stay stable",
+    )
+    parser.add_argument(
+        "--index",
+        default=None,
+        help="Member embedding index (default: <out>.index.npz, written on every run)",
+    )
     parser.add_argument("--mock", action="store_true", help="Use deterministic mock embeddings")
+    parser.add_argument(
+        "--no-prefilter",
+        action="store_true",
+        help=(
+            "Embed and cluster every copy of duplicate texts (the pre-prefilter behaviour; with the "
+            "prefilter every copy joins its first copy's cluster)"
+        ),
+    )
+    parser.add_argument(
+        "--near-dup-distance",
+        type=int,
+        default=-1,
+        help=(
+            "Max SimHash bit distance for near duplicates, each confirmed by cosine ≥ --threshold "
+            f"(default -1 = exact duplicates only; {DEFAULT_NEAR_DUP_DISTANCE} folds one-word swaps)"
+        ),
+    )
+    parser.add_argument(
+        "--near-dup-jaccard",
+        type=float,
+        default=DEFAULT_NEAR_DUP_JACCARD,
+        help="Min word-set Jaccard to confirm a near duplicate",
+    )
+    add_cache_args(parser)
     args = parser.parse_args()
 
     in_path = resolve_path(repo_root, args.in_file)
@@ -151,9 +419,29 @@ def main() -> None:
         print("No candidates to cluster.")
         return
 
-    texts = [c.text for c in candidates]
-    embeddings = embed_texts(texts, args.model_name, args.mock)
-    clusters = cluster_candidates(candidates, embeddings, args.threshold)
+    index_path = resolve_path(repo_root, args.index) if args.index else default_index_path(out_path)
+    if args.incremental:
+        if args.ann:
+            raise SystemExit("--incremental compares only the new candidates and does not use --ann")
+        cluster_incremental(candidates, out_path, index_path, args)
+        return
+
+    groups, survivors, embeddings = embed_survivors(candidates, args)
+    if args.ann:
+        clusters = cluster_candidates_ann(
+            survivors, embeddings, args.threshold, args.ann_lists, args.ann_probe, args.recall_sample
+        )
+    else:
+        clusters = cluster_candidates(survivors, embeddings, args.threshold, block_size=args.block_size)
+    labels = np.empty(len(survivors), dtype=np.int64)
+    for cid, idxs in enumerate(clusters):
+        labels[idxs] = cid
+    save_index(
+        index_path,
+        ClusterIndex(embeddings, labels, [c.lesson_id for c in survivors], index_model(args), args.threshold),
+    )
+    if groups is not None:
+        clusters = expand_clusters(clusters, groups)
     total = write_clusters(out_path, candidates, clusters)
     print(f"✅ Wrote {total} clusters to {out_path}")
 
@@ -12,7 +12,10 @@ the "text" field only. Output mirrors 02_cluster_duplicates.py format:
 
 Notes:
 - Deterministic greedy single-linkage by cosine similarity, given input order
+  (vectorized via cluster_engine.py)
 - Embeddings: mock (MD5-hash-based) by default; sentence-transformers optional
+- --thresholds lo:hi:step sweeps many thresholds from one embedding + similarity
+  pass; each output matches a single --threshold run at that value
 """
 
 from __future__ import annotations
@@ -25,6 +28,11 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional
 
+import numpy as np
+
+from cluster_engine import DEFAULT_BLOCK_SIZE, cluster_summary, greedy_cluster, sweep_thresholds
+from embedding_cache import EmbeddingCache, add_cache_args
+
 
 def resolve_repo_root() -> Path:
     # utils/Scripts/ → parents[2] should be the workspace root
@@ -41,10 +49,6 @@ def l2_normalize(vec: List[float]) -> List[float]:
     return [v / s for v in vec] if s > 0 else vec
 
 
-def cos_sim(a: List[float], b: List[float]) -> float:
-    return sum(x * y for x, y in zip(a, b))
-
-
 def hash_to_vec(text: str, dim: int = 384) -> List[float]:
     digest = hashlib.md5(text.strip().lower().encode("utf-8")).digest()
     vec: List[float] = []
@@ -85,33 +89,27 @@ def load_rows(path: Path) -> List[Candidate]:
     return rows
 
 
-def embed_texts(texts: List[str], *, model_name: str, mock: bool) -> List[List[float]]:
+def embed_texts(
+    texts: List[str], *, model_name: str, mock: bool, cache_dir: Optional[Path] = None
+) -> np.ndarray:
     if mock:
-        return [hash_to_vec(t) for t in texts]
+        return np.asarray([hash_to_vec(t) for t in texts], dtype=np.float32)
     try:
-        from sentence_transformers import SentenceTransformer  # type: ignore
+        import sentence_transformers  # type: ignore  # noqa: F401
     except Exception as e:
         raise RuntimeError(
             "sentence-transformers not available. Install it or pass --mock"
         ) from e
-    model = SentenceTransformer(model_name)
-    emb = model.encode(texts, normalize_embeddings=True, show_progress_bar=False)
-    return [list(map(float, v)) for v in emb]
-
-
-def greedy_single_linkage(embeddings: List[List[float]], threshold: float) -> List[List[int]]:
-    clusters: List[List[int]] = []
-    for i, emb in enumerate(embeddings):
-        placed = False
-        for cluster in clusters:
-            sim = max(cos_sim(emb, embeddings[j]) for j in cluster)
-            if sim >= threshold:
-                cluster.append(i)
-                placed = True
-                break
-        if not placed:
-            clusters.append([i])
-    return clusters
+    cache = EmbeddingCache(cache_dir, model_name)
+    emb = cache.encode(texts)
+    print(cache.stats())
+    return emb
+
+
+def greedy_single_linkage(
+    embeddings: np.ndarray, threshold: float, block_size: int = DEFAULT_BLOCK_SIZE
+) -> List[List[int]]:
+    return greedy_cluster(embeddings, threshold, block_size=block_size)
 
 
 def write_clusters(path: Path, candidates: List[Candidate], clusters: List[List[int]]) -> int:
@@ -130,6 +128,49 @@ def write_clusters(path: Path, candidates: List[Candidate], clusters: List[List[
     return count
 
 
+def parse_thresholds(spec: str) -> List[float]:
+    """Parse "lo:hi:step" (inclusive) or a comma list like "0.82,0.84"."""
+    if ":" in spec:
+        parts = spec.split(":")
+        if len(parts) != 3:
+            raise SystemExit("--thresholds range must be lo:hi:step (e.g., 0.78:0.90:0.01)")
+        lo, hi, step = (float(x) for x in parts)
+        if step <= 0 or hi < lo:
+            raise SystemExit("--thresholds requires lo <= hi and step > 0")
+        count = int(round((hi - lo) / step)) + 1
+        values = [round(lo + k * step, 6) for k in range(count)]
+    else:
+        values = [round(float(x.strip()), 6) for x in spec.split(",") if x.strip()]
+    # Repeats in a comma list would write the same file twice
+    return list(dict.fromkeys(values))
+
+
+def threshold_decimals(thresholds: Iterable[float]) -> int:
+    """Fewest decimals (at least 2) that show every threshold exactly."""
+    values = list(thresholds)
+    for decimals in range(2, 7):
+        if all(round(t, decimals) == t for t in values):
+            return decimals
+    return 6
+
+
+def threshold_suffix(threshold: float, decimals: int = 2) -> str:
+    # 0.82 → "_th0p82", matching clusters_B_recluster_st_th0p82.jsonl; 0.055 → "_th0p055"
+    return "_th" + f"{threshold:.{decimals}f}".replace(".", "p")
+
+
+def write_sweep_summary(path: Path, rows: List[Dict[str, object]], decimals: int = 2) -> None:
+    lines = [
+        "| threshold | clusters | singletons | max_size | file |",
+        "|---:|---:|---:|---:|---|",
+    ]
+    for r in rows:
+        lines.append(
+            f"| {r['threshold']:.{decimals}f} | {r['clusters']} | {r['singletons']} | {r['max_size']} | {r['file']} |"
+        )
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
 def parse_args() -> argparse.Namespace:
     repo_root = resolve_repo_root()
     default_in = repo_root / "utils/Scripts/outputs/clusters_humanpass1.jsonl"
@@ -140,7 +181,20 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("-o", "--out-file", default=str(default_out))
     p.add_argument("--model-name", default="all-mpnet-base-v2")
     p.add_argument("--threshold", type=float, default=0.83)
+    p.add_argument(
+        "--thresholds",
+        default=None,
+        help="Sweep mode: lo:hi:step or comma list (e.g., 0.78:0.90:0.01). Embeds once and "
+        "writes one <out>_thXpYY.jsonl per threshold plus <out>_sweep.md",
+    )
     p.add_argument("--mock", action="store_true", help="Use deterministic mock embeddings")
+    add_cache_args(p)
+    p.add_argument(
+        "--block-size",
+        type=int,
+        default=DEFAULT_BLOCK_SIZE,
+        help="Rows per similarity block (bounds peak memory to ~block_size² floats)",
+    )
     return p.parse_args()
 
 
@@ -157,8 +211,36 @@ def main() -> None:
         return
 
     texts = [c.text for c in candidates]
-    embeddings = embed_texts(texts, model_name=args.model_name, mock=args.mock)
-    clusters = greedy_single_linkage(embeddings, threshold=args.threshold)
+    embeddings = embed_texts(
+        texts,
+        model_name=args.model_name,
+        mock=args.mock,
+        cache_dir=None if args.no_embed_cache else args.embed_cache,
+    )
+
+    if args.thresholds:
+        thresholds = parse_thresholds(args.thresholds)
+        if not thresholds:
+            raise SystemExit("--thresholds produced no values")
+        decimals = threshold_decimals(thresholds)
+        suffixes = [threshold_suffix(th, decimals) for th in thresholds]
+        if len(set(suffixes)) != len(suffixes):
+            raise SystemExit(f"--thresholds values collide in file names: {suffixes}")
+        by_threshold = sweep_thresholds(embeddings, thresholds, block_size=args.block_size)
+        summary: List[Dict[str, object]] = []
+        print(f"{'threshold':>9}  {'clusters':>8}  {'singletons':>10}  {'max_size':>8}")
+        for th, suffix in zip(thresholds, suffixes):
+            th_path = out_path.with_name(f"{out_path.stem}{suffix}{out_path.suffix}")
+            write_clusters(th_path, candidates, by_threshold[th])
+            stats = cluster_summary(by_threshold[th])
+            summary.append({"threshold": th, **stats, "file": th_path.name})
+            print(f"{th:>9.{decimals}f}  {stats['clusters']:>8}  {stats['singletons']:>10}  {stats['max_size']:>8}")
+        summary_path = out_path.with_name(f"{out_path.stem}_sweep.md")
+        write_sweep_summary(summary_path, summary, decimals)
+        print(f"✅ Wrote {len(thresholds)} clusterings; summary → {summary_path}")
+        return
+
+    clusters = greedy_single_linkage(embeddings, threshold=args.threshold, block_size=args.block_size)
     total = write_clusters(out_path, candidates, clusters)
     print(f"✅ Wrote {total} clusters to {out_path}")
 
@@ -24,6 +24,30 @@ Examples:
   python utils/Scripts/04_merge_clusters.py \
     -i input.jsonl -o output.jsonl \
     --merge 100,108 --target-id 200 --dedupe
+
+Batch plans apply many merges in one read and one write:
+
+  {"dedupe": true, "groups": [
+     {"merge": [12, 37, 45]},
+     {"merge": [100, 108], "target_id": 200, "dedupe": false}
+  ]}
+
+  python utils/Scripts/04_merge_clusters.py -i input.jsonl -o output.jsonl \
+    --plan merge_plan.json --reindex
+
+Groups must not share cluster IDs, and a target ID must not collide with a
+cluster that stays. Every plan run writes an undo log (<output>.undo.jsonl by
+default) holding each group's original clusters. To revert groups 2 and 5 of
+that run, without replaying the others:
+
+  python utils/Scripts/04_merge_clusters.py -i output.jsonl -o output.jsonl \
+    --undo output.undo.jsonl --undo-groups 2,5
+
+An undo run writes a new undo log for its own output (--undo-log, default
+<output>.undo.jsonl) holding the groups it left merged, in that output's ID
+space, so further groups can be reverted from it later.
+
+suggest_merges.py writes plans in this format.
 """
 
 from __future__ import annotations
@@ -31,7 +55,8 @@ from __future__ import annotations
 import argparse
 import json
 from pathlib import Path
-from typing import Dict, List, Any, Tuple
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Tuple
 
 
 def resolve_repo_root() -> Path:
@@ -128,6 +153,175 @@ def reindex_clusters(clusters: Dict[int, List[Dict[str, Any]]]) -> Dict[int, Lis
     return reindexed
 
 
+@dataclass
+class MergeGroup:
+    merge_ids: List[int]
+    target_id: Optional[int] = None
+    dedupe: bool = False
+
+    @property
+    def target(self) -> int:
+        return self.target_id if self.target_id is not None else min(self.merge_ids)
+
+
+def read_plan(path: Path, default_dedupe: bool) -> List[MergeGroup]:
+    """Plan JSON: {"dedupe": bool, "groups": [{"merge": [ids], "target_id"?: int, "dedupe"?: bool}]}
+    (a bare list of groups is accepted too)."""
+    obj = json.loads(path.read_text(encoding="utf-8"))
+    if isinstance(obj, list):
+        obj = {"groups": obj}
+    dedupe = bool(obj.get("dedupe", default_dedupe))
+    groups: List[MergeGroup] = []
+    for n, g in enumerate(obj.get("groups", []), start=1):
+        if not isinstance(g, dict) or not isinstance(g.get("merge"), list):
+            raise ValueError(f"Plan group {n}: expected {{\"merge\": [ids, ...]}}")
+        target = g.get("target_id")
+        groups.append(MergeGroup(
+            merge_ids=[int(x) for x in g["merge"]],
+            target_id=int(target) if target is not None else None,
+            dedupe=bool(g.get("dedupe", dedupe)),
+        ))
+    return groups
+
+
+def validate_plan(clusters: Dict[int, List[Dict[str, Any]]], groups: List[MergeGroup]) -> None:
+    """Reject the whole plan before touching anything: every problem is reported at once."""
+    errors: List[str] = []
+    owner: Dict[int, int] = {}
+    for n, g in enumerate(groups, start=1):
+        if len(set(g.merge_ids)) < 2:
+            errors.append(f"group {n}: needs at least two distinct cluster IDs")
+        elif len(set(g.merge_ids)) != len(g.merge_ids):
+            errors.append(f"group {n}: repeats a cluster ID")
+        missing = [cid for cid in g.merge_ids if cid not in clusters]
+        if missing:
+            errors.append(f"group {n}: cluster IDs not found: {missing}")
+        for cid in g.merge_ids:
+            if cid in owner and owner[cid] != n:
+                errors.append(f"group {n}: cluster {cid} is already merged by group {owner[cid]}")
+            owner.setdefault(cid, n)
+    targets: Dict[int, int] = {}
+    for n, g in enumerate(groups, start=1):
+        tgt = g.target
+        if tgt in targets:
+            errors.append(f"group {n}: target_id {tgt} is also the target of group {targets[tgt]}")
+        targets.setdefault(tgt, n)
+        if tgt in clusters and owner.get(tgt) is None:
+            errors.append(f"group {n}: target_id {tgt} is an existing cluster outside the plan")
+        elif tgt in owner and owner[tgt] != n:
+            errors.append(f"group {n}: target_id {tgt} belongs to group {owner[tgt]}")
+    if errors:
+        raise ValueError("Invalid merge plan:\n  " + "\n  ".join(errors))
+
+
+def apply_plan(
+    clusters: Dict[int, List[Dict[str, Any]]], groups: List[MergeGroup]
+) -> Dict[int, List[Dict[str, Any]]]:
+    """All merges in one pass over a validated plan (same result as merge_clusters() per group)."""
+    merged_away = {cid for g in groups for cid in g.merge_ids}
+    out = {cid: cands for cid, cands in clusters.items() if cid not in merged_away}
+    for g in groups:
+        out[g.target] = merge_clusters(
+            {cid: clusters[cid] for cid in g.merge_ids}, g.merge_ids, target_id=g.target, dedupe=g.dedupe
+        )[g.target]
+    return out
+
+
+def default_undo_path(out_path: Path) -> Path:
+    return out_path.with_name(out_path.stem + ".undo.jsonl")
+
+
+def write_undo_log(
+    path: Path,
+    in_path: Path,
+    out_path: Path,
+    clusters: Dict[int, List[Dict[str, Any]]],
+    groups: List[MergeGroup],
+    id_map: Optional[Dict[int, int]],
+) -> None:
+    """Header (incl. the reindex map, old id → written id) + one line per group with its originals."""
+    entries = [
+        {
+            "type": "group",
+            "group": n,
+            "target_id": g.target,
+            "originals": [{"cluster_id": cid, "candidates": clusters[cid]} for cid in sorted(g.merge_ids)],
+        }
+        for n, g in enumerate(groups, start=1)
+    ]
+    write_undo_entries(path, in_path, out_path, entries, id_map)
+
+
+def write_undo_entries(
+    path: Path,
+    in_path: Path,
+    out_path: Path,
+    entries: List[Dict[str, Any]],
+    id_map: Optional[Dict[int, int]],
+) -> None:
+    """Undo log for out_path; id_map maps the plan's (pre-reindex) IDs to those written."""
+    with path.open("w", encoding="utf-8") as f:
+        f.write(json.dumps({
+            "type": "header",
+            "in_file": str(in_path),
+            "out_file": str(out_path),
+            "reindexed": id_map is not None,
+            "id_map": {str(k): v for k, v in id_map.items()} if id_map is not None else None,
+        }) + "\n")
+        for entry in entries:
+            tgt = int(entry["target_id"])
+            f.write(json.dumps(
+                {**entry, "written_id": id_map[tgt] if id_map is not None else tgt}, ensure_ascii=False
+            ) + "\n")
+
+
+def undo_groups(
+    clusters: Dict[int, List[Dict[str, Any]]], undo_path: Path, group_numbers: List[int]
+) -> Tuple[Dict[int, List[Dict[str, Any]]], List[Dict[str, Any]]]:
+    """Split the given plan groups back into their original clusters.
+
+    If the plan run reindexed, the whole file is first mapped back to the
+    pre-reindex IDs (which the originals use); pass --reindex to compact again.
+    Returns (clusters in the pre-reindex ID space, log entries of the groups
+    still merged).
+    """
+    header: Dict[str, Any] = {}
+    logged: Dict[int, Dict[str, Any]] = {}
+    with undo_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            obj = json.loads(line)
+            if obj.get("type") == "header":
+                header = obj
+            else:
+                logged[int(obj["group"])] = obj
+    unknown = [n for n in group_numbers if n not in logged]
+    if unknown:
+        raise KeyError(f"Groups not in {undo_path}: {unknown}")
+
+    if header.get("reindexed"):
+        back = {int(new): int(old) for old, new in header["id_map"].items()}
+        missing = [cid for cid in clusters if cid not in back]
+        if missing:
+            raise ValueError(f"Clusters not written by the logged run (cannot map back): {missing[:10]}")
+        clusters = {back[cid]: cands for cid, cands in clusters.items()}
+    out = dict(clusters)
+    for n in group_numbers:
+        entry = logged[n]
+        tgt = int(entry["target_id"])
+        if tgt not in out:
+            raise KeyError(f"Group {n}: merged cluster {tgt} is not in the input")
+        del out[tgt]
+        for orig in entry["originals"]:
+            cid = int(orig["cluster_id"])
+            if cid in out:
+                raise ValueError(f"Group {n}: cluster {cid} already exists; was the group undone before?")
+            out[cid] = orig["candidates"]
+    undone = set(group_numbers)
+    return out, [logged[n] for n in sorted(logged) if n not in undone]
+
+
 def parse_args() -> argparse.Namespace:
     repo_root = resolve_repo_root()
     default_in = repo_root / "utils/Scripts/outputs/clusters_B_recluster_st_th0p82.jsonl"
@@ -136,18 +330,30 @@ def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Merge specified clusters in a JSONL file")
     p.add_argument("-i", "--in-file", default=str(default_in))
     p.add_argument("-o", "--out-file", default=str(default_out))
-    p.add_argument(
+    mode = p.add_mutually_exclusive_group(required=True)
+    mode.add_argument(
         "--merge",
-        required=True,
         help="Comma-separated cluster IDs to merge (e.g., 12,37,45)",
     )
+    mode.add_argument("--plan", help="JSON merge plan with many groups, applied in one pass")
+    mode.add_argument("--undo", help="Undo log of a --plan run; reverts the groups in --undo-groups")
+    p.add_argument("--undo-groups", default=None, help="Comma-separated plan group numbers to revert (with --undo)")
+    p.add_argument(
+        "--undo-log",
+        default=None,
+        help="Where a --plan or --undo run writes its undo log (default: <output>.undo.jsonl)",
+    )
     p.add_argument(
         "--target-id",
         type=int,
         default=None,
         help="Optional target cluster_id for the merged cluster (default: min of inputs)",
     )
-    p.add_argument("--dedupe", action="store_true", help="Dedupe merged candidates by text")
+    p.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Dedupe merged candidates by text (with --plan: default for groups without their own flag)",
+    )
     p.add_argument(
         "--reindex",
         action="store_true",
@@ -164,6 +370,36 @@ def main() -> None:
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
     clusters = read_clusters(in_path)
+    if args.plan:
+        groups = read_plan(resolve_path(repo_root, args.plan), args.dedupe)
+        validate_plan(clusters, groups)
+        merged = apply_plan(clusters, groups)
+        id_map = None
+        if args.reindex:
+            id_map = {old: new for new, old in enumerate(sorted(merged))}
+            merged = reindex_clusters(merged)
+        undo_path = resolve_path(repo_root, args.undo_log) if args.undo_log else default_undo_path(out_path)
+        total = write_clusters(out_path, merged)
+        write_undo_log(undo_path, in_path, out_path, clusters, groups, id_map)
+        print(f"✅ Wrote {total} clusters to {out_path} ({len(groups)} merge groups)")
+        print(f"✅ Wrote undo log to {undo_path}")
+        return
+    if args.undo:
+        if not args.undo_groups:
+            raise SystemExit("--undo needs --undo-groups (e.g. 2,5)")
+        numbers = [int(x.strip()) for x in str(args.undo_groups).split(",") if x.strip()]
+        restored, remaining = undo_groups(clusters, resolve_path(repo_root, args.undo), numbers)
+        id_map = None
+        if args.reindex:
+            id_map = {old: new for new, old in enumerate(sorted(restored))}
+            restored = reindex_clusters(restored)
+        undo_path = resolve_path(repo_root, args.undo_log) if args.undo_log else default_undo_path(out_path)
+        total = write_clusters(out_path, restored)
+        write_undo_entries(undo_path, in_path, out_path, remaining, id_map)
+        print(f"✅ Wrote {total} clusters to {out_path} (reverted groups {', '.join(map(str, numbers))})")
+        print(f"✅ Wrote undo log for the {len(remaining)} groups still merged to {undo_path}")
+        return
+
     merge_ids = [int(x.strip()) for x in str(args.merge).split(",") if x.strip()]
     merged = merge_clusters(clusters, merge_ids, target_id=args.target_id, dedupe=args.dedupe)
     if args.reindex:
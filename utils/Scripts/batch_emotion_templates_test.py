@@ -25,7 +25,9 @@ from pathlib import Path
 from typing import List, Tuple, Dict
 
 import numpy as np
-from sentence_transformers import CrossEncoder, SentenceTransformer
+from sentence_transformers import CrossEncoder
+
+from embedding_cache import EmbeddingCache, add_cache_args, cache_from_args
 
 # ---------- Emotion wheel: all 72 leaf nodes ----------
 
@@ -152,8 +154,8 @@ def load_index(npz_path: Path):
     return emb, ids, texts, model
 
 
-def retrieve_e5(query: str, emb: np.ndarray, st_model: SentenceTransformer, topk: int) -> List[Tuple[int, float]]:
-    q_vec = st_model.encode(["query: " + query], normalize_embeddings=True)[0].astype("float32")
+def retrieve_e5(query: str, emb: np.ndarray, st_model: EmbeddingCache, topk: int) -> List[Tuple[int, float]]:
+    q_vec = st_model.encode([query], prefix="query: ")[0]
     scores = emb @ q_vec
     idx = np.argsort(-scores)[:topk]
     return [(int(i), float(scores[i])) for i in idx]
@@ -208,6 +210,7 @@ def main() -> None:
     p.add_argument("--ce", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
     p.add_argument("--out-dir", type=Path,
                     default=Path(__file__).resolve().parent / "outputs")
+    add_cache_args(p)
     args = p.parse_args()
 
     args.out_dir.mkdir(parents=True, exist_ok=True)
@@ -216,7 +219,7 @@ def main() -> None:
 
     print("Loading models...")
     emb, ids, texts, model_name = load_index(args.emb)
-    st = SentenceTransformer(model_name)
+    st = cache_from_args(args, model_name)
     ce = CrossEncoder(args.ce)
 
     units_path = Path(__file__).resolve().parent.parent.parent / \
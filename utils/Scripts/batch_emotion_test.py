@@ -15,7 +15,9 @@ from pathlib import Path
 from typing import List, Tuple
 
 import numpy as np
-from sentence_transformers import CrossEncoder, SentenceTransformer
+from sentence_transformers import CrossEncoder
+
+from embedding_cache import EmbeddingCache, add_cache_args, cache_from_args
 
 # ---------- Emotion wheel: all 72 leaf nodes ----------
 
@@ -115,8 +117,8 @@ def load_index(npz_path: Path):
     return emb, ids, texts, model
 
 
-def retrieve_e5(query: str, emb: np.ndarray, st_model: SentenceTransformer, topk: int) -> List[Tuple[int, float]]:
-    q_vec = st_model.encode(["query: " + query], normalize_embeddings=True)[0].astype("float32")
+def retrieve_e5(query: str, emb: np.ndarray, st_model: EmbeddingCache, topk: int) -> List[Tuple[int, float]]:
+    q_vec = st_model.encode([query], prefix="query: ")[0]
     scores = emb @ q_vec
     idx = np.argsort(-scores)[:topk]
     return [(int(i), float(scores[i])) for i in idx]
@@ -137,6 +139,7 @@ def main() -> None:
     p.add_argument("--ce", default="cross-encoder/ms-marco-MiniLM-L-6-v2", help="CrossEncoder model")
     p.add_argument("--out-dir", type=Path,
                     default=Path(__file__).resolve().parent / "outputs")
+    add_cache_args(p)
     args = p.parse_args()
 
     args.out_dir.mkdir(parents=True, exist_ok=True)
@@ -149,7 +152,7 @@ def main() -> None:
     print(f"  {emb.shape[0]} lessons, dim={emb.shape[1]}, model={model_name}")
 
     print("Loading E5 retriever...")
-    st = SentenceTransformer(model_name)
+    st = cache_from_args(args, model_name)
 
     print("Loading CrossEncoder reranker...")
     ce = CrossEncoder(args.ce)
@@ -5,12 +5,13 @@ import argparse
 import hashlib
 import os
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 
+from embedding_cache import add_cache_args, cache_from_args
+
 
 MODEL_NAME = "intfloat/e5-small-v2"
 
@@ -36,6 +37,29 @@ def compute_hash(lines: List[str]) -> str:
     return h.hexdigest()
 
 
+def line_hash(line: str) -> str:
+    return hashlib.sha256(line.encode("utf-8")).hexdigest()
+
+
+def reusable_rows(existing: dict) -> Dict[str, np.ndarray]:
+    """Map per-line hash → stored vector from a previous build of the same model.
+
+    Older indexes without `line_hashes` are hashed from their `texts`.
+    """
+    if not existing or "embeddings" not in existing:
+        return {}
+    if "model" in existing and str(existing["model"]) != MODEL_NAME:
+        return {}
+    emb = np.asarray(existing["embeddings"], dtype=np.float32)
+    if "line_hashes" in existing:
+        hashes = [str(h) for h in existing["line_hashes"]]
+    else:
+        hashes = [line_hash(str(t)) for t in existing.get("texts", [])]
+    if len(hashes) != emb.shape[0]:
+        return {}
+    return {h: emb[i] for i, h in enumerate(hashes)}
+
+
 def maybe_load_existing(npz_path: Path) -> Tuple[dict, bool]:
     if not npz_path.exists():
         return {}, False
@@ -54,6 +78,12 @@ def main() -> None:
     )
     parser.add_argument("--batch-size", type=int, default=64)
     parser.add_argument("--skip-if-unchanged", action="store_true", help="Skip rebuild if lessons hash matches")
+    parser.add_argument(
+        "--full-rebuild",
+        action="store_true",
+        help="Re-encode every line: no reuse from the existing .npz and no embedding cache (implies --no-embed-cache)",
+    )
+    add_cache_args(parser)
     args = parser.parse_args()
 
     lessons = read_lessons(args.lessons_path)
@@ -83,21 +113,36 @@ def main() -> None:
     except Exception:
         pass
 
-    # Load model
-    model = SentenceTransformer(MODEL_NAME)
-
-    # Prefix per E5
-    passages = [f"passage: {t}" for t in lessons]
-
-    emb = model.encode(
-        passages,
-        normalize_embeddings=True,
-        batch_size=args.batch_size,
-        show_progress_bar=True,
-    )
-
-    if emb.dtype != np.float32:
-        emb = emb.astype(np.float32)
+    # Reuse vectors for lines whose content hash is already in the index,
+    # wherever they moved to; only new or edited lines are encoded.
+    hashes = [line_hash(t) for t in lessons]
+    previous = {} if args.full_rebuild else reusable_rows(existing)
+    todo = [i for i, h in enumerate(hashes) if h not in previous]
+
+    # Model is loaded lazily, only if some lessons are not in the embedding cache.
+    # A full rebuild must not serve (possibly stale) cached vectors either.
+    if args.full_rebuild:
+        args.no_embed_cache = True
+    encoder = cache_from_args(args, MODEL_NAME)
+
+    fresh = None
+    if todo:
+        # Prefix per E5
+        fresh = encoder.encode(
+            [lessons[i] for i in todo],
+            prefix="passage: ",
+            batch_size=args.batch_size,
+            show_progress_bar=True,
+        )
+        print(encoder.stats())
+    dim = fresh.shape[1] if fresh is not None else next(iter(previous.values())).shape[0]
+    emb = np.empty((len(lessons), dim), dtype=np.float32)
+    for i, h in enumerate(hashes):
+        if h in previous:
+            emb[i] = previous[h]
+    if fresh is not None:
+        emb[todo] = fresh
+    print(f"Reused {len(lessons) - len(todo)} unchanged lines; encoded {len(todo)} new/changed")
 
     # IDs: sequential indices 0..N-1 (stable across unchanged order)
     ids = np.arange(len(lessons), dtype=np.int32)
@@ -112,6 +157,7 @@ def main() -> None:
         model=MODEL_NAME,
         source=str(args.lessons_path),
         hash=lessons_hash,
+        line_hashes=np.array(hashes),
     )
 
     print(f"Embedded {len(lessons)} lessons → {npz_path}")
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+candidate_store.py — indexed, crash-safe store behind candidates.jsonl.
+
+01_generate_candidates.py used to re-parse the whole candidates.jsonl on every
+run and flush after every row. The store keeps the rows in a SQLite (WAL) table
+indexed by unit, so opening it costs the same at 100 rows or 100k, and writes
+are group-committed (every N rows or T ms, fsync'd by synchronous=FULL); a
+kill -9 loses at most the uncommitted group, never half a line.
+
+candidates.jsonl stays the interchange format for 02/05/06: each committed
+group is appended to it (fsync'd) and the file is byte-identical to what the
+old append-only writer produced — rows in insertion order, each exactly
+json.dumps(row, ensure_ascii=False) + "\\n". The store records the exported
+size and mtime; on open:
+  - no store yet / JSONL edited or replaced  → (re)import the JSONL
+  - JSONL = last export + part of the rows committed after it
+                                             → interrupted append, re-export
+
+  python utils/Scripts/candidate_store.py export <store> -o candidates.jsonl
+  python utils/Scripts/candidate_store.py stats <store>
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+
+UnitKey = Tuple[int, int, int]
+
+DEFAULT_COMMIT_ROWS = 32
+DEFAULT_COMMIT_MS = 500.0
+
+
+def default_store_path(jsonl_path: Path) -> Path:
+    return jsonl_path.with_name(jsonl_path.name + ".store.sqlite")
+
+
+def row_key(row: dict) -> UnitKey:
+    unit = row.get("unit", {})
+    return int(unit["chapter"]), int(unit["start"]), int(unit["end"])
+
+
+def fsync_append(path: Path, text: str) -> int:
+    with path.open("a", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    return path.stat().st_size
+
+
+class CandidateStore:
+    """Unit-keyed candidate rows; `key in store`, `store[key]` (latest row), `store.add(row)`."""
+
+    def __init__(
+        self,
+        path: Path,
+        jsonl_path: Optional[Path] = None,
+        commit_rows: int = DEFAULT_COMMIT_ROWS,
+        commit_ms: float = DEFAULT_COMMIT_MS,
+    ) -> None:
+        self.path = path
+        self.jsonl_path = jsonl_path
+        self.commit_rows = max(1, commit_rows)
+        self.commit_ms = max(0.0, commit_ms)
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        self._needs_rewrite = False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fresh = not path.exists()
+        self._db = sqlite3.connect(str(path), isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS candidates ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " chapter INTEGER NOT NULL, start INTEGER NOT NULL, end INTEGER NOT NULL,"
+            " prompt_key TEXT,"
+            " line TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS candidates_unit ON candidates (chapter, start, end, seq);"
+            "CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT NOT NULL);"
+        )
+        if jsonl_path is not None:
+            self._sync_with_jsonl(fresh)
+        self._db.execute("BEGIN")
+
+    # ---- meta / JSONL sync ----
+
+    def _meta(self, k: str) -> Optional[str]:
+        row = self._db.execute("SELECT v FROM meta WHERE k = ?", (k,)).fetchone()
+        return None if row is None else str(row[0])
+
+    def _set_meta(self, k: str, v: object) -> None:
+        self._db.execute("INSERT OR REPLACE INTO meta (k, v) VALUES (?, ?)", (k, str(v)))
+
+    def _max_seq(self) -> int:
+        return int(self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM candidates").fetchone()[0])
+
+    def _sync_with_jsonl(self, fresh: bool) -> None:
+        assert self.jsonl_path is not None
+        exported = self._meta("exported_size")
+        st = self.jsonl_path.stat() if self.jsonl_path.exists() else None
+        if fresh or exported is None:
+            self._import_jsonl()
+            return
+        if st is None:
+            self._rewrite_jsonl()
+            return
+        same = st.st_size == int(exported) and str(st.st_mtime_ns) == self._meta("exported_mtime_ns")
+        if same:
+            return
+        if st.st_size > int(exported) and self._is_interrupted_append(int(exported)):
+            # Killed between the JSONL append and recording it: the store has every row
+            print(f"Re-exporting {self.jsonl_path} from {self.path} (interrupted append)", file=sys.stderr)
+            self._rewrite_jsonl()
+        else:
+            print(f"{self.jsonl_path} changed outside the store; re-importing it", file=sys.stderr)
+            self._import_jsonl()
+
+    def _is_interrupted_append(self, exported_size: int) -> bool:
+        """True if the bytes past the last export are a prefix of the unexported store rows."""
+        assert self.jsonl_path is not None
+        with self.jsonl_path.open("rb") as f:
+            f.seek(exported_size)
+            tail = f.read()
+        since = int(self._meta("exported_seq") or 0)
+        expected = "".join(
+            str(r[0]) + "\n"
+            for r in self._db.execute("SELECT line FROM candidates WHERE seq > ? ORDER BY seq", (since,))
+        ).encode("utf-8")
+        return expected.startswith(tail)
+
+    def _import_jsonl(self) -> None:
+        assert self.jsonl_path is not None
+        self._db.execute("BEGIN")
+        self._db.execute("DELETE FROM candidates")
+        if self.jsonl_path.exists():
+            with self.jsonl_path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    line = line.rstrip("\n")
+                    row = json.loads(line)
+                    self._insert(row, line)
+        self._db.execute("COMMIT")
+        self._rewrite_jsonl()
+
+    def _record_export(self, seq: int) -> None:
+        assert self.jsonl_path is not None
+        st = self.jsonl_path.stat()
+        self._db.execute("BEGIN")
+        self._set_meta("exported_seq", seq)
+        self._set_meta("exported_size", st.st_size)
+        self._set_meta("exported_mtime_ns", st.st_mtime_ns)
+        self._db.execute("COMMIT")
+
+    def _rewrite_jsonl(self) -> None:
+        """Atomically rewrite the JSONL export from the store."""
+        assert self.jsonl_path is not None
+        self.jsonl_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.jsonl_path.with_name(self.jsonl_path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for line in self.iter_lines():
+                f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.jsonl_path)
+        self._record_export(self._max_seq())
+
+    def _append_jsonl(self) -> None:
+        assert self.jsonl_path is not None
+        since = int(self._meta("exported_seq") or 0)
+        lines = [
+            str(r[0])
+            for r in self._db.execute("SELECT line FROM candidates WHERE seq > ? ORDER BY seq", (since,))
+        ]
+        if not lines:
+            return
+        fsync_append(self.jsonl_path, "".join(line + "\n" for line in lines))
+        self._record_export(self._max_seq())
+
+    # ---- rows ----
+
+    def _insert(self, row: dict, line: str) -> None:
+        self._db.execute(
+            "INSERT INTO candidates (chapter, start, end, prompt_key, line) VALUES (?, ?, ?, ?, ?)",
+            row_key(row) + (row.get("prompt_key"), line),
+        )
+
+    def get(self, key: UnitKey) -> Optional[dict]:
+        """Latest row for the unit (the old load_existing kept the last one too)."""
+        r = self._db.execute(
+            "SELECT line FROM candidates WHERE chapter = ? AND start = ? AND end = ? ORDER BY seq DESC LIMIT 1",
+            key,
+        ).fetchone()
+        return None if r is None else json.loads(r[0])
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, tuple) and self._db.execute(
+            "SELECT 1 FROM candidates WHERE chapter = ? AND start = ? AND end = ? LIMIT 1", key
+        ).fetchone() is not None
+
+    def __getitem__(self, key: UnitKey) -> dict:
+        row = self.get(key)
+        if row is None:
+            raise KeyError(key)
+        return row
+
+    def __len__(self) -> int:
+        return int(self._db.execute("SELECT COUNT(*) FROM candidates").fetchone()[0])
+
+    def unit_count(self) -> int:
+        return int(self._db.execute("SELECT COUNT(*) FROM (SELECT DISTINCT chapter, start, end FROM candidates)").fetchone()[0])
+
+    def add(self, row: dict) -> None:
+        self._insert(row, json.dumps(row, ensure_ascii=False))
+        self._pending += 1
+        if self._pending >= self.commit_rows or (time.monotonic() - self._last_commit) * 1000.0 >= self.commit_ms:
+            self.commit()
+
+    def drop_superseded(self, current: Dict[UnitKey, str]) -> int:
+        """Delete rows for units in `current` whose prompt_key is not the current one."""
+        dropped = 0
+        for key, prompt_key in current.items():
+            cur = self._db.execute(
+                "DELETE FROM candidates WHERE chapter = ? AND start = ? AND end = ?"
+                " AND (prompt_key IS NULL OR prompt_key != ?)",
+                key + (prompt_key,),
+            )
+            dropped += cur.rowcount
+        if dropped:
+            self._needs_rewrite = True
+        return dropped
+
+    def delete(self, keys: Iterable[UnitKey]) -> int:
+        """Delete every row of the given units (e.g. windows removed from units.jsonl)."""
+        deleted = 0
+        for key in keys:
+            deleted += self._db.execute(
+                "DELETE FROM candidates WHERE chapter = ? AND start = ? AND end = ?", key
+            ).rowcount
+        if deleted:
+            self._needs_rewrite = True
+        return deleted
+
+    def commit(self) -> None:
+        """Commit the current group (fsync via WAL), then append it to the JSONL export."""
+        self._db.execute("COMMIT")
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        if self.jsonl_path is not None:
+            if self._needs_rewrite:
+                self._rewrite_jsonl()
+                self._needs_rewrite = False
+            else:
+                self._append_jsonl()
+        self._db.execute("BEGIN")
+
+    def iter_lines(self) -> Iterator[str]:
+        for r in self._db.execute("SELECT line FROM candidates ORDER BY seq"):
+            yield str(r[0])
+
+    def close(self) -> None:
+        self.commit()
+        self._db.execute("COMMIT")
+        self._db.close()
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Inspect or export a candidate store")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    e = sub.add_parser("export", help="Write the store's rows as JSONL")
+    e.add_argument("store", type=Path)
+    e.add_argument("-o", "--out-file", type=Path, required=True)
+    s = sub.add_parser("stats", help="Row counts")
+    s.add_argument("store", type=Path)
+    args = p.parse_args()
+
+    store = CandidateStore(args.store)
+    if args.cmd == "export":
+        n = 0
+        with args.out_file.open("w", encoding="utf-8") as f:
+            for line in store.iter_lines():
+                f.write(line + "\n")
+                n += 1
+        print(f"✅ Wrote {n} rows to {args.out_file}")
+    else:
+        print(f"rows={len(store)} units={store.unit_count()}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
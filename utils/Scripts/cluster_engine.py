@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+cluster_engine.py — shared NumPy clustering engine for the candidate pipeline.
+
+Used by 02_cluster_duplicates.py and 03_recluster_from_humanpass.py.
+
+Embeddings are held as one float32 matrix (rows L2-normalized, so cosine = dot).
+Similarities are computed in fixed-size blocks of the lower triangle, so peak
+memory is O(block_size²) regardless of corpus size; only pairs at or above the
+threshold are kept, as a sparse edge list.
+
+Clustering reproduces the original greedy single-linkage exactly: items are
+visited in input order and each joins the FIRST existing cluster (in creation
+order) that has any member with cosine ≥ threshold, else starts a new cluster.
+Because cluster labels are assigned in creation order, "first cluster" is just
+the minimum label among an item's earlier neighbours.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+
+DEFAULT_BLOCK_SIZE = 1024
+
+
+def as_matrix(embeddings: Sequence[Sequence[float]] | np.ndarray) -> np.ndarray:
+    """Return embeddings as a C-contiguous float32 (N, D) matrix."""
+    mat = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32))
+    if mat.ndim != 2:
+        raise ValueError(f"Expected a 2-D embedding matrix, got shape {mat.shape}")
+    return mat
+
+
+def iter_similarity_blocks(
+    emb: np.ndarray, block_size: int = DEFAULT_BLOCK_SIZE
+) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """Yield (row_start, col_start, sims) for every lower-triangular block.
+
+    `sims` is emb[row_start:row_start+B] @ emb[col_start:col_start+B].T with
+    col_start ≤ row_start; callers must still mask col ≥ row on diagonal blocks.
+    """
+    n = emb.shape[0]
+    bs = max(1, int(block_size))
+    for r0 in range(0, n, bs):
+        rows = emb[r0:r0 + bs]
+        for c0 in range(0, r0 + 1, bs):
+            yield r0, c0, rows @ emb[c0:c0 + bs].T
+
+
+def threshold_edges(
+    emb: np.ndarray, threshold: float, block_size: int = DEFAULT_BLOCK_SIZE
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return all pairs (i, j) with j < i and cos(i, j) ≥ threshold.
+
+    Output is three parallel arrays (rows, cols, sims), int64/int64/float32.
+    """
+    emb = as_matrix(emb)
+    rows_out: List[np.ndarray] = []
+    cols_out: List[np.ndarray] = []
+    sims_out: List[np.ndarray] = []
+    for r0, c0, sims in iter_similarity_blocks(emb, block_size):
+        mask = sims >= np.float32(threshold)
+        if r0 == c0:
+            # Diagonal block: keep strictly-lower entries only (j < i)
+            mask &= np.tri(*sims.shape, k=-1, dtype=bool)
+        ri, ci = np.nonzero(mask)
+        if ri.size == 0:
+            continue
+        rows_out.append(ri.astype(np.int64) + r0)
+        cols_out.append(ci.astype(np.int64) + c0)
+        sims_out.append(sims[ri, ci].astype(np.float32))
+    if not rows_out:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty.copy(), np.empty(0, dtype=np.float32)
+    return np.concatenate(rows_out), np.concatenate(cols_out), np.concatenate(sims_out)
+
+
+def greedy_labels_from_edges(n: int, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Greedy-first-cluster labelling over a sparse edge list.
+
+    Edges must satisfy cols < rows. Returns an int64 label per item; labels
+    are numbered 0..K-1 in cluster creation order.
+    """
+    labels = np.full(n, -1, dtype=np.int64)
+    order = np.argsort(rows, kind="stable")
+    rows = np.asarray(rows)[order]
+    cols = np.asarray(cols)[order]
+    indptr = np.searchsorted(rows, np.arange(n + 1), side="left")
+    next_label = 0
+    for i in range(n):
+        lo, hi = indptr[i], indptr[i + 1]
+        if hi > lo:
+            labels[i] = labels[cols[lo:hi]].min()
+        else:
+            labels[i] = next_label
+            next_label += 1
+    return labels
+
+
+def labels_to_clusters(labels: np.ndarray) -> List[List[int]]:
+    """Group item indices by label, clusters ordered by label, members by index."""
+    k = int(labels.max()) + 1 if labels.size else 0
+    clusters: List[List[int]] = [[] for _ in range(k)]
+    for idx, lab in enumerate(labels.tolist()):
+        clusters[lab].append(idx)
+    return clusters
+
+
+def greedy_cluster(
+    embeddings: Sequence[Sequence[float]] | np.ndarray,
+    threshold: float,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> List[List[int]]:
+    """Deterministic greedy single-linkage over L2-normalized embeddings.
+
+    Returns clusters as lists of row indices, identical to
+    greedy_single_linkage_reference() given the same input order.
+    """
+    emb = as_matrix(embeddings)
+    rows, cols, _sims = threshold_edges(emb, threshold, block_size)
+    return labels_to_clusters(greedy_labels_from_edges(emb.shape[0], rows, cols))
+
+
+def assign_to_clusters(
+    base: Sequence[Sequence[float]] | np.ndarray,
+    base_labels: Sequence[int] | np.ndarray,
+    new: Sequence[Sequence[float]] | np.ndarray,
+    threshold: float,
+    next_label: int,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> np.ndarray:
+    """Continue a greedy clustering with new rows appended after `base`.
+
+    Each new row takes the minimum label among its neighbours ≥ threshold in
+    base and in the new rows before it, else a fresh label from next_label.
+    Base labels never change, and the result equals greedy_cluster() over
+    base + new whenever base_labels came from greedy_cluster(). Only
+    new × (base + new) similarities are computed.
+    """
+    base = as_matrix(base)
+    new = as_matrix(new)
+    base_labels = np.asarray(base_labels, dtype=np.int64)
+    nb, nn = base.shape[0], new.shape[0]
+    bs = max(1, int(block_size))
+    th = np.float32(threshold)
+    labels = np.full(nn, -1, dtype=np.int64)
+    # First label reachable in base, per new row
+    from_base = np.full(nn, np.iinfo(np.int64).max, dtype=np.int64)
+    for r0 in range(0, nn, bs):
+        rows = new[r0:r0 + bs]
+        for c0 in range(0, nb, bs):
+            ri, ci = np.nonzero(rows @ base[c0:c0 + bs].T >= th)
+            if ri.size:
+                np.minimum.at(from_base, ri + r0, base_labels[ci + c0])
+    rows_nn, cols_nn, _sims = threshold_edges(new, threshold, block_size)
+    order = np.argsort(rows_nn, kind="stable")
+    rows_nn, cols_nn = rows_nn[order], cols_nn[order]
+    indptr = np.searchsorted(rows_nn, np.arange(nn + 1), side="left")
+    for i in range(nn):
+        best = int(from_base[i])
+        lo, hi = indptr[i], indptr[i + 1]
+        if hi > lo:
+            best = min(best, int(labels[cols_nn[lo:hi]].min()))
+        if best == np.iinfo(np.int64).max:
+            best = next_label
+            next_label += 1
+        labels[i] = best
+    return labels
+
+
+def sweep_thresholds(
+    embeddings: Sequence[Sequence[float]] | np.ndarray,
+    thresholds: Sequence[float],
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> Dict[float, List[List[int]]]:
+    """Cluster at many thresholds from a single similarity pass.
+
+    Builds the edge list once at the lowest threshold and sorts it by
+    similarity (descending); each threshold then uses the prefix of edges at
+    or above it. Every threshold's clustering is identical to a separate
+    greedy_cluster() run at that threshold.
+    """
+    emb = as_matrix(embeddings)
+    if not thresholds:
+        return {}
+    rows, cols, sims = threshold_edges(emb, min(thresholds), block_size)
+    order = np.argsort(-sims, kind="stable")
+    rows, cols = rows[order], cols[order]
+    neg_sorted = -sims[order]
+    out: Dict[float, List[List[int]]] = {}
+    for th in sorted(thresholds, reverse=True):
+        # Same float32 comparison as threshold_edges(): sim >= float32(th)
+        k = int(np.searchsorted(neg_sorted, -np.float32(th), side="right"))
+        out[th] = labels_to_clusters(greedy_labels_from_edges(emb.shape[0], rows[:k], cols[:k]))
+    return out
+
+
+def cluster_centroids(emb: np.ndarray, starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Normalized centroid and medoid row of every cluster.
+
+    Rows of cluster c are emb[starts[c]:starts[c+1]] (every cluster non-empty).
+    The medoid is the member with the highest summed similarity to its cluster,
+    i.e. argmax of row · (sum of the cluster's rows).
+    """
+    emb = as_matrix(emb)
+    k = len(starts) - 1
+    sums = np.add.reduceat(emb, starts[:-1], axis=0)
+    norms = np.linalg.norm(sums, axis=1, keepdims=True)
+    centroids = sums / np.maximum(norms, np.float32(1e-12))
+    owner = np.repeat(np.arange(k), np.diff(starts))
+    score = np.einsum("ij,ij->i", emb, sums[owner])
+    order = np.lexsort((-score, owner))
+    return centroids.astype(np.float32), order[starts[:-1]]
+
+
+def cluster_blocks(starts: np.ndarray, block_size: int) -> List[Tuple[int, int]]:
+    """Consecutive cluster ranges [c0, c1) of roughly block_size member rows each
+    (whole clusters only; a cluster larger than block_size gets a range of its own)."""
+    k = len(starts) - 1
+    out: List[Tuple[int, int]] = []
+    c0 = 0
+    while c0 < k:
+        c1 = int(np.searchsorted(starts, starts[c0] + max(1, int(block_size)), side="right")) - 1
+        c1 = min(max(c1, c0 + 1), k)
+        out.append((c0, c1))
+        c0 = c1
+    return out
+
+
+def top_cluster_pairs(
+    emb: np.ndarray,
+    starts: np.ndarray,
+    centroids: np.ndarray,
+    top_k: int,
+    min_score: float = -1.0,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> List[Tuple[float, int, int, float, float]]:
+    """Best cross-cluster pairs as (score, a, b, centroid_sim, max_member_sim), a < b.
+
+    score = (centroid_sim + max_member_sim) / 2. Members are tiled on both axes
+    into blocks of whole clusters (roughly block_size rows each), so a tile's
+    similarity matrix is about block_size × block_size whatever N is. Each tile's
+    member similarities are max-reduced to clusters on both axes, the centroid
+    similarities come from the same cluster ranges, and a running top_k is kept
+    across tiles. Only tiles on or above the diagonal are computed.
+    """
+    emb = as_matrix(emb)
+    blocks = cluster_blocks(starts, block_size)
+    best_scores = np.empty(0, dtype=np.float32)
+    best_pairs = np.empty((0, 2), dtype=np.int64)
+    best_parts = np.empty((0, 2), dtype=np.float32)
+    for bi, (c0, c1) in enumerate(blocks):
+        r0, r1 = starts[c0], starts[c1]
+        row_starts = starts[c0:c1] - r0
+        for d0, d1 in blocks[bi:]:
+            s0, s1 = starts[d0], starts[d1]
+            sims = emb[r0:r1] @ emb[s0:s1].T
+            member = np.maximum.reduceat(np.maximum.reduceat(sims, starts[d0:d1] - s0, axis=1), row_starts, axis=0)
+            cent = centroids[c0:c1] @ centroids[d0:d1].T
+            score = (cent + member) / 2
+            if d0 == c0:
+                # Diagonal tile: each pair once, never a cluster with itself
+                score[np.arange(c1 - c0)[:, None] >= np.arange(d1 - d0)[None, :]] = -np.inf
+            flat = score.ravel()
+            take = min(top_k, int(np.isfinite(flat).sum()))
+            if not take:
+                continue
+            idx = np.argpartition(-flat, take - 1)[:take]
+            idx = idx[flat[idx] >= min_score]
+            a, b = np.divmod(idx, d1 - d0)
+            best_scores = np.concatenate([best_scores, flat[idx]])
+            best_pairs = np.concatenate([best_pairs, np.stack([a + c0, b + d0], axis=1)])
+            best_parts = np.concatenate([best_parts, np.stack([cent[a, b], member[a, b]], axis=1)])
+            if len(best_scores) > top_k:
+                keep = np.argpartition(-best_scores, top_k - 1)[:top_k]
+                best_scores, best_pairs, best_parts = best_scores[keep], best_pairs[keep], best_parts[keep]
+    order = np.lexsort((best_pairs[:, 1], best_pairs[:, 0], -best_scores)) if len(best_scores) else []
+    return [
+        (float(best_scores[i]), int(best_pairs[i, 0]), int(best_pairs[i, 1]),
+         float(best_parts[i, 0]), float(best_parts[i, 1]))
+        for i in order
+    ]
+
+
+def cluster_summary(clusters: List[List[int]]) -> Dict[str, int]:
+    sizes = [len(c) for c in clusters]
+    return {
+        "clusters": len(sizes),
+        "singletons": sum(1 for s in sizes if s == 1),
+        "max_size": max(sizes) if sizes else 0,
+    }
+
+
+def greedy_single_linkage_reference(embeddings: List[List[float]], threshold: float) -> List[List[int]]:
+    """Original pure-Python implementation, kept for parity checks."""
+    def cos_sim(a: List[float], b: List[float]) -> float:
+        return sum(x * y for x, y in zip(a, b))
+
+    clusters: List[List[int]] = []
+    for i, emb in enumerate(embeddings):
+        placed = False
+        for cluster in clusters:
+            sim = max(cos_sim(emb, embeddings[j]) for j in cluster)
+            if sim >= threshold:
+                cluster.append(i)
+                placed = True
+                break
+        if not placed:
+            clusters.append([i])
+    return clusters
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+cluster_index.py — persisted member embeddings behind clusters.jsonl, and review deltas.
+
+02_cluster_duplicates.py writes <clusters>.index.npz next to every clusters
+file: the embedding of each clustered text (one per prefilter group), its
+cluster_id and lesson_id, the embedding model and the clustering threshold.
+With --incremental, 02 loads the clusters file and this index, embeds only
+candidates whose lesson_id is not clustered yet, and continues the greedy
+clustering from where it stopped (cluster_engine.assign_to_clusters):
+
+  existing clusters keep their cluster_id and members; new members are appended
+  new clusters are numbered after the largest existing cluster_id
+  <clusters>.delta.jsonl lists only the touched clusters, for reviewers
+
+humanpass files keyed by cluster_id stay valid across incremental runs.
+
+The clusters file is the source of truth: 04_merge_clusters.py (--merge,
+--reindex, --dedupe) edits it without touching the index, so sync_labels()
+relabels every index row from the file's lesson_id → cluster_id map and drops
+rows whose lesson is gone before anything is assigned.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+def default_index_path(clusters: Path) -> Path:
+    return clusters.with_name(clusters.stem + ".index.npz")
+
+
+def default_delta_path(clusters: Path) -> Path:
+    return clusters.with_name(clusters.stem + ".delta.jsonl")
+
+
+@dataclass
+class ClusterIndex:
+    embeddings: np.ndarray  # float32 (N, D), L2-normalized
+    labels: np.ndarray  # int64 (N,) cluster_id of each row
+    lesson_ids: List[str]
+    model: str
+    threshold: Optional[float] = None  # None: written before the threshold was recorded
+
+    def extend(self, embeddings: np.ndarray, labels: np.ndarray, lesson_ids: List[str]) -> "ClusterIndex":
+        return ClusterIndex(
+            embeddings=np.concatenate([self.embeddings, np.asarray(embeddings, dtype=np.float32)]),
+            labels=np.concatenate([self.labels, np.asarray(labels, dtype=np.int64)]),
+            lesson_ids=self.lesson_ids + list(lesson_ids),
+            model=self.model,
+            threshold=self.threshold,
+        )
+
+
+def save_index(path: Path, index: ClusterIndex) -> None:
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez(
+        tmp,
+        embeddings=np.asarray(index.embeddings, dtype=np.float32),
+        labels=np.asarray(index.labels, dtype=np.int64),
+        lesson_ids=np.asarray(index.lesson_ids, dtype=str),
+        model=np.asarray(index.model),
+        threshold=np.asarray(np.nan if index.threshold is None else index.threshold, dtype=np.float64),
+    )
+    os.replace(tmp, path)
+
+
+def load_index(path: Path) -> Optional[ClusterIndex]:
+    if not path.exists():
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        threshold = float(data["threshold"]) if "threshold" in data.files else float("nan")
+        return ClusterIndex(
+            embeddings=data["embeddings"].astype(np.float32, copy=False),
+            labels=data["labels"].astype(np.int64, copy=False),
+            lesson_ids=data["lesson_ids"].tolist(),
+            model=str(data["model"]),
+            threshold=None if np.isnan(threshold) else threshold,
+        )
+
+
+def sync_labels(index: ClusterIndex, rows: List[dict]) -> Tuple[ClusterIndex, int, int, Set[int]]:
+    """Relabel index rows from the clusters file; drop rows whose lesson_id it no longer has.
+
+    Returns (index, relabelled, dropped, cluster_ids with no index row left).
+    """
+    file_map = {m["lesson_id"]: int(r["cluster_id"]) for r in rows for m in r["candidates"]}
+    keep: List[int] = []
+    labels: List[int] = []
+    for pos, lesson_id in enumerate(index.lesson_ids):
+        cid = file_map.get(lesson_id)
+        if cid is not None:
+            keep.append(pos)
+            labels.append(cid)
+    new_labels = np.asarray(labels, dtype=np.int64)
+    relabelled = int((index.labels[keep] != new_labels).sum()) if keep else 0
+    synced = ClusterIndex(
+        embeddings=index.embeddings[keep],
+        labels=new_labels,
+        lesson_ids=[index.lesson_ids[pos] for pos in keep],
+        model=index.model,
+        threshold=index.threshold,
+    )
+    uncovered = {int(r["cluster_id"]) for r in rows} - set(labels)
+    return synced, relabelled, len(index.lesson_ids) - len(keep), uncovered
+
+
+def load_cluster_rows(path: Path) -> List[dict]:
+    rows: List[dict] = []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                rows.append(json.loads(line))
+    return rows
+
+
+def write_cluster_rows(path: Path, rows: List[dict]) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+def write_delta(path: Path, rows: List[dict], added: Dict[int, List[dict]], new_ids: List[int]) -> int:
+    """One line per touched cluster: status new|grown, the added members and the new size."""
+    by_id = {int(r["cluster_id"]): r for r in rows}
+    fresh = set(new_ids)
+    with path.open("w", encoding="utf-8") as f:
+        for cid in sorted(added):
+            f.write(json.dumps({
+                "cluster_id": cid,
+                "status": "new" if cid in fresh else "grown",
+                "size": len(by_id[cid]["candidates"]),
+                "added": added[cid],
+            }, ensure_ascii=False) + "\n")
+    return len(added)
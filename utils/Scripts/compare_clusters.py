@@ -7,6 +7,16 @@ Outputs a Markdown summary including:
   - For cluster_ids present in both: texts added/removed
   - Texts that moved clusters (text -> cluster_id sets differ between files)
 
+--match content ignores cluster_ids (meaningless after --reindex or a
+recluster) and pairs clusters by their texts instead. An inverted index
+text → cluster on both sides yields the overlap of every cluster pair that
+shares at least one text, so the work is O(memberships), not O(|A|·|B|):
+
+  matched   mutual best Jaccard ≥ --min-jaccard (identical, or changed)
+  split     one A cluster is the majority source of 2+ B clusters
+  merge     one B cluster holds the majority of 2+ A clusters
+  moved     a text whose B cluster is none of the above counterparts of its A cluster
+
 Usage:
   python utils/Scripts/compare_clusters.py \
     --a "/Users/snehal/Desktop/Software Projects/Gita Project/clusters_1_4_8.jsonl" \
@@ -17,11 +27,12 @@ Usage:
 from __future__ import annotations
 
 import argparse
+import heapq
 import json
 from collections import defaultdict
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Iterable, List, Set, Tuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 
 @dataclass(frozen=True)
@@ -93,11 +104,13 @@ def render_markdown(
     b_by_text = clusters_by_text(clusters_b)
     texts_all = set(a_by_text.keys()) | set(b_by_text.keys())
     moved: List[Tuple[str, List[int], List[int]]] = []
-    for t in sorted(texts_all):
-        a_c = sorted(a_by_text.get(t, set()))
-        b_c = sorted(b_by_text.get(t, set()))
+    for t in texts_all:
+        a_c = a_by_text.get(t, set())
+        b_c = b_by_text.get(t, set())
         if a_c != b_c:
-            moved.append((t, a_c, b_c))
+            moved.append((t, sorted(a_c), sorted(b_c)))
+    # Only the differing texts need ordering
+    moved.sort(key=lambda m: m[0])
 
     lines: List[str] = []
     lines.append("## Cluster Comparison")
@@ -158,12 +171,210 @@ def render_markdown(
     return "\n".join(lines).rstrip() + "\n"
 
 
+@dataclass
+class ContentMatch:
+    matched: List[Tuple[int, int, float]]  # (A id, B id, Jaccard), mutual best
+    splits: List[Tuple[int, List[int]]]  # A id → B ids it was split into
+    merges: List[Tuple[int, List[int]]]  # B id ← A ids merged into it
+    moved: List[Tuple[str, int, int]]  # (text, A id, B id), unordered
+    only_a: List[str]  # texts in A only, unordered
+    only_b: List[str]
+    unmatched_a: List[int]  # A clusters with no counterpart at all
+    unmatched_b: List[int]
+
+
+def match_clusters(
+    texts_a: Dict[int, Set[str]], texts_b: Dict[int, Set[str]], min_jaccard: float = 0.5
+) -> ContentMatch:
+    """Pair clusters of A and B by text overlap, independent of cluster_id."""
+    index_b: Dict[str, List[int]] = defaultdict(list)
+    for cid, texts in texts_b.items():
+        for t in texts:
+            index_b[t].append(cid)
+    overlap: Dict[Tuple[int, int], int] = defaultdict(int)
+    only_a: List[str] = []
+    for ca, texts in texts_a.items():
+        for t in texts:
+            hits = index_b.get(t)
+            if not hits:
+                only_a.append(t)
+                continue
+            for cb in hits:
+                overlap[(ca, cb)] += 1
+    texts_in_a: Set[str] = set()
+    for texts in texts_a.values():
+        texts_in_a |= texts
+    only_b = [t for t in index_b if t not in texts_in_a]
+
+    best_a: Dict[int, Tuple[float, int]] = {}
+    best_b: Dict[int, Tuple[float, int]] = {}
+    majority_of_a: Dict[int, List[int]] = defaultdict(list)  # A id → B clusters mostly made of it
+    majority_in_b: Dict[int, List[int]] = defaultdict(list)  # B id → A clusters mostly inside it
+    for (ca, cb), ov in overlap.items():
+        na, nb = len(texts_a[ca]), len(texts_b[cb])
+        jac = ov / (na + nb - ov)
+        # Highest Jaccard wins; ties go to the smaller id so runs are deterministic
+        cur = best_a.get(ca)
+        if cur is None or jac > cur[0] or (jac == cur[0] and cb < cur[1]):
+            best_a[ca] = (jac, cb)
+        cur = best_b.get(cb)
+        if cur is None or jac > cur[0] or (jac == cur[0] and ca < cur[1]):
+            best_b[cb] = (jac, ca)
+        if 2 * ov > nb:
+            majority_of_a[ca].append(cb)
+        if 2 * ov > na:
+            majority_in_b[cb].append(ca)
+
+    splits = sorted((ca, sorted(cbs)) for ca, cbs in majority_of_a.items() if len(cbs) > 1)
+    merges = sorted((cb, sorted(cas)) for cb, cas in majority_in_b.items() if len(cas) > 1)
+    # Clusters in a split or merge are reported there, not as a 1:1 match
+    in_split_merge_a = {ca for ca, _ in splits} | {ca for _, cas in merges for ca in cas}
+    in_split_merge_b = {cb for _, cbs in splits for cb in cbs} | {cb for cb, _ in merges}
+    matched = sorted(
+        (ca, cb, jac)
+        for ca, (jac, cb) in best_a.items()
+        if jac >= min_jaccard
+        and best_b[cb][1] == ca
+        and ca not in in_split_merge_a
+        and cb not in in_split_merge_b
+    )
+
+    counterparts: Dict[int, Set[int]] = defaultdict(set)
+    for ca, cb, _j in matched:
+        counterparts[ca].add(cb)
+    for ca, cbs in splits:
+        counterparts[ca].update(cbs)
+    for cb, cas in merges:
+        for ca in cas:
+            counterparts[ca].add(cb)
+    moved: List[Tuple[str, int, int]] = []
+    for ca, texts in texts_a.items():
+        for t in texts:
+            for cb in index_b.get(t, ()):
+                if cb not in counterparts[ca]:
+                    moved.append((t, ca, cb))
+
+    touched_b = {cb for cbs in counterparts.values() for cb in cbs}
+    return ContentMatch(
+        matched=matched,
+        splits=splits,
+        merges=merges,
+        moved=moved,
+        only_a=only_a,
+        only_b=only_b,
+        unmatched_a=sorted(ca for ca in texts_a if not counterparts[ca]),
+        unmatched_b=sorted(cb for cb in texts_b if cb not in touched_b),
+    )
+
+
+def render_content_markdown(
+    name_a: str,
+    name_b: str,
+    clusters_a: Dict[int, List[Candidate]],
+    clusters_b: Dict[int, List[Candidate]],
+    limit_per_section: int = 50,
+    min_jaccard: float = 0.5,
+) -> str:
+    texts_a = texts_by_cluster(clusters_a)
+    texts_b = texts_by_cluster(clusters_b)
+    m = match_clusters(texts_a, texts_b, min_jaccard)
+    identical = sum(1 for _a, _b, j in m.matched if j == 1.0)
+    renumbered = sum(1 for a, b, _j in m.matched if a != b)
+    changed = [(a, b, j) for a, b, j in m.matched if j < 1.0]
+
+    def head(texts: Set[str]) -> str:
+        return min(texts) if texts else "—"
+
+    def more(lines: List[str], total: int, what: str) -> None:
+        if total > limit_per_section:
+            lines.append(f"- ... and {total - limit_per_section} more {what}")
+
+    lines: List[str] = []
+    lines.append("## Cluster Comparison (content matching)")
+    lines.append("")
+    lines.append(f"- Comparing: {name_a} (A) vs {name_b} (B)")
+    lines.append(f"- Total clusters: A={len(texts_a)}, B={len(texts_b)}")
+    lines.append(
+        f"- Matched (Jaccard ≥ {min_jaccard:g}): {len(m.matched)} "
+        f"(identical={identical}, changed={len(changed)}, renumbered={renumbered})"
+    )
+    lines.append(f"- Splits: {len(m.splits)}; merges: {len(m.merges)}")
+    lines.append(f"- Texts moved: {len(m.moved)}; only in A: {len(m.only_a)}; only in B: {len(m.only_b)}")
+    lines.append(f"- Clusters without counterpart: A={len(m.unmatched_a)}, B={len(m.unmatched_b)}")
+    lines.append("")
+
+    if changed:
+        lines.append(f"### Matched clusters with changes ({len(changed)})")
+        for a, b, j in changed[:limit_per_section]:
+            removed = texts_a[a] - texts_b[b]
+            added = texts_b[b] - texts_a[a]
+            lines.append(f"- A {a} → B {b} (Jaccard {j:.2f}; removed {len(removed)}, added {len(added)})")
+        more(lines, len(changed), "changed clusters")
+        lines.append("")
+
+    if m.splits:
+        lines.append(f"### Splits ({len(m.splits)})")
+        for a, bs in m.splits[:limit_per_section]:
+            lines.append(f"- A {a} → B {', '.join(map(str, bs))}: {head(texts_a[a])}")
+        more(lines, len(m.splits), "splits")
+        lines.append("")
+
+    if m.merges:
+        lines.append(f"### Merges ({len(m.merges)})")
+        for b, as_ in m.merges[:limit_per_section]:
+            lines.append(f"- A {', '.join(map(str, as_))} → B {b}: {head(texts_b[b])}")
+        more(lines, len(m.merges), "merges")
+        lines.append("")
+
+    if m.moved:
+        lines.append(f"### Texts moved ({len(m.moved)})")
+        # Order only the listed rows, not every moved text
+        for t, a, b in heapq.nsmallest(limit_per_section, m.moved):
+            lines.append(f"- {t}")
+            lines.append(f"  - A cluster {a} → B cluster {b}")
+        more(lines, len(m.moved), "texts moved")
+        lines.append("")
+
+    for title, ids, texts in (
+        ("A clusters without counterpart", m.unmatched_a, texts_a),
+        ("B clusters without counterpart", m.unmatched_b, texts_b),
+    ):
+        if ids:
+            lines.append(f"### {title} ({len(ids)})")
+            for cid in ids[:limit_per_section]:
+                lines.append(f"- {cid}: {head(texts[cid])}")
+            more(lines, len(ids), "clusters")
+            lines.append("")
+
+    for title, texts in (("Texts only in A", m.only_a), ("Texts only in B", m.only_b)):
+        if texts:
+            lines.append(f"### {title} ({len(texts)})")
+            for t in heapq.nsmallest(limit_per_section, texts):
+                lines.append(f"- {t}")
+            more(lines, len(texts), "texts")
+            lines.append("")
+
+    return "\n".join(lines).rstrip() + "\n"
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Compare two clusters JSONL files")
     parser.add_argument("--a", type=Path, required=True, help="Path to first (baseline) clusters JSONL")
     parser.add_argument("--b", type=Path, required=True, help="Path to second clusters JSONL")
     parser.add_argument("--out", type=Path, default=None, help="Output markdown file path")
     parser.add_argument("--limit", type=int, default=50, help="Max items to list per section")
+    parser.add_argument(
+        "--match",
+        choices=["id", "content"],
+        default="id",
+        help="Pair clusters by cluster_id (default) or by shared texts (ID-agnostic)",
+    )
+    parser.add_argument(
+        "--min-jaccard",
+        type=float,
+        default=0.5,
+        help="With --match content, min text Jaccard for two clusters to count as the same",
+    )
     return parser.parse_args()
 
 
@@ -178,7 +389,12 @@ def main() -> None:
     name_a = path_a.name
     name_b = path_b.name
 
-    content = render_markdown(name_a, name_b, clusters_a, clusters_b, limit_per_section=args.limit)
+    if args.match == "content":
+        content = render_content_markdown(
+            name_a, name_b, clusters_a, clusters_b, limit_per_section=args.limit, min_jaccard=args.min_jaccard
+        )
+    else:
+        content = render_markdown(name_a, name_b, clusters_a, clusters_b, limit_per_section=args.limit)
 
     if args.out is None:
         out_path = path_b.with_name(f"compare_{path_a.stem}_vs_{path_b.stem}.md")
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+embedding_cache.py — persistent, content-addressed sentence-embedding cache.
+
+Shared by every script that calls SentenceTransformer(...).encode: the cluster
+stages (02/03), build_embeddings, search_lessons, rerank_search,
+simulate_next_lessons and the batch_emotion tests. Only texts never seen
+before for a given (model, prefix) are sent to the model.
+
+Layout (one directory per model, since dimensions differ between models):
+  <cache_dir>/<model-slug>/meta.json     {"model": ..., "dim": ...}
+  <cache_dir>/<model-slug>/vectors.f32   append-only float32 rows, memory-mapped
+  <cache_dir>/<model-slug>/keys.txt      append-only SHA-256 hex key per row
+
+key = sha256(model \\0 prefix \\0 normalize(text)); normalize = NFC, trimmed,
+internal whitespace collapsed. Vectors are always L2-normalized.
+
+Rows are written before keys, so a crash can leave at most an orphan vector
+row, which is truncated away on the next open. Single writer per directory.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / ".embed_cache"
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text).strip())
+
+
+def cache_key(model_name: str, prefix: str, text: str) -> str:
+    payload = f"{model_name}\0{prefix}\0{normalize_text(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def model_slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "__", model_name)
+
+
+class EmbeddingCache:
+    """Drop-in encoder: EmbeddingCache(...).encode(texts, prefix=...) → (N, D) float32.
+
+    Pass cache_dir=None to disable persistence (plain encode, model loaded lazily).
+    An already-loaded SentenceTransformer can be passed as `model`.
+    """
+
+    def __init__(self, cache_dir: Optional[Path], model_name: str, model: object = None) -> None:
+        self.model_name = model_name
+        self._model = model
+        self.hits = 0
+        self.misses = 0
+        self.dir: Optional[Path] = None
+        self.dim: Optional[int] = None
+        self._index: Dict[str, int] = {}
+        self._vectors: Optional[np.ndarray] = None
+        if cache_dir is not None:
+            self.dir = Path(cache_dir) / model_slug(model_name)
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self._open()
+
+    # ---- storage ----
+
+    @property
+    def _meta_path(self) -> Path:
+        assert self.dir is not None
+        return self.dir / "meta.json"
+
+    @property
+    def _vec_path(self) -> Path:
+        assert self.dir is not None
+        return self.dir / "vectors.f32"
+
+    @property
+    def _keys_path(self) -> Path:
+        assert self.dir is not None
+        return self.dir / "keys.txt"
+
+    def _open(self) -> None:
+        if not self._meta_path.exists():
+            return
+        meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+        if meta.get("model") != self.model_name:
+            raise SystemExit(f"Embedding cache {self.dir} belongs to model {meta.get('model')!r}")
+        self.dim = int(meta["dim"])
+        raw = self._keys_path.read_text(encoding="utf-8") if self._keys_path.exists() else ""
+        # Only newline-terminated lines are complete keys
+        keys = raw.split("\n")[:-1]
+        row_bytes = 4 * self.dim
+        vec_size = self._vec_path.stat().st_size if self._vec_path.exists() else 0
+        n = min(len(keys), vec_size // row_bytes)
+        # Repair after an interrupted append: drop orphan rows / keys
+        if vec_size != n * row_bytes:
+            with self._vec_path.open("r+b") as f:
+                f.truncate(n * row_bytes)
+        if len(raw) != 65 * n:
+            self._keys_path.write_text("".join(k + "\n" for k in keys[:n]), encoding="utf-8")
+        self._index = {k: i for i, k in enumerate(keys[:n])}
+        self._remap()
+
+    def _remap(self) -> None:
+        n = len(self._index)
+        if n == 0 or self.dim is None:
+            self._vectors = None
+            return
+        self._vectors = np.memmap(self._vec_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+
+    def _append(self, keys: List[str], vecs: np.ndarray) -> None:
+        if self.dir is None or not keys:
+            return
+        if self.dim is None:
+            self.dim = int(vecs.shape[1])
+            self._meta_path.write_text(
+                json.dumps({"model": self.model_name, "dim": self.dim}) + "\n", encoding="utf-8"
+            )
+        with self._vec_path.open("ab") as f:
+            f.write(np.ascontiguousarray(vecs, dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with self._keys_path.open("a", encoding="utf-8") as f:
+            f.write("".join(k + "\n" for k in keys))
+        base = len(self._index)
+        for offset, k in enumerate(keys):
+            self._index[k] = base + offset
+        self._remap()
+
+    # ---- encoding ----
+
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer  # type: ignore
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def _encode_raw(self, texts: List[str], batch_size: int, show_progress_bar: bool) -> np.ndarray:
+        emb = self.model().encode(
+            texts,
+            normalize_embeddings=True,
+            batch_size=batch_size,
+            show_progress_bar=show_progress_bar,
+        )
+        return np.asarray(emb, dtype=np.float32)
+
+    def encode(
+        self,
+        texts: Sequence[str],
+        prefix: str = "",
+        batch_size: int = 64,
+        show_progress_bar: bool = False,
+    ) -> np.ndarray:
+        """Embed `prefix + text` for each text, reusing cached rows where possible."""
+        texts = list(texts)
+        if self.dir is None:
+            self.misses += len(texts)
+            return self._encode_raw([prefix + t for t in texts], batch_size, show_progress_bar)
+
+        keys = [cache_key(self.model_name, prefix, t) for t in texts]
+        missing: Dict[str, str] = {}
+        for k, t in zip(keys, texts):
+            if k not in self._index and k not in missing:
+                missing[k] = t
+        if missing:
+            new_keys = list(missing.keys())
+            vecs = self._encode_raw([prefix + missing[k] for k in new_keys], batch_size, show_progress_bar)
+            self._append(new_keys, vecs)
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        assert self._vectors is not None
+        rows = np.fromiter((self._index[k] for k in keys), dtype=np.int64, count=len(keys))
+        return np.array(self._vectors[rows], dtype=np.float32)
+
+    def stats(self) -> str:
+        return f"embedding cache: hits={self.hits} misses={self.misses}"
+
+
+def add_cache_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--embed-cache",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+        help="Embedding cache directory (default: utils/Scripts/.embed_cache)",
+    )
+    parser.add_argument("--no-embed-cache", action="store_true", help="Always re-encode; skip the cache")
+
+
+def cache_from_args(args: argparse.Namespace, model_name: str, model: object = None) -> EmbeddingCache:
+    return EmbeddingCache(None if args.no_embed_cache else args.embed_cache, model_name, model=model)
@@ -15,9 +15,13 @@ to the app (where the iPhone 14 Pro / A16 test measures speed + memory, not text
 """
 import argparse
 import json
+import sys
 import time
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from llm_ledger import DEFAULT_LEDGER_PATH, Ledger  # noqa: E402
+
 # ---------------------------------------------------------------------------
 # Paths (repo layout)
 # ---------------------------------------------------------------------------
@@ -167,10 +171,11 @@ def load_data(mode):
     return cases
 
 
-def run_model(key, cases, max_tokens, temp, system):
+def run_model(key, cases, max_tokens, temp, system, ledger_path=None):
     from mlx_lm import load, generate
     from mlx_lm.sample_utils import make_sampler
     name, repo, size = MODELS[key]
+    ledger = Ledger(ledger_path, "bakeoff", repo)
     print(f"\n=== {name} ({repo}, {size}) ===")
     t0 = time.time()
     model, tok = load(repo)
@@ -187,9 +192,14 @@ def run_model(key, cases, max_tokens, temp, system):
         dt = time.time() - g0
         n_tok = len(tok.encode(out))
         tps = n_tok / dt if dt else 0
+        # The system prompt is the static prefix shared by every case
+        ledger.call("local", "ok", prompt_tokens=len(chat), completion_tokens=n_tok, latency_s=dt,
+                    prefix=system, label=f"{c['chapter']}:{c['verse']}")
         print(f"  [{i}/{len(cases)}] {c['chapter']}:{c['verse']}  {dt:.1f}s  {tps:.0f} tok/s")
         rows.append({**c, "output": out.strip(), "gen_s": round(dt, 2),
                      "tok": n_tok, "tok_s": round(tps, 1)})
+    ledger.finish(units=len(rows), accepted=sum(1 for r in rows if r["output"]))
+    ledger.close()
     return {"key": key, "name": name, "repo": repo, "size": size,
             "load_s": round(load_s, 2), "rows": rows}
 
@@ -203,6 +213,9 @@ def main():
                     help="verse = as-built #5 prompt; lesson = #6 lesson-spotlight (lesson-first)")
     ap.add_argument("--out", default="bakeoff_results.json")
     ap.add_argument("--list", action="store_true")
+    ap.add_argument("--ledger", type=Path, default=DEFAULT_LEDGER_PATH,
+                    help="token/latency ledger shared with 01 (summary: llm_ledger.py summary --stage bakeoff)")
+    ap.add_argument("--no-ledger", action="store_true")
     args = ap.parse_args()
 
     if args.list:
@@ -213,7 +226,8 @@ def main():
     system = INSTRUCTIONS_LESSON if args.mode == "lesson" else INSTRUCTIONS
     cases = load_data(args.mode)
     print(f"Loaded {len(cases)} test cases. Mode: {args.mode}")
-    results = [run_model(k, cases, args.max_tokens, args.temp, system) for k in args.models]
+    ledger_path = None if args.no_ledger else args.ledger
+    results = [run_model(k, cases, args.max_tokens, args.temp, system, ledger_path) for k in args.models]
 
     (OUT / args.out).write_text(json.dumps(
         {"cases": cases, "results": results, "temp": args.temp,
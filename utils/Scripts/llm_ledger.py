@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+llm_ledger.py — append-only token / latency / cost ledger for LLM calls.
+
+Every LLM-calling stage (01_generate_candidates.py, llm_experiments/bakeoff.py)
+appends one JSON line per attempt to a shared ledger, default
+utils/Scripts/.llm_cache/ledger.jsonl:
+
+  {"type": "call", "run", "stage", "mode", "model", "status": ok|error|cache_hit,
+   "attempt", "prompt_tokens", "completion_tokens", "cached_tokens",
+   "latency_ms", "prefix_id", "prefix_tokens", "label", "ts"}
+
+and one "run" line at the end with the number of units and accepted lessons.
+Lines are written with a single append each, so concurrent workers (shards)
+can share the file.
+
+prefix_id/prefix_tokens describe the static part of the prompt in front of the
+passage (system message + few-shot examples + rules). Providers cache a
+repeated prompt prefix of at least 1024 tokens and bill it at the cached input
+rate; the summary shows how much prompt volume that prefix is and what caching
+it would save.
+
+  python utils/Scripts/llm_ledger.py summary
+  python utils/Scripts/llm_ledger.py summary --stage 01_generate_candidates --last-run
+  python utils/Scripts/llm_ledger.py summary --price gpt-4o-mini=0.15,0.075,0.6
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import re
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+DEFAULT_LEDGER_PATH = Path(__file__).resolve().parent / ".llm_cache" / "ledger.jsonl"
+
+# USD per 1M tokens: (input, cached input, output). List prices; override with --price.
+PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+}
+BATCH_DISCOUNT = 0.5
+CACHE_MIN_PREFIX_TOKENS = 1024
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 chars/token for English prompt text
+    return len(text) // 4
+
+
+def static_prefix(messages: Sequence[dict], end: "re.Pattern[str]") -> str:
+    """System/earlier messages plus the last message up to the first `end` match."""
+    parts = [str(m.get("content", "")) for m in messages]
+    if not parts:
+        return ""
+    m = end.search(parts[-1])
+    parts[-1] = parts[-1][:m.start()] if m else ""
+    return "\n".join(parts)
+
+
+class Ledger:
+    """Appends call/run records for one stage; path=None disables it."""
+
+    def __init__(self, path: Optional[Path], stage: str, model: str) -> None:
+        self.stage = stage
+        self.model = model
+        self.run = uuid.uuid4().hex[:12]
+        self.fp = None
+        self._prefixes: Dict[str, Tuple[str, int]] = {}
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.fp = path.open("a", encoding="utf-8")
+
+    def _write(self, rec: dict) -> None:
+        if self.fp is None:
+            return
+        rec = dict(rec, run=self.run, stage=self.stage, ts=round(time.time(), 3))
+        self.fp.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self.fp.flush()
+
+    def _prefix(self, prefix: Optional[str], tokens: Optional[int]) -> Tuple[Optional[str], int]:
+        if not prefix:
+            return None, 0
+        if prefix not in self._prefixes:
+            pid = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+            self._prefixes[prefix] = (pid, estimate_tokens(prefix) if tokens is None else tokens)
+        return self._prefixes[prefix]
+
+    def call(
+        self,
+        mode: str,
+        status: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        cached_tokens: int = 0,
+        latency_s: Optional[float] = None,
+        attempt: int = 1,
+        prefix: Optional[str] = None,
+        prefix_tokens: Optional[int] = None,
+        label: str = "",
+        model: Optional[str] = None,
+    ) -> None:
+        """Record one attempt (status ok/error) or a response-cache hit (status cache_hit)."""
+        if self.fp is None:
+            return
+        pid, ptok = self._prefix(prefix, prefix_tokens)
+        self._write({
+            "type": "call",
+            "mode": mode,
+            "model": model or self.model,
+            "status": status,
+            "attempt": attempt,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "latency_ms": None if latency_s is None else round(latency_s * 1000.0, 1),
+            "prefix_id": pid,
+            "prefix_tokens": ptok,
+            "label": label,
+        })
+
+    def finish(self, units: int, accepted: int, model: Optional[str] = None) -> None:
+        self._write({"type": "run", "model": model or self.model, "units": units, "accepted": accepted})
+
+    def close(self) -> None:
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+
+# ---- summary ----
+
+
+def iter_records(path: Path) -> Iterator[dict]:
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # torn last line from a killed writer
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def price_for(model: str, prices: Dict[str, Tuple[float, float, float]]) -> Optional[Tuple[float, float, float]]:
+    # Longest matching name, so "gpt-4o-mini-2024-07-18" is priced as gpt-4o-mini, not gpt-4o
+    for name in sorted(prices, key=len, reverse=True):
+        if model == name or model.startswith(name + "-"):
+            return prices[name]
+    return None
+
+
+def call_cost(rec: dict, prices: Dict[str, Tuple[float, float, float]]) -> Optional[float]:
+    price = price_for(str(rec.get("model", "")), prices)
+    if price is None:
+        return None
+    p_in, p_cached, p_out = price
+    cached = int(rec.get("cached_tokens") or 0)
+    usd = (
+        (int(rec.get("prompt_tokens") or 0) - cached) * p_in
+        + cached * p_cached
+        + int(rec.get("completion_tokens") or 0) * p_out
+    ) / 1e6
+    return usd * BATCH_DISCOUNT if rec.get("mode") == "batch" else usd
+
+
+def fmt_usd(v: Optional[float]) -> str:
+    if v is None:
+        return "n/a"
+    return f"${v:.6f}" if v < 0.01 else f"${v:.4f}"
+
+
+def fmt_ms(v: Optional[float]) -> str:
+    return "-" if v is None else f"{v:.0f}ms"
+
+
+def summarize(records: List[dict], prices: Dict[str, Tuple[float, float, float]]) -> str:
+    calls = [r for r in records if r.get("type") == "call"]
+    runs = [r for r in records if r.get("type") == "run"]
+    lines: List[str] = []
+
+    by_mode: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+    for r in calls:
+        by_mode[(r.get("stage", "?"), r.get("mode", "?"))].append(r)
+    lines.append(
+        f"{'stage/mode':38s} {'calls':>6s} {'hits':>6s} {'retry%':>7s} {'err':>5s} "
+        f"{'prompt':>9s} {'cached':>8s} {'compl':>8s} {'p50':>7s} {'p95':>7s} {'cost':>10s}"
+    )
+    for (stage, mode), rs in sorted(by_mode.items()):
+        sent = [r for r in rs if r.get("status") != "cache_hit"]
+        ok = [r for r in sent if r.get("status") == "ok"]
+        hits = len(rs) - len(sent)
+        first = sum(1 for r in sent if int(r.get("attempt") or 1) == 1)
+        retries = len(sent) - first
+        lat = [float(r["latency_ms"]) for r in ok if r.get("latency_ms") is not None]
+        costs = [call_cost(r, prices) for r in ok]
+        cost = None if any(c is None for c in costs) else sum(c for c in costs if c is not None)
+        lines.append(
+            f"{stage + '/' + mode:38s} {len(sent):6d} {hits:6d} "
+            f"{(100.0 * retries / first if first else 0.0):6.1f}% {len(sent) - len(ok):5d} "
+            f"{sum(int(r.get('prompt_tokens') or 0) for r in ok):9d} "
+            f"{sum(int(r.get('cached_tokens') or 0) for r in ok):8d} "
+            f"{sum(int(r.get('completion_tokens') or 0) for r in ok):8d} "
+            f"{fmt_ms(percentile(lat, 0.50)):>7s} {fmt_ms(percentile(lat, 0.95)):>7s} {fmt_usd(cost):>10s}"
+        )
+
+    lines.append("")
+    for stage in sorted({r.get("stage", "?") for r in records}):
+        rs = [r for r in calls if r.get("stage") == stage]
+        ok = [r for r in rs if r.get("status") == "ok"]
+        hits = sum(1 for r in rs if r.get("status") == "cache_hit")
+        requests = sum(1 for r in rs if r.get("status") != "cache_hit" and int(r.get("attempt") or 1) == 1)
+        accepted = sum(int(r.get("accepted") or 0) for r in runs if r.get("stage") == stage)
+        costs = [call_cost(r, prices) for r in ok]
+        cost = None if any(c is None for c in costs) else sum(c for c in costs if c is not None)
+        per_lesson = None if cost is None or not accepted else cost / accepted
+        lines.append(
+            f"{stage}: cache hit ratio {hits}/{hits + requests}"
+            f" ({(100.0 * hits / (hits + requests) if hits + requests else 0.0):.1f}%),"
+            f" accepted lessons {accepted}, cost {fmt_usd(cost)}, per accepted lesson {fmt_usd(per_lesson)}"
+        )
+
+        # Static prefix: every call after the first with the same prefix could be a provider cache hit
+        prompt_total = sum(int(r.get("prompt_tokens") or 0) for r in ok)
+        per_prefix: Dict[str, List[dict]] = defaultdict(list)
+        for r in ok:
+            if r.get("prefix_id"):
+                per_prefix[str(r["prefix_id"])].append(r)
+        if not per_prefix or not prompt_total:
+            continue
+        volume = sum(int(r.get("prefix_tokens") or 0) for r in ok)
+        repeat = sum(int(group[0].get("prefix_tokens") or 0) * (len(group) - 1) for group in per_prefix.values())
+        already = sum(int(r.get("cached_tokens") or 0) for r in ok)
+        saved_usd = 0.0
+        priced = True
+        for group in per_prefix.values():
+            price = price_for(str(group[0].get("model", "")), prices)
+            if price is None:
+                priced = False
+                continue
+            discount = sum(BATCH_DISCOUNT if r.get("mode") == "batch" else 1.0 for r in group[1:])
+            saved_usd += int(group[0].get("prefix_tokens") or 0) * discount * (price[0] - price[1]) / 1e6
+        sizes = sorted({int(g[0].get("prefix_tokens") or 0) for g in per_prefix.values()})
+        eligible = all(s >= CACHE_MIN_PREFIX_TOKENS for s in sizes)
+        lines.append(
+            f"  static prefix: {len(per_prefix)} distinct, ~{'/'.join(str(s) for s in sizes)} tokens each;"
+            f" {volume} of {prompt_total} prompt tokens ({100.0 * volume / prompt_total:.1f}%)"
+        )
+        lines.append(
+            f"  prefix caching: {repeat} repeated prefix tokens ({100.0 * repeat / prompt_total:.1f}% of prompt volume)"
+            f" would bill at the cached rate, saving ~{fmt_usd(saved_usd if priced else None)};"
+            f" provider reported {already} cached tokens"
+        )
+        if not eligible:
+            lines.append(
+                f"  note: prefixes under {CACHE_MIN_PREFIX_TOKENS} tokens are not cached by the provider;"
+                " the saving above needs a longer shared preamble (e.g. more few-shot examples)"
+            )
+    return "\n".join(lines)
+
+
+def parse_price(spec: str) -> Tuple[str, Tuple[float, float, float]]:
+    try:
+        name, values = spec.split("=", 1)
+        p_in, p_cached, p_out = (float(v) for v in values.split(","))
+    except ValueError:
+        raise SystemExit(f"--price expects MODEL=input,cached_input,output (USD per 1M tokens), got {spec!r}")
+    return name, (p_in, p_cached, p_out)
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Summarize the LLM token/cost ledger")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("summary", help="Tokens, latency, retries, cache hits and cost per stage")
+    s.add_argument("ledger", nargs="?", type=Path, default=DEFAULT_LEDGER_PATH)
+    s.add_argument("--stage", default=None, help="Only this stage (e.g. 01_generate_candidates, bakeoff)")
+    s.add_argument("--run", default=None, help="Only this run id")
+    s.add_argument("--last-run", action="store_true", help="Only the most recent run (of --stage, if given)")
+    s.add_argument("--price", action="append", default=[], help="MODEL=input,cached_input,output USD per 1M tokens")
+    args = p.parse_args()
+
+    if not args.ledger.exists():
+        raise SystemExit(f"No ledger at {args.ledger}")
+    prices = dict(PRICES)
+    prices.update(parse_price(spec) for spec in args.price)
+    records = [r for r in iter_records(args.ledger) if args.stage is None or r.get("stage") == args.stage]
+    run = args.run
+    if args.last_run and records:
+        run = records[-1].get("run")
+    if run is not None:
+        records = [r for r in records if r.get("run") == run]
+    if not records:
+        raise SystemExit("No matching ledger records")
+    print(summarize(records, prices))
+
+
+if __name__ == "__main__":
+    main()
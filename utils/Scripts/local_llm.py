@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+local_llm.py — in-process CPU chat model for 01_generate_candidates.py --backend local.
+
+Wraps a Hugging Face causal LM (transformers + torch, both already in
+utils/requirements.txt). Many unit prompts are left-padded into one batch and
+decoded greedily together; a batch stops as soon as every row has produced a
+sentence terminator (or NONE), capped at the 40-token completion budget, and
+each answer is cut after its first sentence.
+
+Suggested small instruct models: Qwen/Qwen2.5-0.5B-Instruct (fast),
+Qwen/Qwen2.5-1.5B-Instruct, meta-llama/Llama-3.2-1B-Instruct.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import List, Optional, Sequence, Tuple
+
+
+DEFAULT_LOCAL_MODEL = "Qwen/Qwen2.5-0.5B-Instruct"
+
+_SENTENCE_END = re.compile(r"[.!?]|\bNONE\b")
+
+
+def first_sentence(text: str) -> str:
+    """Text up to and including the first sentence terminator (or the NONE token)."""
+    text = text.strip()
+    m = _SENTENCE_END.search(text)
+    return text[:m.end()].strip() if m else text
+
+
+class LocalChatModel:
+    """Batched greedy generation; generate(messages_batch) → [(text, prompt_tokens, completion_tokens)]."""
+
+    def __init__(self, model_name: str = DEFAULT_LOCAL_MODEL, threads: Optional[int] = None) -> None:
+        try:
+            import torch  # type: ignore
+            from transformers import AutoModelForCausalLM, AutoTokenizer  # type: ignore
+        except Exception as e:  # pragma: no cover - import guard
+            raise RuntimeError(
+                "--backend local needs torch and transformers (pip install -r utils/requirements.txt)"
+            ) from e
+
+        self.torch = torch
+        if threads:
+            torch.set_num_threads(threads)
+        self.model_name = model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, padding_side="left")
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32)
+        self.model.eval()
+
+    def _stopping_criteria(self, prompt_len: int, batch_size: int):
+        from transformers import StoppingCriteria, StoppingCriteriaList  # type: ignore
+
+        tokenizer = self.tokenizer
+        done = [False] * batch_size
+
+        class FirstSentence(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs) -> bool:
+                new = input_ids[:, prompt_len:]
+                for row in range(batch_size):
+                    if not done[row]:
+                        # Only the last few tokens can have introduced a terminator
+                        tail = tokenizer.decode(new[row, -4:], skip_special_tokens=True)
+                        if _SENTENCE_END.search(tail) or new[row, -1].item() == tokenizer.eos_token_id:
+                            done[row] = True
+                return all(done)
+
+        return StoppingCriteriaList([FirstSentence()])
+
+    def generate(self, messages_batch: Sequence[List[dict]], max_new_tokens: int) -> List[Tuple[str, int, int]]:
+        torch = self.torch
+        tok = self.tokenizer
+        texts = [tok.apply_chat_template(m, tokenize=False, add_generation_prompt=True) for m in messages_batch]
+        enc = tok(texts, return_tensors="pt", padding=True)
+        prompt_len = enc["input_ids"].shape[1]
+        with torch.inference_mode():
+            out = self.model.generate(
+                **enc,
+                max_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=tok.pad_token_id,
+                stopping_criteria=self._stopping_criteria(prompt_len, len(texts)),
+            )
+        results: List[Tuple[str, int, int]] = []
+        for row in range(len(texts)):
+            prompt_tokens = int(enc["attention_mask"][row].sum().item())
+            new_ids = out[row, prompt_len:]
+            text = first_sentence(tok.decode(new_ids, skip_special_tokens=True))
+            # Count only the tokens up to the cut, not the rest of the batch's padding run
+            completion_tokens = len(tok(text, add_special_tokens=False)["input_ids"])
+            results.append((text, prompt_tokens, completion_tokens))
+        return results
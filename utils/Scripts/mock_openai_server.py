@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+mock_openai_server.py — local OpenAI-compatible stand-in for load tests.
+
+Serves the endpoints 01_generate_candidates.py uses, with no network and no
+API key, so retries, backoff, --concurrency, --rpm/--tpm, --pack and --batch
+can be exercised and benchmarked end to end:
+
+  POST /v1/chat/completions            deterministic answers (mock_generate)
+  POST /v1/files                       multipart upload (Batch input)
+  GET  /v1/files/{id}[/content]
+  POST /v1/batches                     runs the input file in the background
+  GET  /v1/batches                     newest first, one page
+  GET  /v1/batches/{id}
+  POST /v1/batches/{id}/cancel
+  GET  /v1/models
+  GET  /stats                          request / error / latency counters
+
+Answers: the passage is pulled out of a make_prompt() prompt and answered with
+mock_generate(); make_pack_prompt() prompts get a JSON array. --none-rate
+answers NONE for a deterministic fraction of passages, and --ramble appends
+that many extra sentences to single-unit answers (a chatty model).
+
+"stream": true requests get server-sent events: the first chunk after the
+base latency, then one chunk per word paced by --ms-per-token, a usage chunk
+when stream_options.include_usage is set, and data: [DONE]. A client that
+closes the stream early is counted as stream_closed in /stats.
+
+Latency and failures are drawn from a seeded hash of (request body, attempt
+number), so the n-th retry of the same request behaves the same on every run.
+--rpm/--tpm enforce a one-minute sliding window and answer 429 with
+Retry-After and x-ratelimit-* headers, like the real API.
+
+Example:
+  python utils/Scripts/mock_openai_server.py --port 8000 --latency lognormal \\
+      --latency-ms 400 --rate-429 0.05 --rate-500 0.02 --rpm 500
+  OPENAI_API_KEY=x python utils/Scripts/01_generate_candidates.py \\
+      --base-url http://127.0.0.1:8000/v1 --concurrency 16 \\
+      -o utils/Scripts/outputs/bench/async.jsonl
+
+Keep load-test outputs under utils/Scripts/outputs/bench/ (git-ignored).
+"""
+
+from __future__ import annotations
+
+import argparse
+import email.parser
+import email.policy
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from typing import Deque, Dict, List, Optional, Tuple
+
+_gen = import_module("01_generate_candidates")
+mock_generate = _gen.mock_generate
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def unit_hash(*parts: object) -> float:
+    """Deterministic uniform [0, 1) from the given parts."""
+    digest = hashlib.sha256("\0".join(str(p) for p in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2.0 ** 64
+
+
+class MockBackend:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.lock = threading.Lock()
+        self.attempts: Dict[str, int] = {}
+        self.req_window: Deque[float] = deque()
+        self.tok_window: Deque[Tuple[float, int]] = deque()
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, dict] = {}
+        self.counters: Dict[str, int] = {"requests": 0, "ok": 0, "429_injected": 0, "429_limit": 0, "500": 0, "stream_closed": 0}
+        self.latencies: List[float] = []
+
+    # ---- answers ----
+
+    def answer_passage(self, text: str) -> str:
+        if self.args.none_rate > 0 and unit_hash(self.args.seed, "none", text) < self.args.none_rate:
+            return "NONE"
+        return mock_generate(text)
+
+    def answer(self, messages: List[dict]) -> str:
+        user = str(messages[-1].get("content", "")) if messages else ""
+        packed = re.findall(r"^\[(\d+:\d+-\d+)\]\n(.*?)(?=\n\n)", user, re.M | re.S)
+        if packed:
+            return json.dumps([{"unit_key": label, "lesson": self.answer_passage(text)} for label, text in packed])
+        m = re.search(r"Passage:\n(.*?)\n\nAnswer with", user, re.S)
+        answer = self.answer_passage(m.group(1) if m else user)
+        if answer != "NONE" and self.args.ramble > 0:
+            answer += " It also reminds the reader to reflect on this." * self.args.ramble
+        return answer
+
+    def completion(self, body: dict) -> dict:
+        messages = body.get("messages") or []
+        content = self.answer(messages)
+        prompt_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+        completion_tokens = estimate_tokens(content)
+        return {
+            "id": "chatcmpl-" + uuid.uuid4().hex[:12],
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    # ---- latency / failures ----
+
+    def latency(self, key: str, attempt: int, completion_tokens: int) -> float:
+        a = self.args
+        mean = max(0.0, a.latency_ms) / 1000.0
+        u = unit_hash(a.seed, "latency", key, attempt)
+        if a.latency == "fixed":
+            base = mean
+        elif a.latency == "uniform":
+            base = mean * (1.0 - a.latency_spread) + 2.0 * mean * a.latency_spread * u
+        elif a.latency == "exponential":
+            base = -mean * math.log(1.0 - u)
+        else:  # lognormal with the given median
+            v = unit_hash(a.seed, "latency2", key, attempt)
+            z = math.sqrt(-2.0 * math.log(1.0 - u)) * math.cos(2.0 * math.pi * v)
+            base = mean * math.exp(a.latency_spread * z)
+        return base + completion_tokens * max(0.0, a.ms_per_token) / 1000.0
+
+    def injected_failure(self, key: str, attempt: int) -> Optional[int]:
+        r = unit_hash(self.args.seed, "fail", key, attempt)
+        if r < self.args.rate_429:
+            return 429
+        if r < self.args.rate_429 + self.args.rate_500:
+            return 500
+        return None
+
+    def admit(self, tokens: int) -> Tuple[bool, Dict[str, str]]:
+        """Sliding one-minute window for --rpm/--tpm; returns (allowed, headers)."""
+        a = self.args
+        now = time.monotonic()
+        with self.lock:
+            while self.req_window and now - self.req_window[0] >= 60.0:
+                self.req_window.popleft()
+            while self.tok_window and now - self.tok_window[0][0] >= 60.0:
+                self.tok_window.popleft()
+            used_tokens = sum(t for _ts, t in self.tok_window)
+            headers: Dict[str, str] = {}
+            wait = 0.0
+            if a.rpm > 0:
+                remaining = int(a.rpm) - len(self.req_window)
+                reset = 60.0 - (now - self.req_window[0]) if self.req_window else 0.0
+                headers["x-ratelimit-limit-requests"] = str(int(a.rpm))
+                headers["x-ratelimit-remaining-requests"] = str(max(0, remaining - 1))
+                headers["x-ratelimit-reset-requests"] = f"{reset:.3f}s"
+                if remaining <= 0:
+                    wait = max(wait, reset)
+            if a.tpm > 0:
+                remaining_tokens = int(a.tpm) - used_tokens
+                reset = 60.0 - (now - self.tok_window[0][0]) if self.tok_window else 0.0
+                headers["x-ratelimit-limit-tokens"] = str(int(a.tpm))
+                headers["x-ratelimit-remaining-tokens"] = str(max(0, remaining_tokens - tokens))
+                headers["x-ratelimit-reset-tokens"] = f"{reset:.3f}s"
+                if remaining_tokens < tokens:
+                    wait = max(wait, reset)
+            if wait > 0:
+                headers["retry-after"] = str(max(1, math.ceil(wait)))
+                return False, headers
+            self.req_window.append(now)
+            self.tok_window.append((now, tokens))
+            return True, headers
+
+    def next_attempt(self, key: str) -> int:
+        with self.lock:
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            self.counters["requests"] += 1
+            return self.attempts[key]
+
+    def count(self, name: str, latency: Optional[float] = None) -> None:
+        with self.lock:
+            self.counters[name] += 1
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lat = sorted(self.latencies)
+        pct = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000.0, 1) if lat else None
+        return dict(self.counters, p50_ms=pct(0.50), p95_ms=pct(0.95), batches=len(self.batches))
+
+    # ---- batch ----
+
+    def run_batch(self, batch_id: str) -> None:
+        batch = self.batches[batch_id]
+        time.sleep(max(0.0, self.args.batch_seconds) / 2.0)
+        if batch["status"] == "cancelling":
+            batch["status"] = "cancelled"
+            return
+        batch["status"] = "in_progress"
+        lines = [json.loads(l) for l in self.files[batch["input_file_id"]].decode("utf-8").splitlines() if l.strip()]
+        batch["request_counts"]["total"] = len(lines)
+        out: List[str] = []
+        errors: List[str] = []
+        for line in lines:
+            key = json.dumps(line.get("body", {}), sort_keys=True)
+            if unit_hash(self.args.seed, "batch-fail", key) < self.args.rate_500:
+                errors.append(json.dumps({
+                    "id": "batch_req_" + uuid.uuid4().hex[:12],
+                    "custom_id": line.get("custom_id"),
+                    "response": {"status_code": 500, "body": {"error": {"message": "injected failure"}}},
+                    "error": None,
+                }))
+                batch["request_counts"]["failed"] += 1
+                continue
+            out.append(json.dumps({
+                "id": "batch_req_" + uuid.uuid4().hex[:12],
+                "custom_id": line.get("custom_id"),
+                "response": {"status_code": 200, "body": self.completion(line.get("body", {}))},
+                "error": None,
+            }))
+            batch["request_counts"]["completed"] += 1
+        time.sleep(max(0.0, self.args.batch_seconds) / 2.0)
+        if batch["status"] == "cancelling":
+            batch["status"] = "cancelled"
+            return
+        if out:
+            batch["output_file_id"] = self.add_file("\n".join(out).encode("utf-8") + b"\n")
+        if errors:
+            batch["error_file_id"] = self.add_file("\n".join(errors).encode("utf-8") + b"\n")
+        batch["completed_at"] = int(time.time())
+        batch["status"] = "completed"
+
+    def add_file(self, content: bytes) -> str:
+        file_id = "file-" + uuid.uuid4().hex[:24]
+        with self.lock:
+            self.files[file_id] = content
+        return file_id
+
+
+def file_object(file_id: str, content: bytes) -> dict:
+    return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": f"{file_id}.jsonl", "purpose": "batch"}
+
+
+def public(batch: dict) -> dict:
+    return {k: v for k, v in batch.items() if not k.startswith("_")}
+
+
+def make_handler(backend: MockBackend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt: str, *args) -> None:  # noqa: A002
+            if backend.args.verbose:
+                super().log_message(fmt, *args)
+
+        def send_json(self, status: int, obj: object, headers: Optional[Dict[str, str]] = None) -> None:
+            self.send_bytes(status, json.dumps(obj).encode("utf-8"), "application/json", headers)
+
+        def send_bytes(self, status: int, data: bytes, ctype: str, headers: Optional[Dict[str, str]] = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_error_json(self, status: int, message: str, etype: str, headers: Optional[Dict[str, str]] = None) -> None:
+            self.send_json(status, {"error": {"message": message, "type": etype, "code": None}}, headers)
+
+        def read_body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def do_GET(self) -> None:  # noqa: N802
+            path = self.path.split("?", 1)[0].rstrip("/")
+            if path == "/stats":
+                return self.send_json(200, backend.stats())
+            if path == "/v1/models":
+                return self.send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+            if path == "/v1/batches":
+                data = [public(b) for b in sorted(backend.batches.values(), key=lambda b: -b["created_at"])]
+                return self.send_json(200, {
+                    "object": "list",
+                    "data": data,
+                    "first_id": data[0]["id"] if data else None,
+                    "last_id": data[-1]["id"] if data else None,
+                    "has_more": False,
+                })
+            m = re.fullmatch(r"/v1/batches/([^/]+)", path)
+            if m and m.group(1) in backend.batches:
+                return self.send_json(200, public(backend.batches[m.group(1)]))
+            m = re.fullmatch(r"/v1/files/([^/]+)(/content)?", path)
+            if m and m.group(1) in backend.files:
+                content = backend.files[m.group(1)]
+                if m.group(2):
+                    return self.send_bytes(200, content, "application/jsonl")
+                return self.send_json(200, file_object(m.group(1), content))
+            self.send_error_json(404, f"Unknown path {path}", "invalid_request_error")
+
+        def do_POST(self) -> None:  # noqa: N802
+            path = self.path.split("?", 1)[0].rstrip("/")
+            data = self.read_body()
+            if path == "/v1/chat/completions":
+                return self.chat(data)
+            if path == "/v1/files":
+                return self.upload(data)
+            if path == "/v1/batches":
+                body = json.loads(data or b"{}")
+                if body.get("input_file_id") not in backend.files:
+                    return self.send_error_json(400, "input_file_id not found", "invalid_request_error")
+                batch_id = "batch_" + uuid.uuid4().hex[:24]
+                backend.batches[batch_id] = {
+                    "id": batch_id,
+                    "object": "batch",
+                    "endpoint": body.get("endpoint", "/v1/chat/completions"),
+                    "input_file_id": body["input_file_id"],
+                    "completion_window": body.get("completion_window", "24h"),
+                    "status": "validating",
+                    "created_at": int(time.time()),
+                    "output_file_id": None,
+                    "error_file_id": None,
+                    "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                }
+                threading.Thread(target=backend.run_batch, args=(batch_id,), daemon=True).start()
+                return self.send_json(200, public(backend.batches[batch_id]))
+            m = re.fullmatch(r"/v1/batches/([^/]+)/cancel", path)
+            if m and m.group(1) in backend.batches:
+                batch = backend.batches[m.group(1)]
+                if batch["status"] not in {"completed", "failed", "expired", "cancelled"}:
+                    batch["status"] = "cancelling"
+                return self.send_json(200, public(batch))
+            self.send_error_json(404, f"Unknown path {path}", "invalid_request_error")
+
+        def chat(self, data: bytes) -> None:
+            body = json.loads(data or b"{}")
+            key = json.dumps(body, sort_keys=True)
+            attempt = backend.next_attempt(key)
+            tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in body.get("messages") or [])
+            tokens += int(body.get("max_tokens") or 0)
+            allowed, headers = backend.admit(tokens)
+            if not allowed:
+                backend.count("429_limit")
+                return self.send_error_json(429, "Rate limit reached", "requests", headers)
+            failure = backend.injected_failure(key, attempt)
+            resp = backend.completion(body)
+            delay = backend.latency(key, attempt, resp["usage"]["completion_tokens"])
+            if failure is not None:
+                time.sleep(delay * 0.2)
+                if failure == 429:
+                    backend.count("429_injected")
+                    headers["retry-after"] = "1"
+                    return self.send_error_json(429, "Injected rate limit", "requests", headers)
+                backend.count("500")
+                return self.send_error_json(500, "Injected server error", "server_error", headers)
+            if body.get("stream"):
+                return self.stream(body, resp, headers, backend.latency(key, attempt, 0))
+            time.sleep(delay)
+            backend.count("ok", delay)
+            self.send_json(200, resp, headers)
+
+        def stream(self, body: dict, resp: dict, headers: Dict[str, str], first_delay: float) -> None:
+            """Send resp as chat.completion.chunk events, one word per chunk."""
+            t0 = time.perf_counter()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.close_connection = True
+            base = {k: resp[k] for k in ("id", "created", "model")}
+            base["object"] = "chat.completion.chunk"
+
+            def event(choices: List[dict], usage: Optional[dict] = None) -> bytes:
+                return b"data: " + json.dumps(dict(base, choices=choices, usage=usage)).encode("utf-8") + b"\n\n"
+
+            per_token = max(0.0, backend.args.ms_per_token) / 1000.0
+            pieces = re.findall(r"\S+\s*", resp["choices"][0]["message"]["content"])
+            time.sleep(first_delay)
+            try:
+                self.wfile.write(event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]))
+                for piece in pieces:
+                    time.sleep(per_token * estimate_tokens(piece))
+                    self.wfile.write(event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}]))
+                    self.wfile.flush()
+                self.wfile.write(event([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    self.wfile.write(event([], resp["usage"]))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                backend.count("stream_closed", time.perf_counter() - t0)
+                return
+            backend.count("ok", time.perf_counter() - t0)
+
+        def upload(self, data: bytes) -> None:
+            ctype = self.headers.get("Content-Type", "")
+            msg = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                f"Content-Type: {ctype}\r\n\r\n".encode("utf-8") + data
+            )
+            content = None
+            for part in msg.iter_parts() if msg.is_multipart() else []:
+                if part.get_filename() is not None:
+                    content = part.get_payload(decode=True)
+            if content is None:
+                return self.send_error_json(400, "multipart upload with a file part expected", "invalid_request_error")
+            file_id = backend.add_file(content)
+            self.send_json(200, file_object(file_id, content))
+
+    return Handler
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Local OpenAI-compatible mock server (chat completions + batch)")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8000)
+    p.add_argument("--seed", type=int, default=0, help="Seed for latency, failure and NONE draws")
+    p.add_argument("--latency", choices=["fixed", "uniform", "exponential", "lognormal"], default="lognormal")
+    p.add_argument("--latency-ms", type=float, default=300.0, help="Mean (median for lognormal) latency in ms")
+    p.add_argument("--latency-spread", type=float, default=0.5,
+                   help="uniform: ± fraction of the mean; lognormal: sigma")
+    p.add_argument("--ms-per-token", type=float, default=0.0, help="Extra latency per completion token")
+    p.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with an injected 429")
+    p.add_argument("--rate-500", type=float, default=0.0, help="Fraction of requests (and batch lines) failing with 500")
+    p.add_argument("--rpm", type=float, default=0.0, help="Enforced requests/min (0 = unlimited)")
+    p.add_argument("--tpm", type=float, default=0.0, help="Enforced tokens/min incl. max_tokens (0 = unlimited)")
+    p.add_argument("--none-rate", type=float, default=0.0, help="Fraction of passages answered NONE")
+    p.add_argument("--ramble", type=int, default=0, help="Extra sentences appended to single-unit answers")
+    p.add_argument("--batch-seconds", type=float, default=2.0, help="Time a batch takes to complete")
+    p.add_argument("--verbose", action="store_true", help="Log every request")
+    args = p.parse_args()
+
+    backend = MockBackend(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(backend))
+    server.daemon_threads = True
+    print(f"✅ Mock OpenAI server on http://{args.host}:{args.port}/v1 (stats at /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(backend.stats()))
+
+
+if __name__ == "__main__":
+    main()
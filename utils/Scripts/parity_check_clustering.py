@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+parity_check_clustering.py — check cluster_engine.greedy_cluster() against the
+original pure-Python greedy single-linkage.
+
+Both implementations cluster the same embeddings at each --threshold; the
+cluster lists (indices, in order) must be identical. Prints per-threshold
+cluster counts and timings, then PARITY OK / PARITY MISMATCH, and exits 1 on
+any mismatch so it can gate a change to cluster_engine.py.
+
+Embeddings are synthetic (noisy copies of --centers random centres) unless
+--in-file gives a candidates/clusters JSONL to embed (--mock for hash vectors).
+
+Examples:
+  python utils/Scripts/parity_check_clustering.py --n 800
+  python utils/Scripts/parity_check_clustering.py \
+    -i utils/Scripts/outputs/candidates_1_4_8.jsonl --mock --threshold 0.82
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from cluster_engine import greedy_cluster, greedy_single_linkage_reference
+
+
+def load_texts(path: Path, field: str) -> List[str]:
+    texts: List[str] = []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            texts.append(str(json.loads(line)[field]).strip())
+    return texts
+
+
+def synthetic_embeddings(n: int, dim: int, n_centers: int, noise: float, seed: int) -> np.ndarray:
+    """Noisy copies of a few random centres, so a realistic threshold yields merges."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_centers, dim)).astype(np.float32)
+    picks = rng.integers(0, n_centers, size=n)
+    emb = centers[picks] + noise * rng.standard_normal((n, dim)).astype(np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    return emb.astype(np.float32)
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Parity check: pure-Python vs NumPy greedy single-linkage")
+    p.add_argument("-i", "--in-file", type=Path, default=None, help="candidates/clusters JSONL to embed")
+    p.add_argument("--field", default="raw", help="JSON field holding the text (raw for candidates)")
+    p.add_argument("--model-name", default="all-mpnet-base-v2")
+    p.add_argument("--mock", action="store_true", help="Use MD5 mock embeddings for --in-file")
+    p.add_argument("--n", type=int, default=1500, help="Synthetic item count when no --in-file")
+    p.add_argument("--dim", type=int, default=384)
+    p.add_argument("--centers", type=int, default=300)
+    p.add_argument("--noise", type=float, default=0.45)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--threshold", type=float, nargs="+", default=[0.80, 0.83, 0.88])
+    p.add_argument("--block-size", type=int, default=256)
+    args = p.parse_args()
+
+    if args.in_file is not None:
+        texts = load_texts(args.in_file, args.field)
+        if args.mock:
+            from importlib import import_module
+            hash_to_vec = import_module("02_cluster_duplicates").hash_to_vec
+            emb = np.asarray([hash_to_vec(t) for t in texts], dtype=np.float32)
+        else:
+            from sentence_transformers import SentenceTransformer
+            st = SentenceTransformer(args.model_name)
+            emb = np.asarray(st.encode(texts, normalize_embeddings=True), dtype=np.float32)
+    else:
+        emb = synthetic_embeddings(args.n, args.dim, args.centers, args.noise, args.seed)
+
+    # The reference ran on float lists; feed it the same float32 values as float64
+    emb_list = emb.astype(np.float64).tolist()
+    print(f"Items: {emb.shape[0]}  dim: {emb.shape[1]}")
+    all_ok = True
+    for th in args.threshold:
+        t0 = time.perf_counter()
+        ref = greedy_single_linkage_reference(emb_list, th)
+        t_ref = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        vec = greedy_cluster(emb, th, block_size=args.block_size)
+        t_vec = time.perf_counter() - t0
+        same = ref == vec
+        all_ok &= same
+        print(
+            f"th={th:.3f}  clusters ref={len(ref)} numpy={len(vec)}  "
+            f"identical={same}  python={t_ref:.2f}s  numpy={t_vec:.3f}s"
+        )
+        if not same:
+            diff = sum(1 for a, b in zip(ref, vec) if a != b) + abs(len(ref) - len(vec))
+            print(f"  differing clusters: {diff} (float32 rounding at the threshold boundary?)")
+    print("PARITY OK" if all_ok else "PARITY MISMATCH")
+    if not all_ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
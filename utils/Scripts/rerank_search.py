@@ -7,7 +7,9 @@ from pathlib import Path
 from typing import List, Tuple
 
 import numpy as np
-from sentence_transformers import CrossEncoder, SentenceTransformer
+from sentence_transformers import CrossEncoder
+
+from embedding_cache import EmbeddingCache, add_cache_args, cache_from_args
 
 
 def load_index(npz_path: Path):
@@ -19,10 +21,9 @@ def load_index(npz_path: Path):
     return emb, ids, texts, model
 
 
-def retrieve_e5(query: str, emb: np.ndarray, model_name: str, topk: int) -> List[Tuple[int, float]]:
+def retrieve_e5(query: str, emb: np.ndarray, encoder: EmbeddingCache, topk: int) -> List[Tuple[int, float]]:
     # E5 asymmetric: prefix query and ensure L2 norm
-    st = SentenceTransformer(model_name)
-    q_vec = st.encode(["query: " + query], normalize_embeddings=True)[0].astype("float32")
+    q_vec = encoder.encode([query], prefix="query: ")[0]
     # emb assumed already normalized → cosine = dot
     scores = emb @ q_vec
     # argsort desc
@@ -45,6 +46,7 @@ def main() -> None:
     p.add_argument("--rerank", type=int, default=10, help="How many of retrieved to rerank")
     p.add_argument("--output", type=Path, help="Optional JSON output path for results")
     p.add_argument("--ce", default="cross-encoder/ms-marco-MiniLM-L-6-v2", help="CrossEncoder model id")
+    add_cache_args(p)
     args = p.parse_args()
 
     emb, ids, texts, model = load_index(args.emb)
@@ -52,7 +54,7 @@ def main() -> None:
         raise SystemExit(f"embeddings count ({emb.shape[0]}) != texts count ({len(texts)})")
 
     # Retrieve
-    hits = retrieve_e5(args.query, emb, model_name=model, topk=min(args.topk, emb.shape[0]))
+    hits = retrieve_e5(args.query, emb, cache_from_args(args, model), topk=min(args.topk, emb.shape[0]))
     # Truncate to rerank N
     to_rr = hits[: min(args.rerank, len(hits))]
     cand_indices = [i for (i, _cos) in to_rr]
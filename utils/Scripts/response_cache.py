@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+response_cache.py — content-addressed LLM response cache (SQLite).
+
+Keyed by sha256 of (model, temperature, max_tokens, full chat messages), so a
+change to the prompt template, model or sampling settings only misses for the
+prompts it actually changes, and identical passages share one answer. Raw
+responses (including NONE) are stored verbatim; filtering happens downstream.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import List, Optional
+
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent / ".llm_cache" / "responses.sqlite"
+
+
+def response_key(model: str, temperature: float, max_tokens: int, messages: List[dict]) -> str:
+    payload = json.dumps(
+        {"model": model, "temperature": temperature, "max_tokens": max_tokens, "messages": messages},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """get/put by response_key(); path=None disables the cache (always misses)."""
+
+    def __init__(self, path: Optional[Path]) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path))
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " response TEXT NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str, count: bool = True) -> Optional[str]:
+        """Cached response or None; count=False skips the hit/miss tally."""
+        row = None
+        if self._db is not None:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if count:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return None if row is None else str(row[0])
+
+    def put(self, key: str, model: str, response: str) -> None:
+        if self._db is None:
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO responses (key, model, response, created) VALUES (?, ?, ?, ?)",
+            (key, model, response, time.time()),
+        )
+        self._db.commit()
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> str:
+        return f"response cache: hits={self.hits} misses={self.misses}"
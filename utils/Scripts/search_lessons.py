@@ -5,7 +5,8 @@ import argparse
 from pathlib import Path
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from embedding_cache import add_cache_args, cache_from_args
 
 
 MODEL_NAME = "intfloat/e5-small-v2"
@@ -38,15 +39,15 @@ def main() -> None:
         help="Embeddings .npz path (default: utils/Scripts/Embeddings/lessons_e5_small_v2.npz)",
     )
     parser.add_argument("--topk", type=int, default=10)
+    add_cache_args(parser)
     args = parser.parse_args()
 
     index = load_index(args.emb_path)
     emb = np.asarray(index["embeddings"], dtype=np.float32)
     texts = list(index["texts"])  # object array
 
-    model = SentenceTransformer(MODEL_NAME)
-    query_vec = model.encode([f"query: {args.query}"], normalize_embeddings=True)
-    query_vec = np.asarray(query_vec, dtype=np.float32)[0]  # (384,)
+    encoder = cache_from_args(args, MODEL_NAME)
+    query_vec = encoder.encode([args.query], prefix="query: ")[0]  # (384,)
 
     scores = emb @ query_vec  # cosine because pre-normalized
     order = np.argsort(-scores)[: args.topk]
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+shard_lease.py — lease-based sharding for multi-worker candidate generation.
+
+Several 01_generate_candidates.py processes (on one machine or several sharing
+a filesystem) split the selected units into contiguous shards and claim them
+through lease files, so no unit is billed twice:
+
+  <shard_dir>/plan.json                     shard size + unit count/fingerprint
+  <shard_dir>/leases/shard-00012.lease      {"worker", "token", "expires"}
+  <shard_dir>/done/shard-00012.done         written when a shard is finished
+  <shard_dir>/shards/shard-00012.jsonl      per-shard output (+ .store.sqlite)
+
+A lease is taken with O_CREAT|O_EXCL and changed as follows:
+
+  renew     the heartbeat checks the token and os.replace()s an extended copy
+            over the lease, so the lease path never goes missing while its
+            owner is alive; a foreign token marks the lease lost
+  reclaim   a contender renames the lease to a private name (only one rename
+            can succeed) and checks that the copy it got is expired; a fresh
+            copy (renewed in the meantime) is linked back unless the owner's
+            renewal already re-created the lease
+  release   the owner takes its lease away and deletes it only if the token is its own
+
+A worker whose lease is lost stops without writing further rows (LeasedStore)
+or marking the shard done; the new owner resumes from the shard's own
+candidate store. merge_shards() then folds every shard into the canonical
+candidate store, deduplicating by unit key.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from candidate_store import CandidateStore, default_store_path, row_key
+
+
+def shard_name(index: int) -> str:
+    return f"shard-{index:05d}"
+
+
+def write_json_atomic(path: Path, obj: dict) -> None:
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_text(json.dumps(obj) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def read_lease(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def take_lease(path: Path, tag: str, attempts: int = 1) -> Optional[Path]:
+    """Rename the lease to a name private to `tag`; None if it is gone.
+
+    A contender that took the lease to inspect it puts it back within
+    milliseconds, so owners retry a few times before concluding it is gone.
+    """
+    held = path.with_name(f"{path.name}.{tag}.held")
+    for attempt in range(max(1, attempts)):
+        try:
+            os.rename(path, held)
+            return held
+        except FileNotFoundError:
+            if attempt + 1 < attempts:
+                time.sleep(0.05)
+    return None
+
+
+def put_back(held: Path, path: Path) -> bool:
+    """Publish `held` as the lease unless one was created meanwhile (then drop it)."""
+    try:
+        os.link(held, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        held.unlink()
+
+
+class ShardPlan:
+    """Contiguous shards over the selected units; identical for every worker."""
+
+    def __init__(self, shard_dir: Path, units: Sequence[dict], shard_size: int) -> None:
+        self.dir = shard_dir
+        self.units = list(units)
+        self.shard_size = max(1, shard_size)
+        for sub in ("leases", "done", "shards"):
+            (shard_dir / sub).mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        for u in self.units:
+            digest.update(f"{u['chapter']}:{u['start']}-{u['end']}\n".encode("utf-8"))
+        plan = {"units": len(self.units), "shard_size": self.shard_size, "fingerprint": digest.hexdigest()}
+        plan_path = shard_dir / "plan.json"
+        if not plan_path.exists():
+            # Publish atomically; if another worker won the race, compare against theirs
+            tmp = shard_dir / f"plan.{uuid.uuid4().hex}.tmp"
+            tmp.write_text(json.dumps(plan, indent=2) + "\n", encoding="utf-8")
+            try:
+                os.link(tmp, plan_path)
+            except FileExistsError:
+                pass
+            finally:
+                tmp.unlink()
+        existing = json.loads(plan_path.read_text(encoding="utf-8"))
+        if existing != plan:
+            raise SystemExit(
+                f"{plan_path} was made for a different unit selection or --shard-size "
+                f"({existing} vs {plan}); use the same filters or a fresh --shard-dir"
+            )
+
+    @property
+    def count(self) -> int:
+        return (len(self.units) + self.shard_size - 1) // self.shard_size
+
+    def shard_units(self, index: int) -> List[dict]:
+        return self.units[index * self.shard_size:(index + 1) * self.shard_size]
+
+    def output_path(self, index: int) -> Path:
+        return self.dir / "shards" / f"{shard_name(index)}.jsonl"
+
+    def done_path(self, index: int) -> Path:
+        return self.dir / "done" / f"{shard_name(index)}.done"
+
+    def lease_path(self, index: int) -> Path:
+        return self.dir / "leases" / f"{shard_name(index)}.lease"
+
+    def is_done(self, index: int) -> bool:
+        return self.done_path(index).exists()
+
+    def all_done(self) -> bool:
+        return all(self.is_done(i) for i in range(self.count))
+
+
+class Lease:
+    """An owned shard lease, kept alive by a heartbeat thread until released."""
+
+    def __init__(self, plan: ShardPlan, index: int, worker: str, seconds: float) -> None:
+        self.plan = plan
+        self.index = index
+        self.worker = worker
+        self.seconds = seconds
+        self.token = uuid.uuid4().hex
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def path(self) -> Path:
+        return self.plan.lease_path(self.index)
+
+    def payload(self) -> dict:
+        return {"worker": self.worker, "token": self.token, "expires": time.time() + self.seconds}
+
+    def try_create(self) -> bool:
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.payload()) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return True
+
+    def renew(self) -> bool:
+        """Extend the lease in place if it still carries our token."""
+        current = read_lease(self.path)
+        for _ in range(4):
+            if current:
+                break
+            # A contender may be inspecting it; it puts a fresh lease back within milliseconds
+            time.sleep(0.05)
+            current = read_lease(self.path)
+        if current.get("token") != self.token:
+            self.lost = True
+            return False
+        # Atomic replace: the path always holds a complete lease, so no O_EXCL
+        # create can slip in while a live lease is being extended
+        write_json_atomic(self.path, self.payload())
+        return True
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(max(0.5, self.seconds / 3.0)):
+            if not self.renew():
+                return
+
+    def start(self) -> "Lease":
+        self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self._thread.start()
+        return self
+
+    def release(self, done: bool) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if done and not self.lost:
+            write_json_atomic(self.plan.done_path(self.index), {"worker": self.worker, "finished": time.time()})
+        held = take_lease(self.path, self.token, attempts=5)
+        if held is None:
+            return
+        if read_lease(held).get("token") == self.token:
+            held.unlink()
+        else:
+            put_back(held, self.path)
+
+
+class LeasedStore(CandidateStore):
+    """A shard's candidate store that stops accepting rows once its lease is lost."""
+
+    def __init__(self, lease: Lease, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.lease = lease
+        self.dropped = 0
+
+    def add(self, row: dict) -> None:
+        if self.lease.lost:
+            self.dropped += 1
+            return
+        super().add(row)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def lease_expired(path: Path) -> bool:
+    try:
+        return float(json.loads(path.read_text(encoding="utf-8")).get("expires", 0)) < time.time()
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError):
+        # Torn/empty lease (writer died mid-create): treat as expired once it is old enough
+        try:
+            return time.time() - path.stat().st_mtime > 60.0
+        except FileNotFoundError:
+            return False
+
+
+def claim_shard(plan: ShardPlan, worker: str, seconds: float, debug=None) -> Optional[Lease]:
+    """Claim the first unfinished, unleased (or expired) shard; None if none is free right now."""
+    for index in range(plan.count):
+        if plan.is_done(index):
+            continue
+        lease = Lease(plan, index, worker, seconds)
+        if lease.try_create():
+            return lease.start()
+        if lease_expired(lease.path):
+            # Take it first, then decide on the copy we hold: the owner may have
+            # renewed between the check above and the rename
+            held = take_lease(lease.path, lease.token)
+            if held is None:
+                continue  # someone else reclaimed it first
+            if not lease_expired(held):
+                put_back(held, lease.path)
+                continue
+            held.unlink()
+            if debug is not None:
+                debug(f"reclaimed expired lease {lease.path.name}")
+            if lease.try_create():
+                return lease.start()
+    return None
+
+
+def iter_claims(
+    plan: ShardPlan, worker: str, seconds: float, poll: float, wait: bool, debug=None
+) -> Iterator[Lease]:
+    """Yield leases until every shard is done (or, without wait, until none is free)."""
+    while True:
+        lease = claim_shard(plan, worker, seconds, debug)
+        if lease is not None:
+            yield lease
+            continue
+        if plan.all_done() or not wait:
+            return
+        # Everything left is leased by live workers; wait for a finish or an expiry
+        time.sleep(max(0.1, poll))
+
+
+def merge_shards(plan_dir: Path, canonical: CandidateStore) -> Tuple[int, int, int]:
+    """Fold every shard output into the canonical store in shard order.
+
+    A shard row is skipped when the canonical store already holds a row with
+    the same prompt_key for its unit; a row with a different prompt_key is
+    superseded by the shard row. Returns (added, duplicates, superseded).
+    """
+    added = duplicates = 0
+    superseded: Dict[Tuple[int, int, int], str] = {}
+    for path in sorted((plan_dir / "shards").glob("shard-*.jsonl")):
+        shard = CandidateStore(default_store_path(path), path)
+        for line in shard.iter_lines():
+            row = json.loads(line)
+            key = row_key(row)
+            existing = canonical.get(key)
+            if existing is not None and existing.get("prompt_key") == row.get("prompt_key"):
+                duplicates += 1
+                continue
+            if existing is not None and row.get("prompt_key") is not None:
+                superseded[key] = row["prompt_key"]
+            canonical.add(row)
+            added += 1
+        shard.close()
+    dropped = canonical.drop_superseded(superseded) if superseded else 0
+    return added, duplicates, dropped
@@ -8,7 +8,8 @@ from pathlib import Path
 from typing import List, Dict, Tuple, Optional
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from embedding_cache import EmbeddingCache, add_cache_args, cache_from_args
 
 
 MODEL = "intfloat/e5-small-v2"
@@ -29,9 +30,8 @@ def load_verse_map(map_path: Path) -> Dict[str, int]:
     return json.loads(map_path.read_text(encoding="utf-8"))
 
 
-def encode_query(text: str, model: SentenceTransformer) -> np.ndarray:
-    v = model.encode([f"query: {text}"], normalize_embeddings=True)[0]
-    return np.asarray(v, dtype=np.float32)
+def encode_query(text: str, encoder: EmbeddingCache) -> np.ndarray:
+    return encoder.encode([text], prefix="query: ")[0]
 
 
 def unit_key(ch: int, v: int) -> str:
@@ -147,14 +147,15 @@ def recommend_from_bookmarks(
     topk_per_seed: int,
     overall_topk: int,
     combine: str = "max",
+    encoder: Optional[EmbeddingCache] = None,
 ) -> List[Tuple[int, float]]:
     # Build centroid (or per-seed queries) and score
     # Strategy: gather candidates from each seed's topk, then filter by similarity to any seed > max_similar
-    model = SentenceTransformer(MODEL)
+    encoder = encoder or EmbeddingCache(None, MODEL)
     all_candidates: Dict[int, float] = {}
     for seed in bookmark_lessons:
         seed_text = texts[seed]
-        q = encode_query(seed_text, model)
+        q = encode_query(seed_text, encoder)
         scores = emb @ q
         order = np.argsort(-scores)
         taken = 0
@@ -216,6 +217,7 @@ def main() -> None:
     ap.add_argument("--k", type=int, default=2, help="Number of clusters for seeds (auto-capped to number of seeds)")
     ap.add_argument("--topm-per-cluster", type=int, default=200, help="Gather top-M nearest to centroid before banding")
     ap.add_argument("--json-out", type=Path, help="Optional JSON output file")
+    add_cache_args(ap)
     args = ap.parse_args()
 
     emb, texts = load_emb_index(args.emb)
@@ -407,6 +409,7 @@ def main() -> None:
             topk_per_seed=args.topk_per_seed,
             overall_topk=args.overall_topk,
             combine=args.combine,
+            encoder=cache_from_args(args, MODEL),
         )
 
     # Optional random pick among high-sim candidates
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+span_schedule.py — span-hierarchy scheduling for 01_generate_candidates.py.
+
+00_build_units.py emits overlapping windows (1-, 4- and 8-verse by default) and
+each one costs an LLM call. The scheduler runs them tier by tier in increasing
+span length, so by the time a long window comes up every shorter window inside
+it already has an outcome, and prunes long windows by these rules:
+
+  all-none     every single verse inside the window answered NONE
+  one-cluster  every lesson from shorter windows inside it falls in one cluster
+               (cluster ids from a 02 clusters file; identical normalized text
+               when no file is given or the lesson is not in it)
+
+A pruned window is either skipped or deferred until all unpruned windows are
+done. Windows with any single verse of unknown outcome are never pruned.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+
+UnitKey = Tuple[int, int, int]
+# ("lesson", row) | ("none", None), or None when the outcome is unknown
+Outcome = Optional[Tuple[str, Optional[dict]]]
+
+PRUNE_RULES = ("all-none", "one-cluster")
+SCHEDULE_MODES = ("off", "skip", "defer")
+
+
+def parse_rules(spec: str) -> List[str]:
+    rules = [r.strip() for r in spec.split(",") if r.strip()]
+    unknown = [r for r in rules if r not in PRUNE_RULES]
+    if unknown:
+        raise SystemExit(f"Unknown prune rule(s) {unknown}; choose from {', '.join(PRUNE_RULES)}")
+    return rules
+
+
+def load_cluster_map(path: Path) -> Dict[str, int]:
+    """lesson_id → cluster_id from a 02/03 clusters JSONL."""
+    out: Dict[str, int] = {}
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            for cand in obj.get("candidates", []):
+                out[str(cand["lesson_id"])] = int(obj["cluster_id"])
+    return out
+
+
+def span_key(unit: dict) -> UnitKey:
+    return int(unit["chapter"]), int(unit["start"]), int(unit["end"])
+
+
+def span_tiers(units: Iterable[dict]) -> List[List[dict]]:
+    """Group units by span length (verses), shortest first; input order kept within a tier."""
+    tiers: Dict[int, List[dict]] = defaultdict(list)
+    for u in units:
+        _c, start, end = span_key(u)
+        tiers[end - start + 1].append(u)
+    return [tiers[length] for length in sorted(tiers)]
+
+
+class SpanScheduler:
+    """Decides, per long window, whether its shorter constituents make it redundant."""
+
+    def __init__(
+        self,
+        units: Sequence[dict],
+        rules: Sequence[str],
+        mode: str,
+        outcome: Callable[[UnitKey], Outcome],
+        cluster_map: Optional[Dict[str, int]] = None,
+        log_fp: Optional[TextIO] = None,
+    ) -> None:
+        self.rules = list(rules)
+        self.mode = mode
+        self.outcome = outcome
+        self.cluster_map = cluster_map or {}
+        self.log_fp = log_fp
+        self.deferred: List[Tuple[UnitKey, dict, str]] = []
+        self.counts: Dict[str, int] = defaultdict(int)
+        self._by_chapter: Dict[int, List[UnitKey]] = defaultdict(list)
+        for u in units:
+            key = span_key(u)
+            self._by_chapter[key[0]].append(key)
+
+    def _cluster_of(self, row: dict) -> str:
+        lesson_id = str(row.get("lesson_id", ""))
+        if lesson_id in self.cluster_map:
+            return f"cluster:{self.cluster_map[lesson_id]}"
+        return "text:" + re.sub(r"\s+", " ", str(row.get("raw", "")).strip().lower())
+
+    def verdict(self, key: UnitKey) -> Optional[str]:
+        """Name of the first rule that prunes this window, or None to generate it."""
+        chapter, start, end = key
+        inner = [k for k in self._by_chapter.get(chapter, []) if start <= k[1] and k[2] <= end and k != key]
+        singles = [k for k in inner if k[1] == k[2]]
+        if not singles:
+            return None
+        outcomes = {k: self.outcome(k) for k in inner}
+        if any(outcomes[k] is None for k in singles):
+            return None
+        lessons = [o[1] for o in outcomes.values() if o is not None and o[0] == "lesson" and o[1] is not None]
+        if "all-none" in self.rules and not lessons:
+            return "all-none"
+        if "one-cluster" in self.rules and lessons and len({self._cluster_of(r) for r in lessons}) == 1:
+            return "one-cluster"
+        return None
+
+    def filter(
+        self,
+        pending: Iterable[Tuple[UnitKey, dict, str]],
+        superseded: Dict[UnitKey, str],
+        debug: Callable[[str], None],
+    ) -> Iterator[Tuple[UnitKey, dict, str]]:
+        """Pass through pending (key, unit, prompt) items, holding back pruned windows."""
+        for item in pending:
+            key = item[0]
+            rule = self.verdict(key)
+            if rule is None:
+                yield item
+                continue
+            self.counts[rule] += 1
+            action = "defer" if self.mode == "defer" else "skip"
+            debug(f"span-prune unit={key} rule={rule} action={action}")
+            if self.log_fp is not None:
+                self.log_fp.write(json.dumps({
+                    "unit": {"chapter": key[0], "start": key[1], "end": key[2]},
+                    "rule": rule,
+                    "action": action,
+                }) + "\n")
+                self.log_fp.flush()
+            if action == "defer":
+                self.deferred.append(item)
+            else:
+                # Keep any existing (stale) row rather than dropping it unreplaced
+                superseded.pop(key, None)
+
+    def take_deferred(self) -> List[Tuple[UnitKey, dict, str]]:
+        items, self.deferred = self.deferred, []
+        return items
+
+    def summary(self) -> str:
+        parts = ", ".join(f"{rule}={self.counts[rule]}" for rule in self.rules)
+        return f"span schedule ({self.mode}): pruned {sum(self.counts.values())} [{parts}]"
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+suggest_merges.py — rank cluster pairs worth merging, for review before 04_merge_clusters.py.
+
+Input: clusters JSONL (02/03/04 output):
+  {"cluster_id": <int>, "candidates": [{"text": <str>, ...}, ...]}
+
+Every distinct member text is embedded once. Cluster centroids and medoids are
+computed as matrices, then all cross-cluster pairs are scored in one pass of
+block × block matmul tiles, keeping a running top-k
+(cluster_engine.top_cluster_pairs):
+
+  centroid     cosine of the normalized cluster means
+  max member   best cosine between any member of one and any member of the other
+  score        mean of the two
+
+The review file (Markdown) lists the top-k pairs with both clusters' medoid
+text. Pairs that share a cluster are joined into merge groups, each with a
+ready-to-run 04_merge_clusters.py command (--merge ids --dedupe). All groups
+are also written as a batch plan (<input>_merge_plan.json) for
+04_merge_clusters.py --plan: delete the groups you reject, then apply the rest
+in one pass.
+
+Example:
+  python utils/Scripts/suggest_merges.py \
+    -i utils/Scripts/outputs/clusters_B_recluster_st_th0p82.jsonl --top-k 40
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cluster_engine import DEFAULT_BLOCK_SIZE, cluster_centroids, top_cluster_pairs
+from embedding_cache import EmbeddingCache, add_cache_args
+
+
+def resolve_repo_root() -> Path:
+    # utils/Scripts/ → parents[2] should be the workspace root
+    return Path(__file__).resolve().parents[2]
+
+
+def resolve_path(repo_root: Path, path_str: str) -> Path:
+    p = Path(path_str)
+    return p if p.is_absolute() else (repo_root / p).resolve()
+
+
+def normalize_text(value: str) -> str:
+    return " ".join((value or "").strip().lower().split())
+
+
+def l2_normalize(vec: List[float]) -> List[float]:
+    s = math.sqrt(sum(v * v for v in vec))
+    return [v / s for v in vec] if s > 0 else vec
+
+
+def hash_to_vec(text: str, dim: int = 384) -> List[float]:
+    digest = hashlib.md5(text.strip().lower().encode("utf-8")).digest()
+    vec: List[float] = []
+    seed_bytes = digest
+    while len(vec) < dim:
+        seed_bytes = hashlib.md5(seed_bytes).digest()
+        for b in seed_bytes:
+            vec.append((b / 255.0) - 0.5)
+            if len(vec) == dim:
+                break
+    return l2_normalize(vec)
+
+
+def embed_texts(
+    texts: List[str], *, model_name: str, mock: bool, cache_dir: Optional[Path] = None
+) -> np.ndarray:
+    if mock:
+        return np.asarray([hash_to_vec(t) for t in texts], dtype=np.float32)
+    try:
+        import sentence_transformers  # type: ignore  # noqa: F401
+    except Exception as e:
+        raise RuntimeError(
+            "sentence-transformers not available. Install it or pass --mock"
+        ) from e
+    cache = EmbeddingCache(cache_dir, model_name)
+    emb = cache.encode(texts)
+    print(cache.stats())
+    return emb
+
+
+@dataclass
+class ClusterTexts:
+    cluster_id: int
+    size: int  # candidates, before dedupe
+    texts: List[str] = field(default_factory=list)  # distinct by normalize_text, first spelling kept
+
+
+def read_cluster_texts(path: Path) -> List[ClusterTexts]:
+    out: List[ClusterTexts] = []
+    with path.open("r", encoding="utf-8") as f:
+        for idx, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            if "cluster_id" not in obj or "candidates" not in obj:
+                raise ValueError(f"Line {idx}: missing cluster_id or candidates")
+            seen = set()
+            texts: List[str] = []
+            for cand in obj["candidates"]:
+                text = cand.get("text")
+                if isinstance(text, str) and text.strip() and normalize_text(text) not in seen:
+                    seen.add(normalize_text(text))
+                    texts.append(text.strip())
+            if texts:
+                out.append(ClusterTexts(int(obj["cluster_id"]), len(obj["candidates"]), texts))
+    return out
+
+
+def merge_groups(pairs: List[Tuple[float, int, int, float, float]]) -> List[Tuple[List[int], float]]:
+    """Union-find over suggested pairs → (sorted cluster positions, best score), best group first."""
+    parent: Dict[int, int] = {}
+
+    def find(x: int) -> int:
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for _score, a, b, _c, _m in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    groups: Dict[int, List[int]] = {}
+    best: Dict[int, float] = {}
+    for score, a, b, _c, _m in pairs:
+        root = find(a)
+        best[root] = max(best.get(root, -1.0), score)
+    for x in list(parent):
+        groups.setdefault(find(x), []).append(x)
+    return sorted(((sorted(g), best[r]) for r, g in groups.items()), key=lambda t: (-t[1], t[0]))
+
+
+def md_cell(text: str) -> str:
+    return text.replace("|", "\\|").replace("\n", " ")
+
+
+def merge_command(in_file: str, out_file: str, ids: List[int]) -> str:
+    return (
+        f"python utils/Scripts/04_merge_clusters.py -i {in_file} -o {out_file} "
+        f"--merge {','.join(str(i) for i in ids)} --dedupe"
+    )
+
+
+def write_review(
+    path: Path,
+    in_label: str,
+    out_label: str,
+    plan_label: str,
+    clusters: List[ClusterTexts],
+    medoids: List[str],
+    pairs: List[Tuple[float, int, int, float, float]],
+    model: str,
+) -> None:
+    lines = [
+        f"# Merge suggestions — {in_label}",
+        "",
+        f"{len(clusters)} clusters, {sum(len(c.texts) for c in clusters)} distinct texts, model `{model}`. "
+        f"Score = (centroid + max member) / 2.",
+        "",
+        "## Ranked pairs",
+        "",
+        "| # | clusters | score | centroid | max member | medoid A | medoid B |",
+        "|---:|---|---:|---:|---:|---|---|",
+    ]
+    for rank, (score, a, b, cent, member) in enumerate(pairs, start=1):
+        ca, cb = clusters[a], clusters[b]
+        lines.append(
+            f"| {rank} | {ca.cluster_id},{cb.cluster_id} | {score:.3f} | {cent:.3f} | {member:.3f} "
+            f"| {md_cell(medoids[a])} ({ca.size}) | {md_cell(medoids[b])} ({cb.size}) |"
+        )
+
+    groups = merge_groups(pairs)
+    lines += ["", "## Merge plans", ""]
+    for n, (members, best) in enumerate(groups, start=1):
+        ids = sorted(clusters[i].cluster_id for i in members)
+        lines.append(f"### {n}. clusters {', '.join(str(i) for i in ids)} (best pair {best:.3f})")
+        lines.append("")
+        for i in sorted(members, key=lambda i: clusters[i].cluster_id):
+            lines.append(f"- {clusters[i].cluster_id} ({clusters[i].size}): {medoids[i]}")
+        lines += ["", "```", merge_command(in_label, out_label, ids), "```", ""]
+    if groups:
+        lines += [
+            "## Apply all",
+            "",
+            f"Plan group N above is group N in `{plan_label}`; remove the ones you reject first.",
+            "",
+            "```",
+            f"python utils/Scripts/04_merge_clusters.py -i {in_label} -o {out_label} --plan {plan_label} --reindex",
+            "```",
+            "",
+        ]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def write_plan(path: Path, clusters: List[ClusterTexts], pairs: List[Tuple[float, int, int, float, float]]) -> int:
+    """04_merge_clusters.py --plan file, groups in the review's order."""
+    groups = [
+        {"merge": sorted(clusters[i].cluster_id for i in members), "best_score": round(best, 4)}
+        for members, best in merge_groups(pairs)
+    ]
+    path.write_text(json.dumps({"dedupe": True, "groups": groups}, indent=1) + "\n", encoding="utf-8")
+    return len(groups)
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = resolve_repo_root()
+    default_in = repo_root / "utils/Scripts/outputs/clusters_B_recluster_st_th0p82.jsonl"
+
+    p = argparse.ArgumentParser(description="Rank cluster pairs to merge and write a review file")
+    p.add_argument("-i", "--in-file", default=str(default_in))
+    p.add_argument("-o", "--out-file", default=None, help="Review Markdown (default: <input>_merge_suggestions.md)")
+    p.add_argument(
+        "--merged-file",
+        default=None,
+        help="Output path used in the 04 commands (default: <input>_merged.jsonl)",
+    )
+    p.add_argument("--plan-out", default=None, help="Batch merge plan for 04 --plan (default: <input>_merge_plan.json)")
+    p.add_argument("--model-name", default="all-mpnet-base-v2")
+    p.add_argument("--mock", action="store_true", help="Use deterministic mock embeddings")
+    p.add_argument("--top-k", type=int, default=50, help="Pairs to list")
+    p.add_argument("--min-score", type=float, default=0.0, help="Drop pairs scoring below this")
+    p.add_argument(
+        "--block-size",
+        type=int,
+        default=DEFAULT_BLOCK_SIZE,
+        help="Member rows per tile side (peak memory ~block_size² floats, independent of N)",
+    )
+    add_cache_args(p)
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    repo_root = resolve_repo_root()
+    in_path = resolve_path(repo_root, args.in_file)
+    out_path = (
+        resolve_path(repo_root, args.out_file)
+        if args.out_file
+        else in_path.with_name(in_path.stem + "_merge_suggestions.md")
+    )
+    merged_path = (
+        resolve_path(repo_root, args.merged_file)
+        if args.merged_file
+        else in_path.with_name(in_path.stem + "_merged.jsonl")
+    )
+    plan_path = (
+        resolve_path(repo_root, args.plan_out)
+        if args.plan_out
+        else in_path.with_name(in_path.stem + "_merge_plan.json")
+    )
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    clusters = read_cluster_texts(in_path)
+    if len(clusters) < 2:
+        print("Fewer than two clusters; nothing to suggest.")
+        return
+    texts = [t for c in clusters for t in c.texts]
+    starts = np.concatenate([[0], np.cumsum([len(c.texts) for c in clusters])]).astype(np.int64)
+    emb = embed_texts(
+        texts,
+        model_name=args.model_name,
+        mock=args.mock,
+        cache_dir=None if args.no_embed_cache else args.embed_cache,
+    )
+    centroids, medoid_rows = cluster_centroids(emb, starts)
+    pairs = top_cluster_pairs(emb, starts, centroids, args.top_k, args.min_score, args.block_size)
+
+    def label(p: Path) -> str:
+        try:
+            return str(p.relative_to(repo_root))
+        except ValueError:
+            return str(p)
+
+    write_review(
+        out_path,
+        label(in_path),
+        label(merged_path),
+        label(plan_path),
+        clusters,
+        [texts[i] for i in medoid_rows.tolist()],
+        pairs,
+        "mock" if args.mock else args.model_name,
+    )
+    print(f"✅ Wrote {len(pairs)} merge suggestions to {out_path}")
+    print(f"✅ Wrote {write_plan(plan_path, clusters, pairs)} merge groups to {plan_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+text_prefilter.py — collapse exact and near-duplicate texts before embedding.
+
+Candidate lessons repeat a lot: the same sentence from overlapping windows, or
+the same sentence with a changed article or plural. Embedding and clustering
+every copy costs O(N²) comparisons for nothing. The prefilter reduces the
+texts to one survivor per group:
+
+  exact  identical after normalize() (trim, lowercase, collapse whitespace)
+  near   64-bit SimHash over word unigrams+bigrams within --near-dup-distance
+         bits of a survivor, confirmed by word-set Jaccard ≥ --near-dup-jaccard
+
+Near-duplicate candidates come from banded lookup: with d allowed differing
+bits, the hash is cut into d+1 bands and two hashes within distance d share at
+least one band exactly. Each text is compared only against group survivors,
+never against other members, so groups do not chain.
+
+Word overlap cannot tell "Never abandon your duty…" from "Always abandon your
+duty…", so near-duplicate folding is off unless a distance is given
+(DEFAULT_NEAR_DUP_DISTANCE = 10 bits with Jaccard 0.7 folds one-word swaps
+such as "…attachment to results/outcomes."). Folds are provisional: once the
+survivors are embedded, split_near() moves every near-folded text whose
+cosine to its survivor is below the clustering threshold back into a group
+of its own, so the prefilter never merges what clustering would keep apart.
+
+The survivors are clustered; expand_clusters() maps every cluster back to all
+members, in input order.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Set, Tuple
+
+import numpy as np
+
+
+DEFAULT_NEAR_DUP_DISTANCE = 10
+DEFAULT_NEAR_DUP_JACCARD = 0.7
+
+
+def normalize(s: str) -> str:
+    s = s.strip().lower()
+    s = re.sub(r"\s+", " ", s)
+    return s
+
+
+def words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9']+", normalize(text))
+
+
+def simhash64(text: str) -> int:
+    tokens = words(text)
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    if not features:
+        return 0
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "big") for f in features],
+        dtype=">u8",
+    )
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)  # (F, 64), most significant first
+    votes = (2 * bits.astype(np.int32) - 1).sum(axis=0)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+@dataclass
+class DupGroup:
+    """One survivor (the group's first text in input order) and every index it stands for."""
+
+    survivor: int
+    members: List[int] = field(default_factory=list)
+    near: int = 0  # members folded in as near (not exact) duplicates
+    heads: List[int] = field(default_factory=list)  # per member: first index with its normalized text
+
+    @property
+    def weight(self) -> int:
+        return len(self.members)
+
+    def add(self, i: int, head: int) -> None:
+        self.members.append(i)
+        self.heads.append(head)
+
+    def near_heads(self) -> List[int]:
+        """First index of each text folded in as a near duplicate, in input order."""
+        return sorted(set(self.heads) - {self.survivor})
+
+
+def prefilter(
+    texts: Sequence[str],
+    near_distance: int = -1,
+    near_jaccard: float = DEFAULT_NEAR_DUP_JACCARD,
+) -> List[DupGroup]:
+    """Groups in order of their survivor; near_distance < 0 (the default) folds exact duplicates only."""
+    groups: List[DupGroup] = []
+    by_norm: Dict[str, int] = {}
+    head_of: Dict[str, int] = {}
+    bands = near_distance + 1
+    width = 64 // bands if near_distance >= 0 else 64
+    buckets: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+    sigs: List[Tuple[int, Set[str]]] = []
+
+    for i, text in enumerate(texts):
+        norm = normalize(text)
+        g = by_norm.get(norm)
+        if g is not None:
+            groups[g].add(i, head_of[norm])
+            continue
+        head_of[norm] = i
+        if near_distance >= 0:
+            h = simhash64(text)
+            ws = set(words(text))
+            keys = [(b, (h >> (b * width)) & ((1 << width) - 1)) for b in range(bands)]
+            match = None
+            for cand in sorted({g for k in keys for g in buckets.get(k, ())}):
+                ch, cws = sigs[cand]
+                if bin(h ^ ch).count("1") <= near_distance and jaccard(ws, cws) >= near_jaccard:
+                    match = cand
+                    break
+            if match is not None:
+                by_norm[norm] = match
+                groups[match].add(i, i)
+                groups[match].near += 1
+                continue
+            for k in keys:
+                buckets[k].append(len(groups))
+            sigs.append((h, ws))
+        else:
+            sigs.append((0, set()))
+        by_norm[norm] = len(groups)
+        groups.append(DupGroup(survivor=i, members=[i], heads=[i]))
+    return groups
+
+
+def split_near(groups: Sequence[DupGroup], rejected: Set[int]) -> List[DupGroup]:
+    """Move each rejected near head (and its exact copies) out into its own group;
+    groups stay in order of their survivor."""
+    out: List[DupGroup] = []
+    for g in groups:
+        kept = DupGroup(survivor=g.survivor)
+        split: Dict[int, DupGroup] = {}
+        for i, head in zip(g.members, g.heads):
+            if head in rejected:
+                split.setdefault(head, DupGroup(survivor=head)).add(i, head)
+            else:
+                kept.add(i, head)
+        kept.near = len(kept.near_heads())
+        out.append(kept)
+        out.extend(split.values())
+    return sorted(out, key=lambda g: g.survivor)
+
+
+def expand_clusters(clusters: Sequence[Sequence[int]], groups: Sequence[DupGroup]) -> List[List[int]]:
+    """Clusters over survivor positions (indices into groups) → clusters over all input indices."""
+    return [sorted(i for g in cluster for i in groups[g].members) for cluster in clusters]
+
+
+def summary(n: int, groups: Sequence[DupGroup]) -> str:
+    near = sum(g.near for g in groups)
+    exact = n - len(groups) - near
+    heaviest = max(groups, key=lambda g: g.weight, default=None)
+    most = f", most copies {heaviest.weight} (input #{heaviest.survivor})" if heaviest is not None else ""
+    return f"prefilter: {n} → {len(groups)} texts (exact duplicates {exact}, near duplicates {near}{most})"
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+token_budget.py — E5 token counts per verse and token-budgeted span windows.
+
+convert_e5_coreml.py bakes a fixed --seq-len (128) into the on-device model,
+so a window longer than that is silently truncated when embedded, and a fixed
+verse count (--span-lengths 1,4,8) says nothing about length. Here each verse
+is tokenized once with the E5 tokenizer (counts cached on disk by text hash)
+and windows are grown verse by verse up to a token budget.
+
+A window's count is what the encoder sees for "passage: <text>":
+  [CLS] + prefix tokens + sum(verse tokens) + [SEP]
+WordPiece splits on whitespace, so the "\\n"-joined text costs exactly the sum
+of its verses.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from embedding_cache import model_slug
+
+
+DEFAULT_TOKENIZER = "intfloat/e5-small-v2"
+PASSAGE_PREFIX = "passage: "
+DEFAULT_TOKEN_CACHE_DIR = Path(__file__).resolve().parent / ".token_cache"
+
+
+@lru_cache(maxsize=None)
+def load_tokenizer(model_name: str):
+    try:
+        from transformers import AutoTokenizer  # type: ignore
+    except Exception as e:  # pragma: no cover - import guard
+        raise RuntimeError(
+            "Token budgets need transformers (pip install -r utils/requirements.txt)"
+        ) from e
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:20]
+
+
+class TokenCounter:
+    """Token counts by text hash, persisted per tokenizer; only unseen texts are tokenized."""
+
+    def __init__(self, model_name: str = DEFAULT_TOKENIZER, cache_dir: Path = DEFAULT_TOKEN_CACHE_DIR) -> None:
+        self.model_name = model_name
+        self.path = cache_dir / f"{model_slug(model_name)}.json"
+        self.counts: Dict[str, int] = {}
+        if self.path.exists():
+            self.counts = json.loads(self.path.read_text(encoding="utf-8"))
+        self._dirty = False
+        self.tokenized = 0
+
+    def count(self, texts: Sequence[str]) -> List[int]:
+        """Tokens per text, without special tokens."""
+        keys = [text_digest(t) for t in texts]
+        todo = {k: t for k, t in zip(keys, texts) if k not in self.counts}
+        if todo:
+            tokenizer = load_tokenizer(self.model_name)
+            encoded = tokenizer(list(todo.values()), add_special_tokens=False)["input_ids"]
+            for k, ids in zip(todo, encoded):
+                self.counts[k] = len(ids)
+            self.tokenized += len(todo)
+            self._dirty = True
+        return [self.counts[k] for k in keys]
+
+    def passage_overhead(self) -> int:
+        """[CLS] + "passage: " + [SEP]."""
+        return self.count([PASSAGE_PREFIX.strip()])[0] + 2
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(self.counts), encoding="utf-8")
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+
+def parse_budget(spec: str) -> Tuple[int, int]:
+    """"MIN:MAX" (or just "MAX") → (min_tokens, max_tokens)."""
+    try:
+        lo, _, hi = spec.rpartition(":")
+        budget = (int(lo) if lo else 0, int(hi))
+    except ValueError:
+        raise SystemExit(f"--token-budget expects MIN:MAX tokens (e.g. 32:128), got {spec!r}")
+    if budget[1] <= 0 or budget[0] > budget[1]:
+        raise SystemExit(f"--token-budget needs 0 <= MIN <= MAX and MAX > 0, got {spec!r}")
+    return budget
+
+
+def budget_windows(
+    counts: Sequence[int], overhead: int, min_tokens: int, max_tokens: int
+) -> Iterator[Tuple[int, int, int]]:
+    """(start_idx, end_idx, tokens) of the longest window from each start within max_tokens.
+
+    A window ending where the previous one ended is contained in it and is
+    skipped. A single verse over the budget is still yielded on its own (the
+    caller flags it). Windows under min_tokens are skipped unless one of their
+    verses appears in no other window (the caller flags those too), so every
+    verse is covered.
+    """
+    windows: List[Tuple[int, int, int]] = []
+    prev_end = -1
+    end = 0
+    total = 0  # tokens of verses [start, end)
+    for start in range(len(counts)):
+        if end < start:
+            end, total = start, 0
+        while end < len(counts) and overhead + total + counts[end] <= max_tokens:
+            total += counts[end]
+            end += 1
+        if end == start:
+            # This verse alone is over budget
+            if start > prev_end:
+                prev_end = start
+                windows.append((start, start, overhead + counts[start]))
+            continue
+        if end - 1 > prev_end:
+            prev_end = end - 1
+            windows.append((start, end - 1, overhead + total))
+        total -= counts[start]
+
+    covered = [False] * len(counts)
+    keep = [w[2] >= min_tokens or w[0] == w[1] for w in windows]
+    for (lo, hi, _tokens), kept in zip(windows, keep):
+        if kept:
+            covered[lo:hi + 1] = [True] * (hi + 1 - lo)
+    for n, (lo, hi, _tokens) in enumerate(windows):
+        if not keep[n] and not all(covered[lo:hi + 1]):
+            keep[n] = True
+            covered[lo:hi + 1] = [True] * (hi + 1 - lo)
+    for window, kept in zip(windows, keep):
+        if kept:
+            yield window
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+unit_manifest.py — per-verse fingerprints and unit change manifests.
+
+00_build_units.py --incremental keeps a fingerprint file next to its output
+(<output>.fingerprints.json: span lengths + sha256 of every verse). On the next
+build it fingerprints the new verse file, derives every window's fingerprint
+from the verses inside it, and diffs old against new:
+
+  added     windows that did not exist before (new verse, new span length)
+  changed   same (chapter, start, end) key, but some verse inside it changed
+  removed   windows that no longer exist
+
+The manifest (<output>.manifest.json) lists only those unit keys.
+01_generate_candidates.py --manifest regenerates exactly the added and changed
+windows and deletes the candidates of removed ones.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+UnitKey = Tuple[int, int, int]
+# chapter → [(verse_number, verse digest)] in verse order
+VerseFingerprints = Dict[int, List[Tuple[int, str]]]
+
+
+def default_fingerprint_path(output: Path) -> Path:
+    return output.with_name(output.name + ".fingerprints.json")
+
+
+def default_manifest_path(output: Path) -> Path:
+    return output.with_name(output.name + ".manifest.json")
+
+
+def verse_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def verse_fingerprints(chapters: Dict[int, List[Tuple[int, str]]]) -> VerseFingerprints:
+    return {ch: [(v, verse_digest(t)) for v, t in verses] for ch, verses in chapters.items()}
+
+
+def window_fingerprints(verses: VerseFingerprints, span_lengths: Iterable[int]) -> Dict[UnitKey, str]:
+    """Fingerprint of every window, built from the digests of the verses inside it."""
+    out: Dict[UnitKey, str] = {}
+    lengths = sorted({l for l in span_lengths if l > 0})
+    for chapter, vs in verses.items():
+        for span_len in lengths:
+            for i in range(0, max(0, len(vs) - span_len + 1)):
+                window = vs[i:i + span_len]
+                out[(chapter, window[0][0], window[-1][0])] = "|".join(f"{v}:{d}" for v, d in window)
+    return out
+
+
+def diff_windows(
+    old: Dict[UnitKey, str], new: Dict[UnitKey, str]
+) -> Tuple[List[UnitKey], List[UnitKey], List[UnitKey]]:
+    """(added, changed, removed) unit keys, each sorted."""
+    added = sorted(k for k in new if k not in old)
+    changed = sorted(k for k in new if k in old and old[k] != new[k])
+    removed = sorted(k for k in old if k not in new)
+    return added, changed, removed
+
+
+def write_json_atomic(path: Path, obj: dict) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(obj, indent=1) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def load_fingerprints(path: Path) -> Optional[Tuple[List[int], VerseFingerprints]]:
+    """(span_lengths, verse fingerprints) from a previous build, or None."""
+    if not path.exists():
+        return None
+    data = json.loads(path.read_text(encoding="utf-8"))
+    verses = {int(ch): [(int(v), str(d)) for v, d in vs] for ch, vs in data["verses"].items()}
+    return [int(l) for l in data["span_lengths"]], verses
+
+
+def write_fingerprints(path: Path, span_lengths: Iterable[int], verses: VerseFingerprints) -> None:
+    write_json_atomic(path, {
+        "version": 1,
+        "span_lengths": sorted({l for l in span_lengths if l > 0}),
+        "verses": {str(ch): vs for ch, vs in sorted(verses.items())},
+    })
+
+
+def write_manifest(
+    path: Path,
+    units_file: Path,
+    added: List[UnitKey],
+    changed: List[UnitKey],
+    removed: List[UnitKey],
+) -> None:
+    write_json_atomic(path, {
+        "version": 1,
+        "created": time.time(),
+        "units_file": str(units_file),
+        "added": [list(k) for k in added],
+        "changed": [list(k) for k in changed],
+        "removed": [list(k) for k in removed],
+    })
+
+
+def load_manifest(path: Path) -> Dict[str, Set[UnitKey]]:
+    """{"added", "changed", "removed"} → sets of unit keys."""
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return {
+        name: {(int(c), int(s), int(e)) for c, s, e in data.get(name, [])}
+        for name in ("added", "changed", "removed")
+    }
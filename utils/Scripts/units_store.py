@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+units_store.py — compact binary units file with a shared UTF-8 text arena.
+
+units.jsonl repeats every verse in each window that covers it (a verse appears
+in up to sum(K) windows). This format stores each verse's text once and each
+unit as three int32s:
+
+  magic "GITAUNT1" | u64 header length | JSON header | 8-byte aligned arrays
+    verse_number  int32 [V]     verse number of each stored verse
+    verse_start   int64 [V]     byte offset of the verse text in the arena
+    verse_end     int64 [V]     ...and its end (exclusive)
+    units         int32 [N, 3]  (chapter, start_idx, end_idx) global verse indices, inclusive
+    arena         uint8         each chapter's verses joined by "\\n"
+
+Because a chapter's verses sit back to back with "\\n" between them, the text of
+a window is the single contiguous slice arena[verse_start[s]:verse_end[e]] —
+exactly the "\\n"-joined text units.jsonl would hold. The file is mmap'd;
+text_view() returns a zero-copy memoryview and the text is decoded only when a
+unit's "text" is read.
+
+  python utils/Scripts/00_build_units.py --format arena -o units_1_4_8.units.bin
+  python utils/Scripts/units_store.py stats units_1_4_8.units.bin
+  python utils/Scripts/units_store.py export units_1_4_8.units.bin -o units.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+MAGIC = b"GITAUNT1"
+ALIGN = 8
+
+
+def is_units_store(path: Path) -> bool:
+    try:
+        with path.open("rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def write_units_store(
+    path: Path,
+    chapters: Dict[int, List[Tuple[int, str]]],
+    span_lengths: Iterable[int],
+) -> int:
+    """Write the arena format for the same units (and order) as 00_build_units.iter_units."""
+    lengths = sorted({l for l in span_lengths if l > 0})
+    arena = bytearray()
+    verse_number: List[int] = []
+    verse_start: List[int] = []
+    verse_end: List[int] = []
+    unit_rows: List[Tuple[int, int, int]] = []
+    for chapter, verses in sorted(chapters.items(), key=lambda kv: kv[0]):
+        first = len(verse_number)
+        for i, (v_num, v_text) in enumerate(verses):
+            if i:
+                arena += b"\n"
+            verse_number.append(v_num)
+            verse_start.append(len(arena))
+            arena += v_text.encode("utf-8")
+            verse_end.append(len(arena))
+        if verses:
+            arena += b"\n"  # chapters are never joined; keeps the next chapter's offsets independent
+        for span_len in lengths:
+            for start_idx in range(0, max(0, len(verses) - span_len + 1)):
+                unit_rows.append((chapter, first + start_idx, first + start_idx + span_len - 1))
+
+    arrays = {
+        "verse_number": np.asarray(verse_number, dtype="<i4"),
+        "verse_start": np.asarray(verse_start, dtype="<i8"),
+        "verse_end": np.asarray(verse_end, dtype="<i8"),
+        "units": np.asarray(unit_rows, dtype="<i4").reshape(-1, 3),
+        "arena": np.frombuffer(bytes(arena), dtype=np.uint8),
+    }
+    # Offsets are relative to the start of the data section, which is itself aligned
+    layout: Dict[str, list] = {}
+    offset = 0
+    for name, arr in arrays.items():
+        offset = (offset + ALIGN - 1) // ALIGN * ALIGN
+        layout[name] = [arr.dtype.str, list(arr.shape), offset]
+        offset += arr.nbytes
+    header = json.dumps({"version": 1, "verses": len(verse_number), "units": len(unit_rows), "arrays": layout})
+    head = MAGIC + struct.pack("<Q", len(header)) + header.encode("utf-8")
+    head += b"\0" * ((-len(head)) % ALIGN)
+
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(head)
+        for name, arr in arrays.items():
+            f.write(b"\0" * (len(head) + layout[name][2] - f.tell()))
+            f.write(arr.tobytes())
+    tmp.replace(path)
+    return len(unit_rows)
+
+
+class ArenaUnit(dict):
+    """A unit dict whose "text" is decoded from the arena on first access.
+
+    Every read path (item access, get, in, len, iteration, keys/items/values,
+    copy, comparison, json.dumps) sees "text", so it is a drop-in for the dict
+    units of units.jsonl.
+    """
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store: "UnitsStore", index: int, chapter: int, start: int, end: int) -> None:
+        super().__init__(chapter=chapter, start=start, end=end)
+        self._store = store
+        self._index = index
+
+    def _load(self) -> None:
+        if not dict.__contains__(self, "text"):
+            dict.__setitem__(self, "text", self._store.text(self._index))
+
+    def __missing__(self, key: str) -> str:
+        if key != "text":
+            raise KeyError(key)
+        self._load()
+        return dict.__getitem__(self, "text")
+
+    def get(self, key, default=None):
+        if key == "text":
+            self._load()
+        return dict.get(self, key, default)
+
+    def __contains__(self, key: object) -> bool:
+        return key == "text" or dict.__contains__(self, key)
+
+    def __len__(self) -> int:
+        return dict.__len__(self) + (0 if dict.__contains__(self, "text") else 1)
+
+    def __iter__(self):
+        self._load()
+        return dict.__iter__(self)
+
+    def keys(self):
+        self._load()
+        return dict.keys(self)
+
+    def items(self):
+        self._load()
+        return dict.items(self)
+
+    def values(self):
+        self._load()
+        return dict.values(self)
+
+    def copy(self) -> dict:
+        self._load()
+        return dict(dict.items(self))
+
+    def __eq__(self, other: object) -> bool:
+        self._load()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other: object) -> bool:
+        return not self == other
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        self._load()
+        return dict.__repr__(self)
+
+
+class UnitsStore:
+    """Read-only, mmap-backed view of a units arena file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._f = path.open("rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a units arena file")
+        (hlen,) = struct.unpack_from("<Q", self._mm, len(MAGIC))
+        start = len(MAGIC) + 8
+        self.header = json.loads(bytes(self._mm[start:start + hlen]).decode("utf-8"))
+        data = start + hlen
+        data += (-data) % ALIGN
+        arrays = {}
+        for name, (dtype, shape, offset) in self.header["arrays"].items():
+            count = int(np.prod(shape)) if shape else 1
+            arrays[name] = np.frombuffer(self._mm, dtype=np.dtype(dtype), count=count, offset=data + offset).reshape(shape)
+        self.verse_number = arrays["verse_number"]
+        self.verse_start = arrays["verse_start"]
+        self.verse_end = arrays["verse_end"]
+        self.units = arrays["units"]
+        self._arena_offset = data + self.header["arrays"]["arena"][2]
+        self._view = memoryview(self._mm)
+
+    def __len__(self) -> int:
+        return int(self.units.shape[0])
+
+    def key(self, i: int) -> Tuple[int, int, int]:
+        chapter, s, e = self.units[i]
+        return int(chapter), int(self.verse_number[s]), int(self.verse_number[e])
+
+    def text_view(self, i: int) -> memoryview:
+        """Zero-copy UTF-8 bytes of unit i's text."""
+        _chapter, s, e = self.units[i]
+        base = self._arena_offset
+        return self._view[base + int(self.verse_start[s]):base + int(self.verse_end[e])]
+
+    def text(self, i: int) -> str:
+        return str(self.text_view(i), "utf-8")
+
+    def iter_units(self, limit: Optional[int] = None) -> Iterator[ArenaUnit]:
+        n = len(self) if limit is None else min(limit, len(self))
+        # One bulk conversion instead of per-unit numpy scalar access
+        rows = self.units[:n].tolist()
+        numbers = self.verse_number.tolist()
+        for i, (chapter, s, e) in enumerate(rows):
+            yield ArenaUnit(self, i, chapter, numbers[s], numbers[e])
+
+    def close(self) -> None:
+        # Drop every numpy/memoryview reference into the map before closing it
+        self.verse_number = self.verse_start = self.verse_end = self.units = None  # type: ignore[assignment]
+        self._view.release()
+        self._mm.close()
+        self._f.close()
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Inspect or export a units arena file")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    e = sub.add_parser("export", help="Write the units as units.jsonl")
+    e.add_argument("units", type=Path)
+    e.add_argument("-o", "--out-file", type=Path, required=True)
+    s = sub.add_parser("stats", help="Counts and sizes")
+    s.add_argument("units", type=Path)
+    args = p.parse_args()
+
+    store = UnitsStore(args.units)
+    if args.cmd == "export":
+        with args.out_file.open("w", encoding="utf-8", buffering=1 << 20) as f:
+            for u in store.iter_units():
+                f.write(json.dumps({**u, "text": u["text"]}, ensure_ascii=False) + "\n")
+        print(f"✅ Wrote {len(store)} units to {args.out_file}")
+    else:
+        arena = store.header["arrays"]["arena"][1][0]
+        print(
+            f"units={len(store)} verses={store.header['verses']} arena_bytes={arena} "
+            f"file_bytes={args.units.stat().st_size}"
+        )
+    store.close()
+
+
+if __name__ == "__main__":
+    main()